@@ -1,4 +1,6 @@
 -- init/init.sql
+-- Runs on an empty data directory only: schema changes also get an idempotent
+-- postgres/migrations/*.sql for existing databases (scripts/migrate_postgres.sh)
 -- Create a schema if it does not exist
 CREATE SCHEMA IF NOT EXISTS prod_storage;
 
@@ -142,6 +144,8 @@ CREATE TABLE
     base_model_name VARCHAR(200) NOT NULL,
     model_name VARCHAR(200) NOT NULL,
     version INT NOT NULL CHECK (version >= 0),
+    prompt_price NUMERIC(12, 6),  -- Per 1M tokens
+    completion_price NUMERIC(12, 6),  -- Per 1M tokens
     created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     deleted_flg BOOLEAN NOT NULL DEFAULT false,
@@ -154,6 +158,41 @@ AFTER UPDATE ON prod_storage.models
 FOR EACH ROW
 EXECUTE FUNCTION set_updated_at();
 
+-- Versioned prompt templates, the active one is the latest non-deleted version.
+-- hash (sha256 of the texts) keeps the built-in templates from being registered twice
+CREATE TABLE
+  IF NOT EXISTS prod_storage.prompt_templates (
+    version SERIAL PRIMARY KEY,
+    hash CHAR(64) NOT NULL,
+    system_prompt TEXT NOT NULL,
+    multichoice TEXT NOT NULL,
+    coderunner TEXT NOT NULL,
+    other TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    deleted_flg BOOLEAN NOT NULL DEFAULT false,
+
+    CONSTRAINT prompt_templates_source_key_unique UNIQUE (hash)
+  );
+
+-- Append-only table of prompts rendered once per (question content, template version).
+-- question_hash is sha256 of the question fields used by templates, an edited question gets a new prompt
+CREATE TABLE
+  IF NOT EXISTS prod_storage.prompts (
+    id SERIAL PRIMARY KEY,
+    question_hash CHAR(64) NOT NULL,
+    template_version INT NOT NULL,
+    messages JSONB NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    FOREIGN KEY (template_version) REFERENCES prod_storage.prompt_templates (version) ON DELETE CASCADE,
+
+    CONSTRAINT prompts_source_key_unique UNIQUE (question_hash, template_version)
+  );
+
+-- Prompt of the question with the active template, stored at ingest so exports are a join
+ALTER TABLE prod_storage.questions
+  ADD COLUMN IF NOT EXISTS prompt_id INT REFERENCES prod_storage.prompts (id) ON DELETE SET NULL;
+
 -- Append-only table storing model inference
 CREATE TABLE
   IF NOT EXISTS prod_storage.questions_transformed (
@@ -163,14 +202,39 @@ CREATE TABLE
     thinking TEXT,
     text TEXT NOT NULL,
     temperature FLOAT CHECK(temperature > 0.0 and temperature <= 1.0),
+    prompt_tokens INT,
+    completion_tokens INT,  -- Includes reasoning_tokens
+    reasoning_tokens INT,
+    ttft_ms INT,  -- Time to first token, streamed generations only
+    latency_ms INT,
+    cached BOOLEAN NOT NULL DEFAULT false,  -- Served from completion_cache: nothing was spent
+    prompt_id INT,
+    prompt_template_version INT,
+    batch_request_id TEXT,  -- Request ID in the imported batch output, NULL for live inferences
     created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     deleted_flg BOOLEAN NOT NULL DEFAULT false,
 
     FOREIGN KEY (question_id) REFERENCES prod_storage.questions (id) ON DELETE CASCADE,
-    FOREIGN KEY (model_id) REFERENCES prod_storage.models (id) ON DELETE CASCADE
+    FOREIGN KEY (model_id) REFERENCES prod_storage.models (id) ON DELETE CASCADE,
+    FOREIGN KEY (prompt_id) REFERENCES prod_storage.prompts (id) ON DELETE SET NULL
   );
 
 
+-- Inferences per (question, model, temperature) cell, used by sweep planning
+CREATE INDEX IF NOT EXISTS questions_transformed_cell_idx
+ON prod_storage.questions_transformed (model_id, question_id, temperature)
+WHERE deleted_flg = false;
+
+-- Inferences generated before prompts were stored, backfilled on the first export
+CREATE INDEX IF NOT EXISTS questions_transformed_missing_prompt_idx
+ON prod_storage.questions_transformed (question_id)
+WHERE prompt_id IS NULL AND batch_request_id IS NULL AND deleted_flg = false;
+
+-- A batch output imported again does not duplicate its inferences
+CREATE UNIQUE INDEX IF NOT EXISTS questions_transformed_batch_request_id_idx
+ON prod_storage.questions_transformed (batch_request_id)
+WHERE batch_request_id IS NOT NULL;
+
 -- Append-only table storing inference user scores
 CREATE TABLE
   IF NOT EXISTS prod_storage.inference_scores (
@@ -187,3 +251,129 @@ CREATE TABLE
     FOREIGN KEY (inference_id) REFERENCES prod_storage.questions_transformed (id) ON DELETE CASCADE,
     FOREIGN KEY (user_group_cd) REFERENCES prod_storage.dict_user_groups (user_group_cd) ON DELETE SET NULL
   );
+
+-- Incremental report exports select scores by creation time window
+CREATE INDEX IF NOT EXISTS inference_scores_created_at_idx
+ON prod_storage.inference_scores (created_at);
+
+
+-- Durable queue of inferences to generate in background.
+-- Workers claim jobs with FOR UPDATE SKIP LOCKED, a running job whose lease
+-- (locked_until) expired is claimed again (worker died or was redeployed)
+CREATE TABLE
+  IF NOT EXISTS prod_storage.inference_jobs (
+    id SERIAL PRIMARY KEY,
+    question_id INT NOT NULL,
+    model_id INT NOT NULL,
+    temperature FLOAT NOT NULL CHECK(temperature > 0.0 and temperature <= 1.0),
+    openai_url TEXT,
+    bypass_cache BOOLEAN NOT NULL DEFAULT false,  -- Samples of a cell must be fresh completions
+    status VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'done', 'failed')),
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL CHECK (max_attempts > 0),
+    run_after TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_until TIMESTAMP,
+    last_error TEXT,
+    inference_id INT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP,
+
+    FOREIGN KEY (question_id) REFERENCES prod_storage.questions (id) ON DELETE CASCADE,
+    FOREIGN KEY (model_id) REFERENCES prod_storage.models (id) ON DELETE CASCADE,
+    FOREIGN KEY (inference_id) REFERENCES prod_storage.questions_transformed (id) ON DELETE SET NULL
+  );
+
+CREATE INDEX IF NOT EXISTS inference_jobs_claim_idx
+ON prod_storage.inference_jobs (run_after, id)
+WHERE status IN ('pending', 'running');
+
+CREATE INDEX IF NOT EXISTS inference_jobs_finished_at_idx
+ON prod_storage.inference_jobs (finished_at)
+WHERE status = 'done';
+
+CREATE TRIGGER set_inference_jobs_updated_at
+AFTER UPDATE ON prod_storage.inference_jobs
+FOR EACH ROW
+EXECUTE FUNCTION set_updated_at();
+
+
+-- Opt-in cache of model completions. key is sha256 of (model name, prompt messages, temperature).
+-- Rows expire by created_at (TTL) and the least recently used are evicted above a size limit
+CREATE TABLE
+  IF NOT EXISTS prod_storage.completion_cache (
+    key CHAR(64) PRIMARY KEY,
+    model_name VARCHAR(255) NOT NULL,
+    temperature FLOAT NOT NULL,
+    thinking TEXT,
+    text TEXT NOT NULL,
+    prompt_tokens INT,
+    completion_tokens INT,
+    hits INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_used_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+  );
+
+CREATE INDEX IF NOT EXISTS completion_cache_last_used_at_idx
+ON prod_storage.completion_cache (last_used_at);
+
+-- Version of every table exports read, bumped by the transaction that changes the table:
+-- the new version is visible exactly when its rows are, unlike MAX(updated_at) or MAX(id)
+-- of rows committed after later ones. Statements that change no row keep the version
+CREATE TABLE
+  IF NOT EXISTS prod_storage.data_versions (
+    table_name VARCHAR(100) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+  );
+
+CREATE OR REPLACE FUNCTION bump_data_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP <> 'TRUNCATE' THEN
+        IF NOT EXISTS (SELECT 1 FROM changed_rows) THEN
+            RETURN NULL;
+        END IF;
+    END IF;
+    INSERT INTO prod_storage.data_versions AS dv (table_name, version)
+    VALUES (TG_TABLE_NAME, 1)
+    ON CONFLICT (table_name) DO UPDATE SET version = dv.version + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- A trigger per event: transition tables (changed_rows) allow a single one
+DO $$
+DECLARE
+    table_name TEXT;
+BEGIN
+    FOREACH table_name IN ARRAY ARRAY[
+        'questions', 'answers_multichoice', 'answers_coderunner', 'test_cases', 'models',
+        'prompt_templates', 'questions_transformed', 'inference_scores'
+    ] LOOP
+        EXECUTE format(
+            'CREATE OR REPLACE TRIGGER bump_%1$s_version_on_insert '
+            'AFTER INSERT ON prod_storage.%1$I REFERENCING NEW TABLE AS changed_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()',
+            table_name
+        );
+        EXECUTE format(
+            'CREATE OR REPLACE TRIGGER bump_%1$s_version_on_update '
+            'AFTER UPDATE ON prod_storage.%1$I REFERENCING NEW TABLE AS changed_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()',
+            table_name
+        );
+        EXECUTE format(
+            'CREATE OR REPLACE TRIGGER bump_%1$s_version_on_delete '
+            'AFTER DELETE ON prod_storage.%1$I REFERENCING OLD TABLE AS changed_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()',
+            table_name
+        );
+        EXECUTE format(
+            'CREATE OR REPLACE TRIGGER bump_%1$s_version_on_truncate '
+            'AFTER TRUNCATE ON prod_storage.%1$I '
+            'FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()',
+            table_name
+        );
+    END LOOP;
+END;
+$$;
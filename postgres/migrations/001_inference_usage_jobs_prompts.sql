@@ -0,0 +1,109 @@
+-- migrations/001_inference_usage_jobs_prompts.sql
+-- Brings a database created by an older init.sql up to date: init.sql only runs on an
+-- empty data directory. Idempotent, safe to apply again (scripts/migrate_postgres.sh)
+
+-- Token prices of models
+ALTER TABLE prod_storage.models
+  ADD COLUMN IF NOT EXISTS prompt_price NUMERIC(12, 6),  -- Per 1M tokens
+  ADD COLUMN IF NOT EXISTS completion_price NUMERIC(12, 6);  -- Per 1M tokens
+
+-- Versioned prompt templates and rendered prompts
+CREATE TABLE
+  IF NOT EXISTS prod_storage.prompt_templates (
+    version SERIAL PRIMARY KEY,
+    hash CHAR(64) NOT NULL,
+    system_prompt TEXT NOT NULL,
+    multichoice TEXT NOT NULL,
+    coderunner TEXT NOT NULL,
+    other TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    deleted_flg BOOLEAN NOT NULL DEFAULT false,
+
+    CONSTRAINT prompt_templates_source_key_unique UNIQUE (hash)
+  );
+
+CREATE TABLE
+  IF NOT EXISTS prod_storage.prompts (
+    id SERIAL PRIMARY KEY,
+    question_hash CHAR(64) NOT NULL,
+    template_version INT NOT NULL,
+    messages JSONB NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    FOREIGN KEY (template_version) REFERENCES prod_storage.prompt_templates (version) ON DELETE CASCADE,
+
+    CONSTRAINT prompts_source_key_unique UNIQUE (question_hash, template_version)
+  );
+
+-- Usage, latency, cache and prompt of inferences
+ALTER TABLE prod_storage.questions_transformed
+  ADD COLUMN IF NOT EXISTS prompt_tokens INT,
+  ADD COLUMN IF NOT EXISTS completion_tokens INT,  -- Includes reasoning_tokens
+  ADD COLUMN IF NOT EXISTS reasoning_tokens INT,
+  ADD COLUMN IF NOT EXISTS ttft_ms INT,
+  ADD COLUMN IF NOT EXISTS latency_ms INT,
+  ADD COLUMN IF NOT EXISTS cached BOOLEAN NOT NULL DEFAULT false,
+  ADD COLUMN IF NOT EXISTS prompt_id INT REFERENCES prod_storage.prompts (id) ON DELETE SET NULL,
+  ADD COLUMN IF NOT EXISTS prompt_template_version INT;
+
+CREATE INDEX IF NOT EXISTS questions_transformed_cell_idx
+ON prod_storage.questions_transformed (model_id, question_id, temperature)
+WHERE deleted_flg = false;
+
+CREATE INDEX IF NOT EXISTS inference_scores_created_at_idx
+ON prod_storage.inference_scores (created_at);
+
+-- Durable inference job queue
+CREATE TABLE
+  IF NOT EXISTS prod_storage.inference_jobs (
+    id SERIAL PRIMARY KEY,
+    question_id INT NOT NULL,
+    model_id INT NOT NULL,
+    temperature FLOAT NOT NULL CHECK(temperature > 0.0 and temperature <= 1.0),
+    openai_url TEXT,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'done', 'failed')),
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL CHECK (max_attempts > 0),
+    run_after TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_until TIMESTAMP,
+    last_error TEXT,
+    inference_id INT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP,
+
+    FOREIGN KEY (question_id) REFERENCES prod_storage.questions (id) ON DELETE CASCADE,
+    FOREIGN KEY (model_id) REFERENCES prod_storage.models (id) ON DELETE CASCADE,
+    FOREIGN KEY (inference_id) REFERENCES prod_storage.questions_transformed (id) ON DELETE SET NULL
+  );
+
+CREATE INDEX IF NOT EXISTS inference_jobs_claim_idx
+ON prod_storage.inference_jobs (run_after, id)
+WHERE status IN ('pending', 'running');
+
+CREATE INDEX IF NOT EXISTS inference_jobs_finished_at_idx
+ON prod_storage.inference_jobs (finished_at)
+WHERE status = 'done';
+
+CREATE OR REPLACE TRIGGER set_inference_jobs_updated_at
+AFTER UPDATE ON prod_storage.inference_jobs
+FOR EACH ROW
+EXECUTE FUNCTION set_updated_at();
+
+-- Completion cache
+CREATE TABLE
+  IF NOT EXISTS prod_storage.completion_cache (
+    key CHAR(64) PRIMARY KEY,
+    model_name VARCHAR(255) NOT NULL,
+    temperature FLOAT NOT NULL,
+    thinking TEXT,
+    text TEXT NOT NULL,
+    prompt_tokens INT,
+    completion_tokens INT,
+    hits INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_used_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+  );
+
+CREATE INDEX IF NOT EXISTS completion_cache_last_used_at_idx
+ON prod_storage.completion_cache (last_used_at);
@@ -0,0 +1,4 @@
+-- migrations/002_inference_jobs_bypass_cache.sql
+-- Jobs sampling a cell more than once skip the completion cache
+ALTER TABLE prod_storage.inference_jobs
+  ADD COLUMN IF NOT EXISTS bypass_cache BOOLEAN NOT NULL DEFAULT false;
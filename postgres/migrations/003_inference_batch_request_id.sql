@@ -0,0 +1,8 @@
+-- migrations/003_inference_batch_request_id.sql
+-- A batch output imported again does not duplicate its inferences
+ALTER TABLE prod_storage.questions_transformed
+  ADD COLUMN IF NOT EXISTS batch_request_id TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS questions_transformed_batch_request_id_idx
+ON prod_storage.questions_transformed (batch_request_id)
+WHERE batch_request_id IS NOT NULL;
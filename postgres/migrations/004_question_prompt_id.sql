@@ -0,0 +1,9 @@
+-- migrations/004_question_prompt_id.sql
+-- Prompt of the question with the active template, stored at ingest so exports are a join.
+-- Existing questions and inferences without a prompt are backfilled on the first export
+ALTER TABLE prod_storage.questions
+  ADD COLUMN IF NOT EXISTS prompt_id INT REFERENCES prod_storage.prompts (id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS questions_transformed_missing_prompt_idx
+ON prod_storage.questions_transformed (question_id)
+WHERE prompt_id IS NULL AND batch_request_id IS NULL AND deleted_flg = false;
@@ -0,0 +1,61 @@
+-- migrations/005_export_data_versions.sql
+-- Version of every table exports read, bumped by the transaction that changes the table:
+-- the new version is visible exactly when its rows are, unlike MAX(updated_at) or MAX(id)
+-- of rows committed after later ones. Statements that change no row keep the version
+CREATE TABLE
+  IF NOT EXISTS prod_storage.data_versions (
+    table_name VARCHAR(100) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+  );
+
+CREATE OR REPLACE FUNCTION bump_data_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP <> 'TRUNCATE' THEN
+        IF NOT EXISTS (SELECT 1 FROM changed_rows) THEN
+            RETURN NULL;
+        END IF;
+    END IF;
+    INSERT INTO prod_storage.data_versions AS dv (table_name, version)
+    VALUES (TG_TABLE_NAME, 1)
+    ON CONFLICT (table_name) DO UPDATE SET version = dv.version + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- A trigger per event: transition tables (changed_rows) allow a single one
+DO $$
+DECLARE
+    table_name TEXT;
+BEGIN
+    FOREACH table_name IN ARRAY ARRAY[
+        'questions', 'answers_multichoice', 'answers_coderunner', 'test_cases', 'models',
+        'prompt_templates', 'questions_transformed', 'inference_scores'
+    ] LOOP
+        EXECUTE format(
+            'CREATE OR REPLACE TRIGGER bump_%1$s_version_on_insert '
+            'AFTER INSERT ON prod_storage.%1$I REFERENCING NEW TABLE AS changed_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()',
+            table_name
+        );
+        EXECUTE format(
+            'CREATE OR REPLACE TRIGGER bump_%1$s_version_on_update '
+            'AFTER UPDATE ON prod_storage.%1$I REFERENCING NEW TABLE AS changed_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()',
+            table_name
+        );
+        EXECUTE format(
+            'CREATE OR REPLACE TRIGGER bump_%1$s_version_on_delete '
+            'AFTER DELETE ON prod_storage.%1$I REFERENCING OLD TABLE AS changed_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()',
+            table_name
+        );
+        EXECUTE format(
+            'CREATE OR REPLACE TRIGGER bump_%1$s_version_on_truncate '
+            'AFTER TRUNCATE ON prod_storage.%1$I '
+            'FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()',
+            table_name
+        );
+    END LOOP;
+END;
+$$;
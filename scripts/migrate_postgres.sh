@@ -0,0 +1,8 @@
+# Apply postgres/migrations/*.sql in order to the running postgres container.
+# init.sql only runs on an empty volume, migrations bring existing databases up to date
+set -e
+cd "$(dirname "$0")/.."
+for migration in postgres/migrations/*.sql; do
+    echo "Applying $migration"
+    docker exec -i postgres psql -v ON_ERROR_STOP=1 -U postgres postgres < "$migration"
+done
@@ -0,0 +1,91 @@
+"""
+Bytes on the wire and CPU cost of export encodings.
+
+    python -m bench.compression --server http://localhost:80 --path "/read/report/csv"
+    python -m bench.compression --file report.csv
+
+Downloads the export once per encoding (identity, gzip, zstd) negotiated with Accept-Encoding
+and reports encoded size, ratio and download time, then encodes the plain export in-process
+(compress_stream, chunks as COPY sends them) for CPU secs per MB of input.
+"""
+
+from typing import Iterator, Optional
+import argparse
+import os
+import tempfile
+import time
+import httpx
+from src.constraints import EXPORT_COPY_CHUNK_BYTES, EXPORT_COMPRESSIONS
+from src.database.export import compress_stream
+
+
+def read_chunks(path: str) -> Iterator[bytes]:
+    with open(path, "rb") as file:
+        while chunk := file.read(EXPORT_COPY_CHUNK_BYTES):
+            yield chunk
+
+
+def download(client: httpx.Client, path: str, encoding: str, target: Optional[str]) -> dict:
+    """Raw (still encoded) bytes of one download, saved to target if given"""
+    size = 0
+    started = time.perf_counter()
+    with client.stream("GET", path, headers={"Accept-Encoding": encoding}) as response:
+        response.raise_for_status()
+        with open(target or os.devnull, "wb") as file:
+            for chunk in response.iter_raw():
+                size += len(chunk)
+                file.write(chunk)
+        content_encoding = response.headers.get("Content-Encoding", "identity")
+    return {
+        "encoding": content_encoding,
+        "bytes": size,
+        "secs": time.perf_counter() - started,
+    }
+
+
+def encode(path: str, codec: str) -> dict:
+    size = 0
+    started = time.process_time()
+    for chunk in compress_stream(chunks=read_chunks(path), codec=codec):
+        size += len(chunk)
+    return {"codec": codec, "bytes": size, "cpu_secs": time.process_time() - started}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--server", default="http://localhost:80")
+    parser.add_argument("--path", default="/read/report/csv")
+    parser.add_argument("--file", help="Plain export to encode, skips the downloads")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.file
+        if path is None:
+            path = os.path.join(directory, "export")
+            with httpx.Client(base_url=args.server, timeout=None) as client:
+                plain = download(client=client, path=args.path, encoding="identity", target=path)
+                print(f"{'wire':<10}{'bytes':>14}{'ratio':>8}{'secs':>8}")
+                print(f"{'identity':<10}{plain['bytes']:>14}{1:>8.1f}{plain['secs']:>8.2f}")
+                for codec in EXPORT_COMPRESSIONS:
+                    result = download(client=client, path=args.path, encoding=codec, target=None)
+                    if result["encoding"] != codec:
+                        print(f"{codec:<10}not negotiated (sent {result['encoding']})")
+                        continue
+                    ratio = plain["bytes"] / max(result["bytes"], 1)
+                    print(f"{codec:<10}{result['bytes']:>14}{ratio:>8.1f}{result['secs']:>8.2f}")
+                print()
+
+        megabytes = os.path.getsize(path) / 1e6
+        print(f"{'encode':<10}{'bytes':>14}{'ratio':>8}{'cpu s/MB':>10}{'MB/s':>8}")
+        for codec in EXPORT_COMPRESSIONS:
+            result = encode(path=path, codec=codec)
+            ratio = megabytes * 1e6 / max(result["bytes"], 1)
+            per_mb = result["cpu_secs"] / megabytes
+            print(
+                f"{codec:<10}{result['bytes']:>14}{ratio:>8.1f}{per_mb:>10.4f}"
+                f"{1 / max(per_mb, 1e-9):>8.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
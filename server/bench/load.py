@@ -0,0 +1,179 @@
+"""
+Load harness for /upload/inferences/new at increasing concurrency.
+
+    python -m bench.mock_openai --port 8001 &
+    python -m bench.load --server http://localhost:80 --auth-token-file private.pem \
+        --openai-url http://server-visible-host:8001/v1/ --model-id 1 --concurrency 1,4,16,64
+
+Reports throughput, p50/p99 latency and database pool usage (from /health/pool) per level.
+"""
+
+from typing import List, Optional
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import httpx
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[round(q * 100) - 1]
+
+
+async def get_question_ids(client: httpx.AsyncClient, limit: int) -> List[int]:
+    response = await client.get("/read/questions/all")
+    response.raise_for_status()
+    return [question["id"] for question in response.json()][:limit]
+
+
+async def watch_pool(client: httpx.AsyncClient, stop: asyncio.Event, usage: dict) -> None:
+    """Peak connections in use and pool exhaustion events during a level"""
+    while not stop.is_set():
+        try:
+            response = await client.get("/health/pool")
+            if response.status_code == 200:
+                pool = response.json()
+                usage["peak_in_use"] = max(usage["peak_in_use"], pool["total_in_use"])
+                usage["exhausted_count"] = sum(
+                    worker["exhausted_count"] for worker in pool["workers"]
+                )
+        except httpx.HTTPError:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.5)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_level(
+    client: httpx.AsyncClient, args: argparse.Namespace, question_ids: List[int], concurrency: int
+) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    counts = {"succeeded": 0, "failed": 0, "http_errors": 0}
+    params = {"openai_url": args.openai_url, "openai_api_key": args.openai_api_key}
+
+    async def call(idx: int) -> None:
+        body = [
+            {
+                "question_id": question_ids[(idx * args.batch_size + offset) % len(question_ids)],
+                "model_id": args.model_id,
+                "temperature": args.temperature,
+                "bypass_cache": not args.use_cache,
+            }
+            for offset in range(args.batch_size)
+        ]
+        async with semaphore:
+            started_at = time.monotonic()
+            try:
+                response = await client.post(
+                    "/upload/inferences/new", params=params, json=body, timeout=args.timeout
+                )
+            except httpx.HTTPError:
+                counts["http_errors"] += 1
+                return
+            latencies.append(time.monotonic() - started_at)
+        if response.status_code != 201:
+            counts["http_errors"] += 1
+            return
+        result = response.json()
+        counts["succeeded"] += result["succeeded"]
+        counts["failed"] += result["failed"]
+
+    pool_usage = {"peak_in_use": 0, "exhausted_count": 0}
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(watch_pool(client=client, stop=stop, usage=pool_usage))
+    started_at = time.monotonic()
+    await asyncio.gather(*[call(idx) for idx in range(args.requests)])
+    elapsed = time.monotonic() - started_at
+    stop.set()
+    await watcher
+
+    return {
+        "concurrency": concurrency,
+        "requests": args.requests,
+        "elapsed_secs": round(elapsed, 3),
+        "inferences_per_sec": round(counts["succeeded"] / elapsed, 3),
+        "p50_latency_secs": percentile(latencies, 0.5),
+        "p99_latency_secs": percentile(latencies, 0.99),
+        **counts,
+        **pool_usage,
+    }
+
+
+def print_table(results: List[dict]) -> None:
+    columns = [
+        "concurrency",
+        "inferences_per_sec",
+        "p50_latency_secs",
+        "p99_latency_secs",
+        "succeeded",
+        "failed",
+        "http_errors",
+        "peak_in_use",
+        "exhausted_count",
+    ]
+    print(" | ".join(columns))
+    for result in results:
+        row = []
+        for column in columns:
+            value = result[column]
+            row.append(f"{value:.3f}" if isinstance(value, float) else str(value))
+        print(" | ".join(cell.rjust(len(column)) for cell, column in zip(row, columns)))
+
+
+async def main(args: argparse.Namespace) -> None:
+    with open(args.auth_token_file) as file:
+        auth_token = file.read().replace("\n", "\\n")  # Header-safe, see form_to_key()
+    async with httpx.AsyncClient(
+        base_url=args.server,
+        headers={"authToken": auth_token},
+        limits=httpx.Limits(max_connections=None),
+        timeout=args.timeout,
+    ) as client:
+        question_ids = args.question_ids or await get_question_ids(client, limit=args.questions)
+        if not question_ids:
+            raise SystemExit("No questions in database, upload a quiz first")
+        results = []
+        for concurrency in args.concurrency:
+            result = await run_level(
+                client=client, args=args, question_ids=question_ids, concurrency=concurrency
+            )
+            results.append(result)
+            print(json.dumps(result))
+    print_table(results)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+def int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--server", default="http://localhost:80")
+    parser.add_argument("--auth-token-file", required=True, help="Admin private key (PEM)")
+    parser.add_argument("--openai-url", default="http://localhost:8001/v1/")
+    parser.add_argument("--openai-api-key", default="mock")
+    parser.add_argument("--model-id", type=int, required=True)
+    parser.add_argument("--question-ids", type=int_list, default=None)
+    parser.add_argument("--questions", type=int, default=50, help="Questions used if no IDs given")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--requests", type=int, default=50, help="Requests per concurrency level")
+    parser.add_argument("--batch-size", type=int, default=1, help="Inferences per request")
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--use-cache", action="store_true", help="Allow completion cache hits")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--output", default=None, help="Write results as JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,243 @@
+"""
+OpenAI-compatible chat completions stand-in for offline benchmarks.
+
+    python -m bench.mock_openai --port 8001 --latency-median 2 --rate-limit-ratio 0.05
+
+Point the server at it with openai_url=http://<host>:8001/v1/ (any API key works).
+POST /down and /up simulate a replica outage (every route answers 503) for failover tests.
+"""
+
+from typing import List, Optional, AsyncGenerator
+from collections import deque
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+
+WORDS = (
+    "задание переменная функция список словарь цикл условие строка число ответ "
+    "пример шаг вывод ввод значение индекс элемент результат проверка код"
+).split()
+
+
+class MockConfig(BaseModel):
+    latency_median: float = Field(1.0, ge=0, description="Median full response latency, secs")
+    latency_sigma: float = Field(0.5, ge=0, description="Log-normal sigma of latency")
+    ttft: float = Field(0.2, ge=0, description="Time to first token when streaming, secs")
+    completion_tokens: int = Field(200, ge=1)
+    think_ratio: float = Field(0.5, ge=0, le=1, description="Share of answers with <think>")
+    rate_limit_ratio: float = Field(0.0, ge=0, le=1, description="Share of 429 responses")
+    retry_after: float = Field(1.0, ge=0, description="Retry-After of 429 responses, secs")
+    timeout_ratio: float = Field(0.0, ge=0, le=1, description="Share of requests that hang")
+    timeout_secs: float = Field(600.0, ge=0)
+    error_ratio: float = Field(0.0, ge=0, le=1, description="Share of 500 responses")
+    requests_per_minute: Optional[int] = Field(
+        None, ge=1, description="Enforced limit, reported in x-ratelimit-* headers"
+    )
+    seed: Optional[int] = None
+
+
+class RequestWindow:
+    """Requests accepted within the last minute"""
+
+    def __init__(self) -> None:
+        self._times: deque = deque()
+
+    def count(self) -> int:
+        now = time.monotonic()
+        while self._times and now - self._times[0] > 60:
+            self._times.popleft()
+        return len(self._times)
+
+    def add(self) -> None:
+        self._times.append(time.monotonic())
+
+    def reset_after(self) -> float:
+        return max(0.0, 60 - (time.monotonic() - self._times[0])) if self._times else 0.0
+
+
+def make_content(rng: random.Random, config: MockConfig) -> List[str]:
+    """Answer split into tokens (one word each)"""
+    tokens = [rng.choice(WORDS) + " " for _ in range(config.completion_tokens)]
+    if rng.random() < config.think_ratio:
+        split = len(tokens) // 2
+        tokens = ["<think>"] + tokens[:split] + ["</think>"] + tokens[split:]
+    return tokens
+
+
+def make_usage(messages: List[dict], tokens: List[str]) -> dict:
+    prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in messages)
+    reasoning_tokens = tokens.index("</think>") - 1 if "</think>" in tokens else 0
+    completion_tokens = len(tokens)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "completion_tokens_details": {"reasoning_tokens": reasoning_tokens},
+    }
+
+
+def error_response(status_code: int, message: str, type: str, headers: dict) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": {"message": message, "type": type, "code": None}},
+        headers=headers,
+    )
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    app = FastAPI(title="Mock OpenAI")
+    rng = random.Random(config.seed)
+    window = RequestWindow()
+    stats = {"requests": 0, "rate_limited": 0, "timeouts": 0, "errors": 0}
+    state = {"down": False}
+
+    def ratelimit_headers() -> dict:
+        if config.requests_per_minute is None:
+            return {}
+        return {
+            "x-ratelimit-limit-requests": str(config.requests_per_minute),
+            "x-ratelimit-remaining-requests": str(
+                max(0, config.requests_per_minute - window.count())
+            ),
+            "x-ratelimit-reset-requests": f"{window.reset_after():.3f}s",
+        }
+
+    def unavailable() -> JSONResponse:
+        return error_response(503, "Replica is down", "server_error", {})
+
+    @app.post("/down")
+    async def down():
+        state["down"] = True
+        return state
+
+    @app.post("/up")
+    async def up():
+        state["down"] = False
+        return state
+
+    @app.get("/v1/models")
+    async def models():
+        if state["down"]:
+            return unavailable()
+        return {"object": "list", "data": [{"id": "mock-model", "object": "model"}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return dict(stats, **state)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        if state["down"]:
+            stats["errors"] += 1
+            return unavailable()
+        over_limit = (
+            config.requests_per_minute is not None
+            and window.count() >= config.requests_per_minute
+        )
+        if over_limit or rng.random() < config.rate_limit_ratio:
+            stats["rate_limited"] += 1
+            retry_after = window.reset_after() if over_limit else config.retry_after
+            headers = dict(ratelimit_headers(), **{"retry-after": f"{retry_after:.3f}"})
+            return error_response(429, "Rate limit reached", "rate_limit_error", headers)
+        window.add()
+        if rng.random() < config.timeout_ratio:
+            stats["timeouts"] += 1
+            await asyncio.sleep(config.timeout_secs)
+            return error_response(504, "Upstream timed out", "timeout", ratelimit_headers())
+        if rng.random() < config.error_ratio:
+            stats["errors"] += 1
+            return error_response(500, "Internal error", "server_error", ratelimit_headers())
+
+        messages = body.get("messages", [])
+        model = body.get("model", "mock-model")
+        tokens = make_content(rng=rng, config=config)
+        usage = make_usage(messages=messages, tokens=tokens)
+        latency = rng.lognormvariate(0, config.latency_sigma) * config.latency_median
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency)
+            return JSONResponse(
+                content={
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": "".join(tokens)},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": usage,
+                },
+                headers=ratelimit_headers(),
+            )
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        def chunk(choices: list, usage: Optional[dict] = None) -> str:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": choices,
+            }
+            if usage is not None:
+                data["usage"] = usage
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        async def events() -> AsyncGenerator[str, None]:
+            await asyncio.sleep(min(config.ttft, latency))
+            delay = max(0.0, latency - config.ttft) / len(tokens)
+            for token in tokens:
+                yield chunk([{"index": 0, "delta": {"content": token}, "finish_reason": None}])
+                await asyncio.sleep(delay)
+            yield chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if include_usage:
+                yield chunk([], usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(
+            events(), media_type="text/event-stream", headers=ratelimit_headers()
+        )
+
+    return app
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    for name, field in MockConfig.model_fields.items():
+        parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            type=int if field.annotation in (int, Optional[int]) else float,
+            default=field.default,
+            help=field.description,
+        )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = vars(parse_args())
+    host, port = args.pop("host"), args.pop("port")
+    config = MockConfig(**args)
+    uvicorn.run(create_app(config), host=host, port=port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
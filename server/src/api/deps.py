@@ -1,21 +1,21 @@
 import os
 from fastapi import Query, Depends, Header, Path, Request
-from typing import Generator, Optional, get_args, AsyncGenerator
+from typing import Generator, Optional, get_args, AsyncGenerator, Callable
 from contextlib import contextmanager
 from psycopg2.extensions import cursor
-from src.database.pool import ConnectionPoolManager
-import openai
+from src.database.pool import ConnectionPoolManager, LazyCursor
+from src.models.clients import OpenAIClientRegistry
 from src.config import settings
 from src.api.auth import verify_rsa_key_pair
 from src.exceptions import (
     PublicKeyMissingException,
     UnauthorizedException,
-    UserGroupNotFoundException,
 )
 from src.utils import form_to_key, get_request_ip
 from src.logger import LoggerFactory
-from src.types import UserGroupCD, Language
-from src.api.utils import existing_user_group_cd
+from src.types import UserGroupCD, Language, StatementClass
+from src.api.utils import cancel_on_disconnect
+from src.services import verify_user_group
 from src.session.storage import SessionStorage, RedisConnection
 from src.session.schemas import UserSessionData
 
@@ -28,9 +28,30 @@ def get_db_connection() -> Generator:
         yield conn
 
 
-def get_db_cursor() -> Generator:
-    with ConnectionPoolManager.get_cursor() as cursor:
-        yield cursor
+def db_cursor_dependency(statement_class: StatementClass, watch_disconnect: bool = True) -> Callable:
+    """
+    Build a cursor dependency with the statement timeout of given endpoint class.
+    Routes streaming the request body skip the disconnect watcher: the body stream
+    raises ClientDisconnect by itself, and the route's transaction rolls back
+    """
+
+    async def dependency(request: Request) -> AsyncGenerator:
+        # Connection is only checked out on the first query, routes may release it early
+        statement_timeout = settings.postgres.get_statement_timeout(statement_class)
+        with LazyCursor(statement_timeout=statement_timeout) as cursor:
+            if not watch_disconnect:
+                yield cursor
+                return
+            async with cancel_on_disconnect(request=request, cursor=cursor):
+                yield cursor
+
+    return dependency
+
+
+get_db_cursor = db_cursor_dependency("pages")
+get_admin_db_cursor = db_cursor_dependency("admin")
+get_export_db_cursor = db_cursor_dependency("exports")
+get_upload_db_cursor = db_cursor_dependency("admin", watch_disconnect=False)
 
 
 async def get_openai_api_key(openai_api_key: str = Query(...)) -> str:
@@ -46,11 +67,11 @@ async def get_openai_client(
     openai_url: str = Depends(get_openai_url),
     openai_api_key: str = Depends(get_openai_api_key),
 ):
-    client = openai.AsyncClient(base_url=openai_url, api_key=openai_api_key)
-    try:
+    # Shared client from the registry: keeps its connections warm between requests
+    async with OpenAIClientRegistry.use(
+        base_url=openai_url, api_key=openai_api_key
+    ) as client:
         yield client
-    finally:
-        await client.close()
 
 
 async def get_auth_token(authToken: str = Header(...)) -> str:
@@ -68,9 +89,15 @@ async def get_user_group_query(
 ) -> Optional[UserGroupCD]:
     if user_group_cd is None:
         return None
-    if not (await existing_user_group_cd(user_group_cd=user_group_cd, cursor=cursor)):
-        raise UserGroupNotFoundException()
-    return user_group_cd
+    return await verify_user_group(user_group_cd=user_group_cd, cursor=cursor)
+
+
+async def get_user_group_path(
+    user_group_cd: UserGroupCD = Path(...),
+    cursor: cursor = Depends(get_db_cursor),
+) -> UserGroupCD:
+    """User Group of a page, shares the cursor of the page route"""
+    return await verify_user_group(user_group_cd=user_group_cd, cursor=cursor)
 
 
 async def get_redis_connection() -> AsyncGenerator:
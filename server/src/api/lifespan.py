@@ -1,16 +1,56 @@
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
+import asyncio
+from redis.asyncio import RedisError
+from src.config import settings
 from src.database.pool import ConnectionPoolManager
 from src.session.storage import SessionStorage
+from src.jobs.worker import InferenceWorkerPool
+from src.models.clients import OpenAIClientRegistry
+from src.models.routing import ModelRouter
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+async def publish_pool_stats() -> None:
+    """Periodically share this worker's pool usage so any worker can report all of them"""
+    while True:
+        try:
+            async with SessionStorage.get_connection() as redis_connection:
+                await redis_connection.set_pool_stats(
+                    stats=ConnectionPoolManager.get_stats()
+                )
+        except RedisError as e:
+            logger.warning(f"Failed to publish pool stats: {e}")
+        await asyncio.sleep(settings.postgres.pool_stats_publish_interval)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    pool_stats_task = None
     try:
         ConnectionPoolManager.initialize_pool()
         await SessionStorage.initialize()
+        await OpenAIClientRegistry.initialize()
+        await ModelRouter.initialize()
+        pool_stats_task = asyncio.create_task(publish_pool_stats())
+        InferenceWorkerPool.start(workers=settings.jobs.inference_workers)
         yield
     finally:
+        await InferenceWorkerPool.stop()
+        await ModelRouter.close()
+        await OpenAIClientRegistry.close()
+        if pool_stats_task is not None:
+            pool_stats_task.cancel()
+            try:
+                async with SessionStorage.get_connection() as redis_connection:
+                    await redis_connection.delete_pool_stats(
+                        stats=ConnectionPoolManager.get_stats()
+                    )
+            except RedisError as e:
+                logger.warning(f"Failed to delete pool stats: {e}")
         # Ensure pool is closed
         ConnectionPoolManager.close_pool()
         await SessionStorage.close()
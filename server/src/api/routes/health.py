@@ -1,7 +1,17 @@
 from fastapi import APIRouter, Depends, status, Body
+from redis.asyncio import RedisError
+from typing import List
 from src.logger import LoggerFactory
 from src.config import settings
-from src.schemas import MessageSuccessResponse
+from src.schemas import (
+    MessageSuccessResponse,
+    GetPoolHealthResponse,
+    GetModelEndpointsResponse,
+)
+from src.database.pool import ConnectionPoolManager
+from src.models.routing import ModelRouter
+from src.api.deps import get_redis_connection
+from src.session.storage import RedisConnection
 
 
 logger = LoggerFactory.getLogger(__name__)
@@ -19,3 +29,37 @@ router = APIRouter(tags=["health"], prefix="")
 )
 async def root():
     return MessageSuccessResponse(message="Ok")
+
+
+@router.get(
+    "/pool",
+    response_model=GetPoolHealthResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Database connection usage of every worker",
+    description="Workers publish their pool usage to Redis, stats of this worker are always fresh",
+)
+async def pool(redis_connection: RedisConnection = Depends(get_redis_connection)):
+    local_stats = ConnectionPoolManager.get_stats()
+    try:
+        await redis_connection.set_pool_stats(stats=local_stats)
+        workers = await redis_connection.get_pool_stats_all()
+    except RedisError as e:
+        logger.warning(f"Failed to collect pool stats of other workers: {e}")
+        workers = [local_stats]
+    return GetPoolHealthResponse(
+        global_maxconn=settings.postgres.pool_global_maxconn,
+        workers_configured=settings.postgres.web_concurrency,
+        total_in_use=sum(worker.in_use for worker in workers),
+        workers=workers,
+    )
+
+
+@router.get(
+    "/endpoints",
+    response_model=List[GetModelEndpointsResponse],
+    status_code=status.HTTP_200_OK,
+    summary="Routing state of model replicas in this worker",
+    description="Health, in-flight requests and latency of every endpoint in MODEL_ENDPOINTS",
+)
+async def endpoints():
+    return ModelRouter.get_stats_all()
@@ -1,12 +1,12 @@
 # pages.py
-from fastapi import APIRouter, Request, HTTPException, status, Path, Depends
+from fastapi import APIRouter, Request, status, Path, Depends
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
+from psycopg2.extensions import cursor
 from pydantic import BaseModel
 from typing import List, Optional
 import pathlib
-import httpx
-from src.config import settings
+from src import services
 from src.constraints import (
     KNOWN_QUESTION_TYPES,
     QUESTION_MULTICHOICE_TYPES,
@@ -16,22 +16,21 @@ from src.constraints import (
 from src.schemas import (
     QuestionPageResponse,
     Question,
-    GetQuestionResponse,
-    GetInferenceResponse,
     QuestionInferencePageResponse,
-    GetInferenceScoreResponse,
     LanguagePageResponse,
 )
 from src.language import language_manager
-from src.types import Language
-from src.api.deps import get_language_query
+from src.types import Language, UserGroupCD
+from src.api.deps import get_language_query, get_user_group_path, get_db_cursor
+from src.models.page_cache import PageCache
 from src.logger import LoggerFactory
 
 
 logger = LoggerFactory.getLogger(__name__)
 
 
-BACKEND_URL = settings.server.url
+# Pages read through src.services in process, on one pooled connection per page view.
+# Pages that are the same for every student of a User Group are served from PageCache.
 
 
 router = APIRouter(tags=["pages"], prefix="")
@@ -41,6 +40,10 @@ ROOT_DIR = pathlib.Path(__file__).resolve().parent.parent.parent.parent
 templates = Jinja2Templates(directory=str(ROOT_DIR / "templates"))
 
 
+def render_page(request: Request, name: str, context: dict) -> str:
+    return templates.get_template(name).render({"request": request, **context})
+
+
 @router.get(
     "/{user_group_cd}/questions/list",
     response_class=HTMLResponse,
@@ -48,42 +51,38 @@ templates = Jinja2Templates(directory=str(ROOT_DIR / "templates"))
 )
 async def list_questions(
     request: Request,
-    user_group_cd: str = Path(...),
+    user_group_cd: UserGroupCD = Depends(get_user_group_path),
     lang: Language = Depends(get_language_query),
+    cursor: cursor = Depends(get_db_cursor),
 ):
-    try:
-        async with httpx.AsyncClient() as client:
-            params = {"user_group_cd": user_group_cd}
-            response = await client.get(
-                f"{BACKEND_URL}/read/questions/all", params=params
+    async def render() -> str:
+        questions = [
+            QuestionPageResponse.from_question_response(question_response=question)
+            for question in await services.get_questions(
+                user_group_cd=user_group_cd, cursor=cursor
             )
-            response.raise_for_status()
-            questions_list = response.json()
-    except httpx.HTTPStatusError as e:
-        raise HTTPException(
-            status_code=e.response.status_code,
-            detail=f"Failed to fetch questions:\n{e}",
-        )
-
-    questions = [
-        QuestionPageResponse.from_question_response(
-            question_response=GetQuestionResponse(**question)
+        ]
+        return render_page(
+            request=request,
+            name="question_list.html",
+            context={
+                "questions": questions,
+                "user_group_cd": user_group_cd,
+                "languages": LanguagePageResponse(
+                    current=lang,
+                    pack=language_manager.get_language_pack(language=lang).question_list,
+                ),
+            },
         )
-        for question in questions_list
-    ]
 
-    return templates.TemplateResponse(
-        "question_list.html",
-        {
-            "request": request,
-            "questions": questions,
-            "user_group_cd": user_group_cd,
-            "languages": LanguagePageResponse(
-                current=lang,
-                pack=language_manager.get_language_pack(language=lang).question_list,
-            ),
-        },
+    html = await PageCache.get_or_render(
+        render=render,
+        base_url=str(request.base_url),
+        template="question_list.html",
+        user_group_cd=user_group_cd,
+        lang=lang,
     )
+    return HTMLResponse(html)
 
 
 @router.get(
@@ -93,41 +92,40 @@ async def list_questions(
 )
 async def question_detail(
     request: Request,
-    user_group_cd: str = Path(...),
+    user_group_cd: UserGroupCD = Depends(get_user_group_path),
     id: int = Path(...),
     lang: Language = Depends(get_language_query),
+    cursor: cursor = Depends(get_db_cursor),
 ):
-    try:
-        async with httpx.AsyncClient() as client:
-            params = {"user_group_cd": user_group_cd}
-            response = await client.get(
-                f"{BACKEND_URL}/read/question/{id}", params=params
-            )
-            response.raise_for_status()
-            question_json = response.json()
-    except httpx.HTTPStatusError as e:
-        raise HTTPException(
-            status_code=e.response.status_code,
-            detail=f"Failed to fetch question {id}:\n{e}",
+    async def render() -> str:
+        question_obj = await services.get_question(
+            user_group_cd=user_group_cd, id=id, cursor=cursor
+        )
+        question_page_response = QuestionPageResponse.from_question_response(
+            question_response=question_obj
+        )
+        return render_page(
+            request=request,
+            name="question_detail.html",
+            context={
+                "question": question_page_response,
+                "user_group_cd": user_group_cd,
+                "languages": LanguagePageResponse(
+                    current=lang,
+                    pack=language_manager.get_language_pack(language=lang).question,
+                ),
+            },
         )
 
-    question_obj = GetQuestionResponse(**question_json)
-    question_page_response = QuestionPageResponse.from_question_response(
-        question_response=question_obj
-    )
-
-    return templates.TemplateResponse(
-        "question_detail.html",
-        {
-            "request": request,
-            "question": question_page_response,
-            "user_group_cd": user_group_cd,
-            "languages": LanguagePageResponse(
-                current=lang,
-                pack=language_manager.get_language_pack(language=lang).question,
-            ),
-        },
+    html = await PageCache.get_or_render(
+        render=render,
+        base_url=str(request.base_url),
+        template="question_detail.html",
+        user_group_cd=user_group_cd,
+        lang=lang,
+        ids=(id,),
     )
+    return HTMLResponse(html)
 
 
 @router.get(
@@ -135,21 +133,14 @@ async def question_detail(
     response_class=RedirectResponse,
     status_code=status.HTTP_200_OK,
 )
-async def questions_random(request: Request, user_group_cd: str = Path(...)):
-    try:
-        async with httpx.AsyncClient() as client:
-            params = {"user_group_cd": user_group_cd}
-            response = await client.get(
-                f"{BACKEND_URL}/read/questions/random/id", params=params
-            )
-            response.raise_for_status()
-            question_id = response.json()["id"]
-    except httpx.HTTPStatusError as e:
-        raise HTTPException(
-            status_code=e.response.status_code,
-            detail=f"Failed to fetch question ID:\n{e}",
-        )
-
+async def questions_random(
+    request: Request,
+    user_group_cd: UserGroupCD = Depends(get_user_group_path),
+    cursor: cursor = Depends(get_db_cursor),
+):
+    question_id = await services.get_random_question_id(
+        user_group_cd=user_group_cd, cursor=cursor
+    )
     return RedirectResponse(url=f"/pages/{user_group_cd}/question/{question_id}")
 
 
@@ -160,54 +151,40 @@ async def questions_random(request: Request, user_group_cd: str = Path(...)):
 )
 async def question_inference(
     request: Request,
-    user_group_cd: str = Path(...),
+    user_group_cd: UserGroupCD = Depends(get_user_group_path),
     id: int = Path(...),
     lang: Language = Depends(get_language_query),
+    cursor: cursor = Depends(get_db_cursor),
 ):
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{BACKEND_URL}/read/inference/{id}")
-            response.raise_for_status()
-            inference_json = response.json()
-    except httpx.HTTPStatusError as e:
-        raise HTTPException(
-            status_code=e.response.status_code,
-            detail=f"Failed to fetch inference ID {id}:\n{e}",
+    async def render() -> str:
+        inference, question = await services.get_question_inference(
+            user_group_cd=user_group_cd, id=id, cursor=cursor
         )
-
-    inference = GetInferenceResponse(**inference_json)
-
-    try:
-        async with httpx.AsyncClient() as client:
-            params = {"user_group_cd": user_group_cd}
-            response = await client.get(
-                f"{BACKEND_URL}/read/question/{inference.question_id}", params=params
-            )
-            response.raise_for_status()
-            question_json = response.json()
-    except httpx.HTTPStatusError as e:
-        raise HTTPException(
-            status_code=e.response.status_code,
-            detail=f"Failed to fetch question ID {inference.question_id}:\n{e}",
+        question_page_response = QuestionInferencePageResponse.from_question_response(
+            question_response=question, inference=inference
+        )
+        return render_page(
+            request=request,
+            name="question_inference.html",
+            context={
+                "question": question_page_response,
+                "user_group_cd": user_group_cd,
+                "languages": LanguagePageResponse(
+                    current=lang,
+                    pack=language_manager.get_language_pack(language=lang).inference,
+                ),
+            },
         )
 
-    question = GetQuestionResponse(**question_json)
-    question_page_response = QuestionInferencePageResponse.from_question_response(
-        question_response=question, inference=inference
-    )
-
-    return templates.TemplateResponse(
-        "question_inference.html",
-        {
-            "request": request,
-            "question": question_page_response,
-            "user_group_cd": user_group_cd,
-            "languages": LanguagePageResponse(
-                current=lang,
-                pack=language_manager.get_language_pack(language=lang).inference,
-            ),
-        },
+    html = await PageCache.get_or_render(
+        render=render,
+        base_url=str(request.base_url),
+        template="question_inference.html",
+        user_group_cd=user_group_cd,
+        lang=lang,
+        ids=(id,),
     )
+    return HTMLResponse(html)
 
 
 @router.get(
@@ -217,23 +194,13 @@ async def question_inference(
 )
 async def question_detail(
     request: Request,
-    user_group_cd: str = Path(...),
+    user_group_cd: UserGroupCD = Depends(get_user_group_path),
     lang: Language = Depends(get_language_query),
+    cursor: cursor = Depends(get_db_cursor),
 ):
-    try:
-        async with httpx.AsyncClient() as client:
-            params = {"user_group_cd": user_group_cd}
-            response = await client.get(
-                f"{BACKEND_URL}/read/inferences/scores/all", params=params
-            )
-            response.raise_for_status()
-            scores_json = response.json()
-    except httpx.HTTPStatusError as e:
-        raise HTTPException(
-            status_code=e.response.status_code, detail=f"Failed to fetch scores"
-        )
-
-    scores_page_response = [GetInferenceScoreResponse(**score) for score in scores_json]
+    scores_page_response = await services.get_inference_scores(
+        user_group_cd=user_group_cd, cursor=cursor
+    )
 
     return templates.TemplateResponse(
         "inference_score_list.html",
@@ -256,21 +223,9 @@ async def question_detail(
 )
 async def dashboard(
     request: Request,
-    user_group_cd: str = Path(...),
+    user_group_cd: UserGroupCD = Depends(get_user_group_path),
     lang: Language = Depends(get_language_query),
 ):
-    try:
-        async with httpx.AsyncClient() as client:
-            params = {"user_group_cd": user_group_cd}
-            response = await client.get(
-                f"{BACKEND_URL}/read/users/group/verify", params=params
-            )
-            response.raise_for_status()
-    except httpx.HTTPStatusError as e:
-        raise HTTPException(
-            status_code=e.response.status_code, detail=f"Invalid User Group path:\n{e}"
-        )
-
     return templates.TemplateResponse(
         "dashboard.html",
         {
@@ -308,18 +263,12 @@ async def main(
 
 
 @router.get("/main", response_class=HTMLResponse, status_code=status.HTTP_200_OK)
-async def main(request: Request, lang: Language = Depends(get_language_query)):
-    logger.info("Attempting GET on " + f"{BACKEND_URL}/read/users/groups/all")
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{BACKEND_URL}/read/users/groups/all")
-            response.raise_for_status()
-            user_groups = response.json()
-    except httpx.HTTPStatusError as e:
-        raise HTTPException(
-            status_code=e.response.status_code,
-            detail=f"Failed to retrieve User Groups:\n{e}",
-        )
+async def main(
+    request: Request,
+    lang: Language = Depends(get_language_query),
+    cursor: cursor = Depends(get_db_cursor),
+):
+    user_groups = await services.get_user_groups(cursor=cursor)
 
     return templates.TemplateResponse(
         "main.html",
@@ -1,14 +1,26 @@
-from fastapi import APIRouter, Depends, status, Body, Path, Query
+from fastapi import APIRouter, Depends, status, Body, Path, Query, Header
 from fastapi.exceptions import HTTPException
 from fastapi.responses import StreamingResponse
 from psycopg2.extensions import cursor
-from io import StringIO
+import datetime
 from typing import List, Tuple, Optional
 from src.logger import LoggerFactory
 from src.config import settings
-from src.utils import validate_xml
-from src.types import UserGroupCD
-from src.api.deps import get_db_cursor, get_user_group_query
+from src.utils import validate_xml, parse_query_list, get_export_headers, negotiate_encoding
+from src.types import UserGroupCD, ExportFormat, ExportCompression
+from src.constraints import (
+    EXPORT_FORMATS,
+    DEFAULT_EXPORT_VALIDATION_RATIO,
+    DEFAULT_EXPORT_PREFERENCE_MARGIN,
+    DEFAULT_EXPORT_SHARD_MB,
+    EXPORT_SHARD_MAX_MB,
+)
+from src.api.deps import (
+    get_db_cursor,
+    get_export_db_cursor,
+    get_user_group_query,
+    get_auth_token,
+)
 from src.schemas import (
     GetQuestionResponse,
     QuestionsRandomIdResponse,
@@ -19,18 +31,37 @@ from src.schemas import (
     GetUserGroupResponse,
     MessageSuccessResponse,
     GetPromptResponse,
+    GetInferenceJobsStatsResponse,
+    GetCompletionCacheStatsResponse,
+    GetPageCacheStatsResponse,
+    GetModelUsageResponse,
+    GetPromptTemplateResponse,
 )
 from src.core import ingest_quiz_xml
+from src import services
 from src.database.crud import (
-    get_questions_all,
-    get_question,
-    get_random_question_id,
     get_models_all,
-    get_inference,
-    get_inference_scores_all,
-    get_user_groups_all,
+    get_models_usage,
+    get_inference_jobs_stats,
+    get_prompt_templates_all,
+    get_report_window_version,
+)
+from src.models.core import (
+    make_prompt,
+    get_report_window,
+    make_export_cursor,
+    stream_report,
+    stream_dataset,
 )
-from src.models.core import make_prompt, build_report_df, build_dataset_df
+from src.database.export import compress_stream
+from src.models.cache import CompletionCache
+from src.models.page_cache import PageCache
+from src.models.snapshots import ExportSnapshots
+from src.models.prompts import PromptRegistry
+from src.models.batch import load_batch_prompts, iter_batch_requests
+from src.models.preferences import get_split_question_ids, stream_preferences
+from src.models.constraints import DEFAULT_MODEL_TEMPERATURE
+from src.exceptions import InvalidQueryListException
 
 
 logger = LoggerFactory.getLogger(__name__)
@@ -50,8 +81,7 @@ async def questions_all(
     user_group_cd: UserGroupCD = Depends(get_user_group_query),
     cursor: cursor = Depends(get_db_cursor),
 ):
-    questions = await get_questions_all(user_group_cd=user_group_cd, cursor=cursor)
-    return questions
+    return await services.get_questions(user_group_cd=user_group_cd, cursor=cursor)
 
 
 @router.get(
@@ -66,13 +96,7 @@ async def question(
     user_group_cd: UserGroupCD = Depends(get_user_group_query),
     cursor: cursor = Depends(get_db_cursor),
 ):
-    question = await get_question(user_group_cd=user_group_cd, id=id, cursor=cursor)
-    if question is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Question does not exist in database or was deleted",
-        )
-    return question
+    return await services.get_question(user_group_cd=user_group_cd, id=id, cursor=cursor)
 
 
 @router.get(
@@ -85,12 +109,7 @@ async def questions_random_id(
     user_group_cd: UserGroupCD = Depends(get_user_group_query),
     cursor: cursor = Depends(get_db_cursor),
 ):
-    id = await get_random_question_id(user_group_cd=user_group_cd, cursor=cursor)
-    if id is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Empty Question ID was received: database error or empty",
-        )
+    id = await services.get_random_question_id(user_group_cd=user_group_cd, cursor=cursor)
     return QuestionsRandomIdResponse(id=id)
 
 
@@ -106,6 +125,21 @@ async def models_all(cursor: cursor = Depends(get_db_cursor)):
     return models
 
 
+@router.get(
+    "/models/usage",
+    response_model=List[GetModelUsageResponse],
+    status_code=status.HTTP_200_OK,
+    summary="Token usage, cost and latency per model",
+    description="Aggregated over generated inferences, cached ones are only counted. "
+    "Cost is computed from model prices per 1M tokens",
+)
+async def models_usage(
+    since: Optional[datetime.datetime] = Query(None, description="Only inferences created since"),
+    cursor: cursor = Depends(get_export_db_cursor),
+):
+    return await get_models_usage(cursor=cursor, since=since)
+
+
 @router.get(
     "/inference/{id}",
     response_model=GetInferenceResponse,
@@ -113,13 +147,7 @@ async def models_all(cursor: cursor = Depends(get_db_cursor)):
     summary="Fetch inference from database by ID",
 )
 async def inference(id: int, cursor: cursor = Depends(get_db_cursor)):
-    inference = await get_inference(id=id, cursor=cursor)
-    if inference is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Inference was not found: wrong ID or was deleted",
-        )
-    return inference
+    return await services.get_inference(id=id, cursor=cursor)
 
 
 @router.get(
@@ -132,7 +160,37 @@ async def inferences_scores_all(
     user_group_cd: UserGroupCD = Depends(get_user_group_query),
     cursor: cursor = Depends(get_db_cursor),
 ):
-    return await get_inference_scores_all(user_group_cd=user_group_cd, cursor=cursor)
+    return await services.get_inference_scores(user_group_cd=user_group_cd, cursor=cursor)
+
+
+@router.get(
+    "/inference/jobs/stats",
+    response_model=GetInferenceJobsStatsResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Inference job queue depth and throughput",
+)
+async def inference_jobs_stats(cursor: cursor = Depends(get_db_cursor)):
+    return await get_inference_jobs_stats(cursor=cursor)
+
+
+@router.get(
+    "/inference/cache/stats",
+    response_model=GetCompletionCacheStatsResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Completion cache size, hit rate and saved tokens",
+)
+async def inference_cache_stats(cursor: cursor = Depends(get_db_cursor)):
+    return await CompletionCache.get_stats(cursor=cursor)
+
+
+@router.get(
+    "/pages/cache/stats",
+    response_model=GetPageCacheStatsResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Rendered page cache size and hit rate of the worker serving the request",
+)
+async def pages_cache_stats():
+    return await PageCache.get_stats()
 
 
 @router.get(
@@ -142,7 +200,7 @@ async def inferences_scores_all(
     summary="Fetch all non-deleted User Groups from database",
 )
 async def users_groups_all(cursor: cursor = Depends(get_db_cursor)):
-    return await get_user_groups_all(cursor=cursor)
+    return await services.get_user_groups(cursor=cursor)
 
 
 @router.get(
@@ -167,24 +225,89 @@ async def users_groups_all(
     return await make_prompt(question_id=id, cursor=cursor)
 
 
+@router.get(
+    "/prompts/templates/all",
+    response_model=List[GetPromptTemplateResponse],
+    status_code=status.HTTP_200_OK,
+    summary="Fetch all prompt template versions, the latest one is active",
+)
+async def prompt_templates_all(cursor: cursor = Depends(get_db_cursor)):
+    return await get_prompt_templates_all(cursor=cursor)
+
+
 @router.get(
     "/report/csv",
     response_model=None,
     status_code=status.HTTP_200_OK,
     summary="Get a full report on questions, inference, scores in a CSV file",
+    description="format=parquet or arrow (Arrow IPC stream) returns typed, compressed columns instead. "
+    "For incremental syncs pass the X-Export-Cursor header of the previous export as cursor "
+    "(or a since timestamp): only scores created after it are returned. "
+    "Full reports carry an ETag, send it as If-None-Match to get 304 if nothing changed. "
+    "CSV is gzip/zstd encoded as the client accepts (Accept-Encoding), "
+    "compression returns a compressed file of any format instead",
 )
-async def report_csv(cursor: cursor = Depends(get_db_cursor)):
-    report_df = await build_report_df(cursor=cursor)
-    csv_buffer = StringIO()
-    report_df.to_csv(csv_buffer, index=False)
-    csv_buffer.seek(0)
-    return StreamingResponse(
-        csv_buffer,
-        media_type="text/csv",
-        headers={
-            "Content-Disposition": f"attachment; filename={settings.server.filenames.report_csv}"
-        },
+async def report_csv(
+    format: ExportFormat = Query("csv"),
+    since: Optional[datetime.datetime] = Query(None),
+    export_cursor: Optional[str] = Query(None, alias="cursor"),
+    compression: Optional[ExportCompression] = Query(None),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+    cursor: cursor = Depends(get_export_db_cursor),
+):
+    content_encoding = None
+    if compression is None:
+        content_encoding = negotiate_encoding(accept_encoding=accept_encoding, format=format)
+    headers = get_export_headers(
+        filename=settings.server.filenames.report_csv,
+        format=format,
+        compression=compression,
+        content_encoding=content_encoding,
     )
+    # Prompts stored here are committed by the dependency before the rows are streamed
+    await PromptRegistry.backfill_inference_prompts(cursor=cursor)
+    use_snapshot = since is None and export_cursor is None and ExportSnapshots.enabled()
+    since, until = await get_report_window(
+        since=since, export_cursor=export_cursor, cursor=cursor
+    )
+    if use_snapshot:
+        # The report is cut at the watermark: scores written since do not change it until
+        # they cross the watermark, which then has to change the ETag
+        etag = await ExportSnapshots.get_etag(
+            kind="report",
+            format=format,
+            params={
+                "compression": compression,
+                "content_encoding": content_encoding,
+                "scores": await get_report_window_version(until=until, cursor=cursor),
+            },
+            cursor=cursor,
+        )
+        response = ExportSnapshots.get_response(
+            kind="report", format=format, etag=etag, if_none_match=if_none_match, headers=headers
+        )
+        if response is not None:
+            return response
+
+    headers["X-Export-Cursor"] = make_export_cursor(until=until)
+    chunks = stream_report(
+        format=format,
+        since=since,
+        until=until,
+        statement_timeout=settings.postgres.get_statement_timeout("exports"),
+    )
+    chunks = compress_stream(chunks=chunks, codec=compression or content_encoding)
+    if use_snapshot:
+        chunks = ExportSnapshots.save(
+            chunks=chunks,
+            kind="report",
+            format=format,
+            etag=etag,
+            headers={"X-Export-Cursor": headers["X-Export-Cursor"]},
+        )
+        headers.update(ExportSnapshots.get_cache_headers(etag=etag))
+    return StreamingResponse(chunks, media_type=EXPORT_FORMATS[format][0], headers=headers)
 
 
 @router.get(
@@ -192,8 +315,19 @@ async def report_csv(cursor: cursor = Depends(get_db_cursor)):
     response_model=None,
     status_code=status.HTTP_200_OK,
     summary="Create a dataset from questions (without inferences/scores) in a CSV file",
+    description="format=parquet or arrow (Arrow IPC stream) returns typed, compressed columns instead. "
+    "Send the ETag of a previous download as If-None-Match to get 304 if nothing changed. "
+    "CSV is gzip/zstd encoded as the client accepts (Accept-Encoding), "
+    "compression returns a compressed file of any format instead",
 )
-async def dataset_csv(question_ids: Optional[str] = Query(None), cursor: cursor = Depends(get_db_cursor)):
+async def dataset_csv(
+    question_ids: Optional[str] = Query(None),
+    format: ExportFormat = Query("csv"),
+    compression: Optional[ExportCompression] = Query(None),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+    cursor: cursor = Depends(get_export_db_cursor),
+):
     question_ids_list = question_ids
     if question_ids is not None:
         cleaned_ids = question_ids.replace(" ", "")
@@ -202,14 +336,143 @@ async def dataset_csv(question_ids: Optional[str] = Query(None), cursor: cursor
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid input: all items must be integers")
     
-    dataset_df = await build_dataset_df(cursor=cursor, question_ids=question_ids_list)
-    csv_buffer = StringIO()
-    dataset_df.to_csv(csv_buffer, index=False)
-    csv_buffer.seek(0)
+    content_encoding = None
+    if compression is None:
+        content_encoding = negotiate_encoding(accept_encoding=accept_encoding, format=format)
+    headers = get_export_headers(
+        filename=settings.server.filenames.dataset_csv,
+        format=format,
+        compression=compression,
+        content_encoding=content_encoding,
+    )
+    # Prompts stored here are committed by the dependency before the rows are streamed
+    await PromptRegistry.refresh_prompts(cursor=cursor)
+    use_snapshot = ExportSnapshots.enabled()
+    if use_snapshot:
+        etag = await ExportSnapshots.get_etag(
+            kind="dataset",
+            format=format,
+            params={
+                "question_ids": question_ids_list,
+                "compression": compression,
+                "content_encoding": content_encoding,
+            },
+            cursor=cursor,
+        )
+        response = ExportSnapshots.get_response(
+            kind="dataset", format=format, etag=etag, if_none_match=if_none_match, headers=headers
+        )
+        if response is not None:
+            return response
+
+    chunks = stream_dataset(
+        question_ids=question_ids_list,
+        format=format,
+        statement_timeout=settings.postgres.get_statement_timeout("exports"),
+    )
+    chunks = compress_stream(chunks=chunks, codec=compression or content_encoding)
+    if use_snapshot:
+        chunks = ExportSnapshots.save(
+            chunks=chunks, kind="dataset", format=format, etag=etag, headers={}
+        )
+        headers.update(ExportSnapshots.get_cache_headers(etag=etag))
+    return StreamingResponse(chunks, media_type=EXPORT_FORMATS[format][0], headers=headers)
+
+
+@router.get(
+    "/preferences/jsonl",
+    response_model=None,
+    status_code=status.HTTP_200_OK,
+    summary="Export prompts, scored responses and chosen/rejected pairs for preference tuning",
+    description="A record per question prompt: chat messages, every scored response with its mean ratings, "
+    "the best and worst scored responses as chosen/rejected. Questions are split into train/validation "
+    "by hash. archive=true returns a zip of size capped shards (train-00000.jsonl, ...) and manifest.json, "
+    "otherwise one JSONL stream",
+)
+async def preferences_jsonl(
+    validation_ratio: float = Query(DEFAULT_EXPORT_VALIDATION_RATIO, ge=0, le=1),
+    min_margin: float = Query(
+        DEFAULT_EXPORT_PREFERENCE_MARGIN, ge=0, description="Min score difference of a pair"
+    ),
+    pairs_only: bool = Query(True, description="Skip prompts without a chosen/rejected pair"),
+    archive: bool = Query(True),
+    shard_mb: int = Query(DEFAULT_EXPORT_SHARD_MB, ge=1, le=EXPORT_SHARD_MAX_MB),
+    compression: Optional[ExportCompression] = Query(None),
+    accept_encoding: Optional[str] = Header(None),
+    cursor: cursor = Depends(get_export_db_cursor),
+):
+    split_question_ids = await get_split_question_ids(
+        validation_ratio=validation_ratio, cursor=cursor
+    )
+    # Prompts stored here are committed by the dependency before the rows are streamed
+    await PromptRegistry.backfill_inference_prompts(cursor=cursor)
+    chunks = stream_preferences(
+        split_question_ids=split_question_ids,
+        validation_ratio=validation_ratio,
+        min_margin=min_margin,
+        pairs_only=pairs_only,
+        shard_bytes=shard_mb * 1024 * 1024 if archive else None,
+        statement_timeout=settings.postgres.get_statement_timeout("exports"),
+    )
+    if archive:  # Compressed already
+        return StreamingResponse(
+            chunks,
+            media_type="application/zip",
+            headers=get_export_headers(filename=settings.server.filenames.preferences_zip),
+        )
+    content_encoding = None
+    if compression is None:
+        content_encoding = negotiate_encoding(accept_encoding=accept_encoding)
+    return StreamingResponse(
+        compress_stream(chunks=chunks, codec=compression or content_encoding),
+        media_type="application/jsonl",
+        headers=get_export_headers(
+            filename=settings.server.filenames.preferences_jsonl,
+            compression=compression,
+            content_encoding=content_encoding,
+        ),
+    )
+
+
+@router.get(
+    "/inference/batch/jsonl",
+    dependencies=[Depends(get_auth_token)],
+    response_model=None,
+    status_code=status.HTTP_200_OK,
+    summary="Export chat completion requests for a batch API or offline vLLM run",
+    description="One request per question x model x temperature, custom_id identifies the cell and prompt. "
+    "Import the results with POST /upload/inference/batch/jsonl. "
+    "gzip/zstd encoded as the client accepts (Accept-Encoding), compression returns a compressed file",
+)
+async def inference_batch_jsonl(
+    model_ids: str = Query(..., description="Comma separated model IDs"),
+    temperatures: Optional[str] = Query(None, description="Comma separated, default model temperature"),
+    question_ids: Optional[str] = Query(None, description="Comma separated, all questions if not set"),
+    compression: Optional[ExportCompression] = Query(None),
+    accept_encoding: Optional[str] = Header(None),
+    cursor: cursor = Depends(get_export_db_cursor),
+):
+    temperatures_list = parse_query_list(temperatures, item_type=float) or [DEFAULT_MODEL_TEMPERATURE]
+    if any(not 0 < temperature <= 1 for temperature in temperatures_list):
+        raise InvalidQueryListException("Invalid input: temperatures must be in (0, 1]")
+    models, prompts = await load_batch_prompts(
+        model_ids=parse_query_list(model_ids),
+        question_ids=parse_query_list(question_ids),
+        cursor=cursor,
+    )
+    cursor.close()  # Requests are built in memory, nothing to hold the connection for
+    content_encoding = None
+    if compression is None:
+        content_encoding = negotiate_encoding(accept_encoding=accept_encoding)
     return StreamingResponse(
-        csv_buffer,
-        media_type="text/csv",
-        headers={
-            "Content-Disposition": f"attachment; filename={settings.server.filenames.dataset_csv}"
-        },
+        compress_stream(
+            chunks=iter_batch_requests(models=models, prompts=prompts, temperatures=temperatures_list),
+            codec=compression or content_encoding,
+        ),
+        media_type="application/jsonl",
+        headers=get_export_headers(
+            filename=settings.server.filenames.batch_jsonl,
+            compression=compression,
+            content_encoding=content_encoding,
+        ),
     )
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, status, Body, Form
+from fastapi import APIRouter, Depends, status, Body, Form, Request
+from fastapi.responses import StreamingResponse
 from psycopg2.extensions import cursor
 from typing import Annotated
 from openai import AsyncClient
@@ -6,7 +7,15 @@ from typing import List
 from src.logger import LoggerFactory
 from src.config import settings
 from src.utils import validate_xml
-from src.api.deps import get_db_cursor, get_openai_client
+from src.api.deps import (
+    get_db_cursor,
+    get_admin_db_cursor,
+    get_upload_db_cursor,
+    get_openai_client,
+    get_openai_url,
+    get_openai_api_key,
+)
+from src.database.pool import LazyCursor
 from src.schemas import (
     MessageSuccessResponse,
     PostModelRequest,
@@ -18,6 +27,12 @@ from src.schemas import (
     PostUserGroupLevelAddRequest,
     PostSetUserGroupLevelRequest,
     PostQuizXMLResponse,
+    PostInferencesResponse,
+    PostInferenceJobsResponse,
+    PostInferenceSweepRequest,
+    PostInferenceSweepResponse,
+    PromptTemplate,
+    PostInferenceBatchImportResponse,
 )
 from src.core import ingest_quiz_xml
 from src.database.crud import (
@@ -27,8 +42,15 @@ from src.database.crud import (
     create_user_group,
     create_user_group_x_level_link,
     set_user_group_x_level_link,
+    create_inference_jobs,
+    create_inference_sweep_jobs,
 )
-from src.models.core import make_inference
+from src.models.core import make_inference, make_inferences, load_inference_context
+from src.models.streaming import stream_inference
+from src.models.clients import OpenAIClientRegistry
+from src.models.prompts import PromptRegistry
+from src.models.batch import import_batch_results
+from src.models.page_cache import PageCache
 from src.api.deps import get_auth_token
 from src.api.auth import renew_auth_token
 
@@ -46,7 +68,7 @@ router = APIRouter(tags=["upload"], prefix="")
     status_code=status.HTTP_201_CREATED,
     summary="Create/update a question difficulty level specification in database",
 )
-async def quiz_xml(level: QuestionLevel, cursor: cursor = Depends(get_db_cursor)):
+async def quiz_xml(level: QuestionLevel, cursor: cursor = Depends(get_admin_db_cursor)):
     await create_question_level(level=level, cursor=cursor)
     return MessageSuccessResponse(message="Level created/updated successfully")
 
@@ -59,7 +81,7 @@ async def quiz_xml(level: QuestionLevel, cursor: cursor = Depends(get_db_cursor)
     summary="Create/update a User Group in database",
 )
 async def users_group_new(
-    user_group: PostUserGroupRequest, cursor: cursor = Depends(get_db_cursor)
+    user_group: PostUserGroupRequest, cursor: cursor = Depends(get_admin_db_cursor)
 ):
     await create_user_group(group=user_group, cursor=cursor)
     return MessageSuccessResponse(message="User Group created/updated successfully")
@@ -73,9 +95,11 @@ async def users_group_new(
     summary="Add a question difficulty level a User Group is allowed to access",
 )
 async def users_group_level_add(
-    group_level: PostUserGroupLevelAddRequest, cursor: cursor = Depends(get_db_cursor)
+    group_level: PostUserGroupLevelAddRequest, cursor: LazyCursor = Depends(get_admin_db_cursor)
 ):
-    await create_user_group_x_level_link(group_level=group_level, cursor=cursor)
+    with cursor.transaction():
+        await create_user_group_x_level_link(group_level=group_level, cursor=cursor)
+    await PageCache.invalidate()  # Question lists of the User Group changed
     return MessageSuccessResponse(message="Level added to User Group successfully")
 
 
@@ -88,9 +112,11 @@ async def users_group_level_add(
 )
 async def users_group_level_set(
     group_levels: List[PostSetUserGroupLevelRequest],
-    cursor: cursor = Depends(get_db_cursor),
+    cursor: LazyCursor = Depends(get_admin_db_cursor),
 ):
-    await set_user_group_x_level_link(group_levels=group_levels, cursor=cursor)
+    with cursor.transaction():
+        await set_user_group_x_level_link(group_levels=group_levels, cursor=cursor)
+    await PageCache.invalidate()
     return MessageSuccessResponse(message="Levels set to User Groups successfully")
 
 
@@ -104,10 +130,12 @@ async def users_group_level_set(
 )
 async def quiz_xml(
     xml_data: str = Body(..., media_type="application/xml"),
-    cursor: cursor = Depends(get_db_cursor),
+    cursor: LazyCursor = Depends(get_admin_db_cursor),
 ):
     validate_xml(data=xml_data)
-    question_ids = await ingest_quiz_xml(xml_contents=xml_data, cursor=cursor)
+    with cursor.transaction():
+        question_ids = await ingest_quiz_xml(xml_contents=xml_data, cursor=cursor)
+    await PageCache.invalidate()
     return PostQuizXMLResponse(question_ids=question_ids, message="File processed successfully")
 
 
@@ -118,11 +146,25 @@ async def quiz_xml(
     status_code=status.HTTP_201_CREATED,
     summary="Upload new model specification",
 )
-async def models_new(model: PostModelRequest, cursor: cursor = Depends(get_db_cursor)):
+async def models_new(model: PostModelRequest, cursor: cursor = Depends(get_admin_db_cursor)):
     await create_model(model=model, cursor=cursor)
     return MessageSuccessResponse(message="Model created/updated successfully")
 
 
+@router.post(
+    "/prompts/template/new",
+    dependencies=[Depends(get_auth_token)],
+    response_model=MessageSuccessResponse,
+    status_code=status.HTTP_201_CREATED,
+    summary="Register a new prompt template version, it becomes active for new inferences",
+)
+async def prompt_template_new(
+    template: PromptTemplate, cursor: cursor = Depends(get_admin_db_cursor)
+):
+    version = await PromptRegistry.create_template(template=template, cursor=cursor)
+    return MessageSuccessResponse(message=f"Prompt template version {version} registered")
+
+
 @router.post(
     "/inference/new",
     dependencies=[Depends(get_auth_token)],
@@ -133,39 +175,155 @@ async def models_new(model: PostModelRequest, cursor: cursor = Depends(get_db_cu
 async def inference_new(
     body: PostInferenceRequest,
     openai_client: AsyncClient = Depends(get_openai_client),
-    cursor: cursor = Depends(get_db_cursor),
+    cursor: LazyCursor = Depends(get_admin_db_cursor),
 ):
-    await make_inference(
+    _, model_response = await make_inference(
         client=openai_client,
         model_id=body.model_id,
         question_id=body.question_id,
         cursor=cursor,
         temperature=body.temperature,
+        bypass_cache=body.bypass_cache,
     )
+    if model_response.cached:
+        return MessageSuccessResponse(message="Inference created successfully from cache")
     return MessageSuccessResponse(message="Inference created successfully")
 
 
+@router.post(
+    "/inference/new/stream",
+    dependencies=[Depends(get_auth_token)],
+    status_code=status.HTTP_200_OK,
+    summary="Create new AI inference streaming generation progress as Server-Sent Events",
+    description="Events: reasoning/response (text deltas), progress, done (inference_id) or error. "
+    "The inference is saved once generation completes",
+    response_class=StreamingResponse,
+)
+async def inference_new_stream(
+    body: PostInferenceRequest,
+    openai_url: str = Depends(get_openai_url),
+    openai_api_key: str = Depends(get_openai_api_key),
+    cursor: LazyCursor = Depends(get_admin_db_cursor),
+):
+    # Load before streaming starts so missing model/question is a regular 404
+    with cursor.transaction():
+        context = await load_inference_context(
+            model_id=body.model_id, question_id=body.question_id, cursor=cursor
+        )
+
+    async def events():
+        # Dependencies are torn down before the body is sent: the stream borrows its own client
+        async with OpenAIClientRegistry.use(
+            base_url=openai_url, api_key=openai_api_key
+        ) as client:
+            async for event in stream_inference(
+                client=client,
+                context=context,
+                temperature=body.temperature,
+                statement_timeout=settings.postgres.get_statement_timeout("admin"),
+            ):
+                yield event
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post(
     "/inferences/new",
     dependencies=[Depends(get_auth_token)],
-    response_model=MessageSuccessResponse,
+    response_model=PostInferencesResponse,
     status_code=status.HTTP_201_CREATED,
     summary="Create several new AI inferences based on question texts using a chosen models",
+    description="Inferences run concurrently and are saved as they complete, result is reported per request",
 )
 async def inferences_new(
     body: List[PostInferenceRequest],
     openai_client: AsyncClient = Depends(get_openai_client),
-    cursor: cursor = Depends(get_db_cursor),
 ):
-    for inference_request in body:
-        await make_inference(
-            client=openai_client,
-            model_id=inference_request.model_id,
-            question_id=inference_request.question_id,
-            cursor=cursor,
-            temperature=inference_request.temperature,
-        )
-    return MessageSuccessResponse(message="All Inferences created successfully")
+    results = await make_inferences(
+        client=openai_client,
+        inference_requests=body,
+        statement_timeout=settings.postgres.get_statement_timeout("admin"),
+    )
+    failed = sum(result.error is not None for result in results)
+    return PostInferencesResponse(
+        message=f"Created {len(results) - failed} of {len(results)} Inferences",
+        succeeded=len(results) - failed,
+        failed=failed,
+        cached=sum(result.cached for result in results),
+        results=results,
+    )
+
+
+@router.post(
+    "/inference/jobs/new",
+    dependencies=[Depends(get_auth_token)],
+    response_model=PostInferenceJobsResponse,
+    status_code=status.HTTP_201_CREATED,
+    summary="Queue AI inferences to be generated by background workers",
+    description="Jobs are persisted and retried with backoff, results land in the same table as /inference/new",
+)
+async def inference_jobs_new(
+    body: List[PostInferenceRequest],
+    openai_url: str = Depends(get_openai_url),
+    cursor: cursor = Depends(get_admin_db_cursor),
+):
+    job_ids = await create_inference_jobs(
+        inference_requests=body,
+        openai_url=openai_url,
+        max_attempts=settings.jobs.max_attempts,
+        cursor=cursor,
+    )
+    return PostInferenceJobsResponse(
+        message=f"Queued {len(job_ids)} inference jobs", job_ids=job_ids
+    )
+
+
+@router.post(
+    "/inference/batch/jsonl",
+    dependencies=[Depends(get_auth_token)],
+    response_model=PostInferenceBatchImportResponse,
+    status_code=status.HTTP_201_CREATED,
+    summary="Import batch API / offline vLLM results as inferences",
+    description="Accepts the output JSONL of requests exported by GET /read/inference/batch/jsonl. "
+    "The body is streamed and written with COPY, all or nothing. "
+    "Results already imported (same batch request ID) are skipped and counted as duplicates",
+    openapi_extra={
+        "requestBody": {"content": {"application/jsonl": {"schema": {"type": "string"}}}}
+    },
+)
+async def inference_batch_jsonl(
+    request: Request, cursor: LazyCursor = Depends(get_upload_db_cursor)
+):
+    with cursor.transaction():
+        result = await import_batch_results(chunks=request.stream(), cursor=cursor)
+    await PageCache.invalidate()
+    return result
+
+
+@router.post(
+    "/inference/sweep",
+    dependencies=[Depends(get_auth_token)],
+    response_model=PostInferenceSweepResponse,
+    status_code=status.HTTP_201_CREATED,
+    summary="Queue inferences missing from a questions x models x temperatures grid",
+    description="Stored inferences and pending/running jobs count towards `samples` per cell, "
+    "so repeating a sweep only queues what is still missing",
+)
+async def inference_sweep(
+    body: PostInferenceSweepRequest,
+    openai_url: str = Depends(get_openai_url),
+    cursor: cursor = Depends(get_admin_db_cursor),
+):
+    return await create_inference_sweep_jobs(
+        sweep=body,
+        openai_url=openai_url,
+        max_attempts=settings.jobs.max_attempts,
+        cursor=cursor,
+    )
 
 
 @router.post(
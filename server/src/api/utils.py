@@ -1,6 +1,19 @@
+from fastapi import Request
+from starlette.types import Message, Receive
+from contextlib import asynccontextmanager
+from collections import deque
+from typing import AsyncGenerator, Deque
+import asyncio
+import anyio
 from src.types import UserGroupCD
 from psycopg2.extensions import cursor
 from src.database.crud import get_user_groups_all
+from src.database.pool import LazyCursor
+from src.config import settings
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
 
 
 async def existing_user_group_cd(user_group_cd: UserGroupCD, cursor: cursor) -> bool:
@@ -8,3 +21,79 @@ async def existing_user_group_cd(user_group_cd: UserGroupCD, cursor: cursor) ->
     if user_group_cd in [user_group.user_group_cd for user_group in user_groups]:
         return True
     return False
+
+
+class DisconnectWatchingReceive:
+    """
+    ASGI receive of a request that can be checked for a client disconnect while the route
+    reads the body: messages taken off the channel by a check are kept for the route, not
+    dropped as Request.is_disconnected() does
+    """
+
+    def __init__(self, receive: Receive) -> None:
+        self._receive = receive
+        self._pending: Deque[Message] = deque()
+        self._receiving = False
+        self.disconnected = False
+
+    async def __call__(self) -> Message:
+        if self._pending:
+            return self._pending.popleft()
+        if self.disconnected:
+            return {"type": "http.disconnect"}
+        self._receiving = True
+        try:
+            message = await self._receive()
+        finally:
+            self._receiving = False
+        if message["type"] == "http.disconnect":
+            self.disconnected = True
+        return message
+
+    async def is_disconnected(self) -> bool:
+        # A route waiting for the body sees the disconnect itself (ClientDisconnect)
+        if self.disconnected or self._receiving:
+            return self.disconnected
+        message = None
+        with anyio.CancelScope() as scope:
+            scope.cancel()  # Take a message only if one is ready
+            message = await self._receive()
+        if message is not None:
+            if message["type"] == "http.disconnect":
+                self.disconnected = True
+            else:
+                self._pending.append(message)
+        return self.disconnected
+
+
+async def watch_disconnect(
+    request: Request, receive: DisconnectWatchingReceive, cursor: LazyCursor
+) -> None:
+    """Poll client connection state, cancel running query once the client is gone"""
+    while True:
+        if await receive.is_disconnected():
+            logger.warning(f"Client disconnected from {request.url.path}, cancelling query")
+            cursor.cancel()
+            return
+        await asyncio.sleep(settings.postgres.disconnect_poll_interval)
+
+
+@asynccontextmanager
+async def cancel_on_disconnect(
+    request: Request, cursor: LazyCursor
+) -> AsyncGenerator:
+    """
+    Cancel the query of cursor once the client disconnects. Only queries run off the event
+    loop can be cancelled while they run: the question list and its per-question queries,
+    inference scores, model usage and streamed exports. Others are short and refused from
+    the next execute().
+    """
+    receive = DisconnectWatchingReceive(receive=request.receive)
+    request._receive = receive  # The route reads the body through it
+    watcher = asyncio.create_task(
+        watch_disconnect(request=request, receive=receive, cursor=cursor)
+    )
+    try:
+        yield
+    finally:
+        watcher.cancel()
@@ -1,15 +1,21 @@
 import os
 from pydantic import Field, model_validator, field_validator
 from pydantic_settings import BaseSettings
-from typing import Optional, Union, Literal
+from typing import Optional, Union, Literal, Dict, List
 from src.constraints import (
     DEFAULT_LOG_LEVEL,
     DEFAULT_POOL_CONN_RETRIES,
     DEFAULT_POOL_CONN_RETRY_DELAY,
+    DEFAULT_STATEMENT_TIMEOUT_PAGES,
+    DEFAULT_STATEMENT_TIMEOUT_ADMIN,
+    DEFAULT_STATEMENT_TIMEOUT_EXPORTS,
+    DEFAULT_DISCONNECT_POLL_INTERVAL,
     DEFAULT_DEV_PORT,
     DEFAULT_DEV_HOST,
     DEFAULT_DEV_PROTOCOL,
     DEFAULT_FRONTEND_LANGUAGE,
+    DEFAULT_PAGE_CACHE_MAX_ENTRIES,
+    DEFAULT_PAGE_CACHE_TTL,
     DEFAULT_POSTGRES_HOST,
     DEFAULT_POSTGRES_PORT,
     DEFAULT_POSTGRES_DB,
@@ -17,6 +23,10 @@ from src.constraints import (
     DEFAULT_POSTGRES_PASSWORD,
     DEFAULT_POOL_MINCONN,
     DEFAULT_POOL_MAXCONN,
+    DEFAULT_POOL_GLOBAL_MAXCONN,
+    DEFAULT_WORKERS,
+    DEFAULT_POOL_STATS_PUBLISH_INTERVAL,
+    DEFAULT_POOL_STATS_EX,
     DEFAULT_REDIS_PASSWORD,
     DEFAULT_REDIS_USER,
     DEFAULT_REDIS_USER_PASSWORD,
@@ -27,10 +37,42 @@ from src.constraints import (
     DEFAULT_REDIS_EX,
     DEFAULT_FILENAME_REPORT_CSV,
     DEFAULT_FILENAME_DATASET_CSV,
+    DEFAULT_FILENAME_BATCH_JSONL,
+    DEFAULT_FILENAME_PREFERENCES_ZIP,
+    DEFAULT_FILENAME_PREFERENCES_JSONL,
+    DEFAULT_EXPORT_SNAPSHOT_MAX_FILES,
+    DEFAULT_INFERENCE_WORKERS,
+    DEFAULT_JOBS_POLL_INTERVAL,
+    DEFAULT_JOBS_LEASE,
+    DEFAULT_JOBS_MAX_ATTEMPTS,
+    DEFAULT_JOBS_BACKOFF_BASE,
+    DEFAULT_JOBS_BACKOFF_MAX,
+)
+from src.models.constraints import (
+    DEFAULT_OPENAI_BASE_URL,
+    DEFAULT_OPENAI_MAX_CONCURRENCY,
+    DEFAULT_OPENAI_HTTP2,
+    DEFAULT_OPENAI_REQUESTS_PER_MINUTE,
+    DEFAULT_OPENAI_TOKENS_PER_MINUTE,
+    DEFAULT_OPENAI_MAX_RETRIES,
+    DEFAULT_OPENAI_RETRY_BACKOFF_BASE,
+    DEFAULT_OPENAI_RETRY_BACKOFF_MAX,
+    DEFAULT_OPENAI_MAX_CONNECTIONS,
+    DEFAULT_OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    DEFAULT_OPENAI_KEEPALIVE_EXPIRY,
+    DEFAULT_OPENAI_TIMEOUT,
+    DEFAULT_OPENAI_CONNECT_TIMEOUT,
+    DEFAULT_OPENAI_CLIENT_IDLE_TTL,
+    DEFAULT_OPENAI_CLIENT_EVICT_INTERVAL,
+    DEFAULT_OPENAI_ENDPOINT_MAX_FAILURES,
+    DEFAULT_OPENAI_ENDPOINT_PROBE_INTERVAL,
+    DEFAULT_OPENAI_ENDPOINT_PROBE_TIMEOUT,
+    DEFAULT_COMPLETION_CACHE,
+    DEFAULT_COMPLETION_CACHE_TTL,
+    DEFAULT_COMPLETION_CACHE_MAX_ENTRIES,
 )
-from src.models.constraints import DEFAULT_OPENAI_BASE_URL
 from src.exceptions import PublicKeyMissingException
-from src.types import Language
+from src.types import Language, StatementClass
 
 
 # Database connection parameters
@@ -44,11 +86,43 @@ class PostgresSettings(BaseSettings):
     pool_conn_retry_delay: int = DEFAULT_POOL_CONN_RETRY_DELAY
     minconn: int = Field(DEFAULT_POOL_MINCONN, env="POOL_MINCONN")
     maxconn: int = Field(DEFAULT_POOL_MAXCONN, env="POOL_MAXCONN")
+    pool_global_maxconn: Optional[int] = Field(
+        DEFAULT_POOL_GLOBAL_MAXCONN, env="POOL_GLOBAL_MAXCONN"
+    )
+    web_concurrency: int = Field(DEFAULT_WORKERS, ge=1, env="WEB_CONCURRENCY")
+    pool_stats_publish_interval: int = DEFAULT_POOL_STATS_PUBLISH_INTERVAL
+    pool_stats_ex: int = DEFAULT_POOL_STATS_EX
+    statement_timeout_pages: int = Field(
+        DEFAULT_STATEMENT_TIMEOUT_PAGES, env="STATEMENT_TIMEOUT_PAGES"
+    )
+    statement_timeout_admin: int = Field(
+        DEFAULT_STATEMENT_TIMEOUT_ADMIN, env="STATEMENT_TIMEOUT_ADMIN"
+    )
+    statement_timeout_exports: int = Field(
+        DEFAULT_STATEMENT_TIMEOUT_EXPORTS, env="STATEMENT_TIMEOUT_EXPORTS"
+    )
+    disconnect_poll_interval: float = DEFAULT_DISCONNECT_POLL_INTERVAL
 
     @property
     def dsn(self) -> str:
         return f"postgresql://{self.user}:{self.password}@{self.host}:{self.port}/{self.dbname}"
 
+    @property
+    def worker_maxconn(self) -> int:
+        """Pool size of one worker: an even split of the global budget if it is set"""
+        if self.pool_global_maxconn is None:
+            return self.maxconn
+        worker_share = self.pool_global_maxconn // self.web_concurrency
+        return max(1, min(self.maxconn, worker_share))
+
+    @property
+    def worker_minconn(self) -> int:
+        return min(self.minconn, self.worker_maxconn)
+
+    def get_statement_timeout(self, statement_class: StatementClass) -> int:
+        """Statement timeout (ms) for an endpoint class, 0 disables the timeout"""
+        return getattr(self, f"statement_timeout_{statement_class}")
+
 
 class LoggingSettings(BaseSettings):
     log_level: str = Field(DEFAULT_LOG_LEVEL, env="LOG_LEVEL")
@@ -64,6 +138,9 @@ class LoggingSettings(BaseSettings):
 class Filenames(BaseSettings):
     report_csv: str = DEFAULT_FILENAME_REPORT_CSV
     dataset_csv: str = DEFAULT_FILENAME_DATASET_CSV
+    batch_jsonl: str = DEFAULT_FILENAME_BATCH_JSONL
+    preferences_zip: str = DEFAULT_FILENAME_PREFERENCES_ZIP
+    preferences_jsonl: str = DEFAULT_FILENAME_PREFERENCES_JSONL
 
 class ServerSettings(BaseSettings):
     protocol: Literal["http", "https"] = DEFAULT_DEV_PROTOCOL
@@ -114,12 +191,93 @@ class ServerSettings(BaseSettings):
 
 class OpenAISettings(BaseSettings):
     base_url: str = Field(DEFAULT_OPENAI_BASE_URL, env="OPENAI_BASE_URL")
+    max_concurrency: int = Field(
+        DEFAULT_OPENAI_MAX_CONCURRENCY, ge=1, env="OPENAI_MAX_CONCURRENCY"
+    )
+    # Per model name or base URL limits, e.g. {"deepseek-ai/DeepSeek-R1": 4}
+    concurrency_overrides: Dict[str, int] = Field(
+        default_factory=dict, env="OPENAI_CONCURRENCY_OVERRIDES"
+    )
+
+    # Provider quota per base URL and model, headers are used when not set
+    requests_per_minute: Optional[int] = Field(
+        DEFAULT_OPENAI_REQUESTS_PER_MINUTE, ge=1, env="OPENAI_REQUESTS_PER_MINUTE"
+    )
+    tokens_per_minute: Optional[int] = Field(
+        DEFAULT_OPENAI_TOKENS_PER_MINUTE, ge=1, env="OPENAI_TOKENS_PER_MINUTE"
+    )
+    max_retries: int = Field(DEFAULT_OPENAI_MAX_RETRIES, ge=0, env="OPENAI_MAX_RETRIES")
+    retry_backoff_base: float = DEFAULT_OPENAI_RETRY_BACKOFF_BASE
+    retry_backoff_max: float = DEFAULT_OPENAI_RETRY_BACKOFF_MAX
+    # Shared clients (connection pools) per base URL and API key
+    http2: bool = Field(DEFAULT_OPENAI_HTTP2, env="OPENAI_HTTP2")
+    max_connections: int = Field(
+        DEFAULT_OPENAI_MAX_CONNECTIONS, ge=1, env="OPENAI_MAX_CONNECTIONS"
+    )
+    max_keepalive_connections: int = Field(
+        DEFAULT_OPENAI_MAX_KEEPALIVE_CONNECTIONS, ge=0, env="OPENAI_MAX_KEEPALIVE_CONNECTIONS"
+    )
+    keepalive_expiry: float = DEFAULT_OPENAI_KEEPALIVE_EXPIRY
+    request_timeout: float = Field(DEFAULT_OPENAI_TIMEOUT, gt=0, env="OPENAI_TIMEOUT")
+    connect_timeout: float = DEFAULT_OPENAI_CONNECT_TIMEOUT
+    client_idle_ttl: float = DEFAULT_OPENAI_CLIENT_IDLE_TTL
+    client_evict_interval: float = DEFAULT_OPENAI_CLIENT_EVICT_INTERVAL
+    # OpenAI-compatible replicas per model name, e.g. {"Qwen/Qwen3-32B": ["http://vllm-1:8000/v1/", "http://vllm-2:8000/v1/"]}.
+    # Inferences of these models are balanced over the replicas, base_url/openai_url is not used
+    # Read from MODEL_ENDPOINTS and ENDPOINT_MAX_FAILURES (the field names)
+    model_endpoints: Dict[str, List[str]] = Field(default_factory=dict)
+    endpoint_max_failures: int = Field(DEFAULT_OPENAI_ENDPOINT_MAX_FAILURES, ge=1)
+    endpoint_probe_interval: float = DEFAULT_OPENAI_ENDPOINT_PROBE_INTERVAL
+    endpoint_probe_timeout: float = DEFAULT_OPENAI_ENDPOINT_PROBE_TIMEOUT
+    # Completion cache keyed by model, prompt messages and temperature
+    completion_cache: bool = Field(DEFAULT_COMPLETION_CACHE, env="COMPLETION_CACHE")
+    completion_cache_ttl: int = Field(
+        DEFAULT_COMPLETION_CACHE_TTL, ge=1, env="COMPLETION_CACHE_TTL"
+    )
+    completion_cache_max_entries: int = Field(
+        DEFAULT_COMPLETION_CACHE_MAX_ENTRIES, ge=1, env="COMPLETION_CACHE_MAX_ENTRIES"
+    )
+
+    def get_max_concurrency(self, base_url: str, model_name: str) -> int:
+        if model_name in self.concurrency_overrides:
+            return self.concurrency_overrides[model_name]
+        return self.concurrency_overrides.get(base_url, self.max_concurrency)
+
+
+class JobsSettings(BaseSettings):
+    inference_workers: int = Field(
+        DEFAULT_INFERENCE_WORKERS, ge=0, env="INFERENCE_WORKERS"
+    )
+    # Key used by background workers: jobs are not tied to a request carrying one
+    openai_api_key: Optional[str] = Field(None, env="OPENAI_API_KEY")
+    poll_interval: float = DEFAULT_JOBS_POLL_INTERVAL
+    lease: int = DEFAULT_JOBS_LEASE
+    max_attempts: int = DEFAULT_JOBS_MAX_ATTEMPTS
+    backoff_base: float = DEFAULT_JOBS_BACKOFF_BASE
+    backoff_max: float = DEFAULT_JOBS_BACKOFF_MAX
+
+
+class ExportsSettings(BaseSettings):
+    # Full exports are saved here once per data version and served from disk, None = disabled
+    export_snapshot_dir: Optional[str] = Field(None, env="EXPORT_SNAPSHOT_DIR")
+    export_snapshot_max_files: int = Field(
+        DEFAULT_EXPORT_SNAPSHOT_MAX_FILES, ge=1, env="EXPORT_SNAPSHOT_MAX_FILES"
+    )
+    # Internal nginx location serving export_snapshot_dir (X-Accel-Redirect), None = served by app
+    export_accel_redirect: Optional[str] = Field(None, env="EXPORT_ACCEL_REDIRECT")
 
 
 class FrontendSettings(BaseSettings):
     default_language: Language = Field(
         DEFAULT_FRONTEND_LANGUAGE, env="DEFAULT_FRONTEND_LANGUAGE"
     )
+    # Rendered student pages, 0 entries = disabled
+    page_cache_max_entries: int = Field(
+        DEFAULT_PAGE_CACHE_MAX_ENTRIES, ge=0, env="PAGE_CACHE_MAX_ENTRIES"
+    )
+    page_cache_ttl: int = Field(DEFAULT_PAGE_CACHE_TTL, ge=1, env="PAGE_CACHE_TTL")
+    # Also share rendered pages between workers through Redis
+    page_cache_redis: bool = Field(False, env="PAGE_CACHE_REDIS")
 
 
 class RedisSettings(BaseSettings):
@@ -142,6 +300,8 @@ class Settings(BaseSettings):
     logging: LoggingSettings = LoggingSettings()
     server: ServerSettings = ServerSettings()
     openai: OpenAISettings = OpenAISettings()
+    jobs: JobsSettings = JobsSettings()
+    exports: ExportsSettings = ExportsSettings()
     frontend: FrontendSettings = FrontendSettings()
     redis: RedisSettings = RedisSettings()
 
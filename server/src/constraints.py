@@ -13,6 +13,15 @@ DEFAULT_POOL_MINCONN = 2
 DEFAULT_POOL_MAXCONN = 20
 DEFAULT_POOL_CONN_RETRIES = 5
 DEFAULT_POOL_CONN_RETRY_DELAY = 10
+DEFAULT_POOL_GLOBAL_MAXCONN = None  # Total across all workers, None = no budget
+DEFAULT_WORKERS = 1
+DEFAULT_POOL_STATS_PUBLISH_INTERVAL = 5  # secs
+DEFAULT_POOL_STATS_EX = 15  # secs
+## Statement timeouts by endpoint class (ms)
+DEFAULT_STATEMENT_TIMEOUT_PAGES = 5000
+DEFAULT_STATEMENT_TIMEOUT_ADMIN = 60000
+DEFAULT_STATEMENT_TIMEOUT_EXPORTS = 600000
+DEFAULT_DISCONNECT_POLL_INTERVAL = 0.5  # secs
 
 # FastAPI application
 DEFAULT_DEV_PORT = 80
@@ -21,6 +30,66 @@ DEFAULT_DEV_PROTOCOL = "http"
 ## Filenames
 DEFAULT_FILENAME_REPORT_CSV = "report.csv"
 DEFAULT_FILENAME_DATASET_CSV = "dataset.csv"
+DEFAULT_FILENAME_BATCH_JSONL = "batch.jsonl"
+DEFAULT_FILENAME_PREFERENCES_ZIP = "preferences.zip"
+DEFAULT_FILENAME_PREFERENCES_JSONL = "preferences.jsonl"
+## Exports
+EXPORT_COPY_CHUNK_BYTES = 64 * 1024  # COPY output is sent in chunks of at least this size
+EXPORT_COPY_QUEUE_CHUNKS = 16  # Chunks buffered between the COPY thread and the response
+EXPORT_ROW_GROUP_ROWS = 10_000  # Rows per Parquet row group / Arrow record batch
+EXPORT_ARROW_COMPRESSION = "zstd"
+EXPORT_WATERMARK_LAG = 60  # secs, newer rows are left to the next incremental export
+EXPORT_CURSOR_VERSION = "v1"
+DEFAULT_EXPORT_SNAPSHOT_MAX_FILES = 20
+EXPORT_SNAPSHOT_TABLES = {  # Tables whose changes invalidate snapshots of an export
+    "report": (
+        "questions",
+        "answers_multichoice",
+        "answers_coderunner",
+        "test_cases",
+        "models",
+        "prompt_templates",
+        "questions_transformed",
+        "inference_scores",
+    ),
+    "dataset": (
+        "questions",
+        "answers_multichoice",
+        "answers_coderunner",
+        "test_cases",
+        "prompt_templates",
+    ),
+}
+EXPORT_FORMATS = {  # Format -> (media type, file extension)
+    "csv": ("text/csv", ".csv"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", ".arrows"),
+}
+EXPORT_COMPRESSIONS = {  # Codec -> (media type, file extension) of a compressed export file
+    "zstd": ("application/zstd", ".zst"),
+    "gzip": ("application/gzip", ".gz"),
+}  # In order of preference when negotiated with Accept-Encoding
+EXPORT_ENCODED_FORMATS = ("csv",)  # Parquet and Arrow are compressed already
+EXPORT_GZIP_LEVEL = 6  # zstd runs at the Arrow default level 1
+EXPORT_PREFERENCE_BATCH_ROWS = 500  # (question, prompt) records fetched at a time
+DEFAULT_EXPORT_VALIDATION_RATIO = 0.1
+DEFAULT_EXPORT_PREFERENCE_MARGIN = 0.5  # Min score difference of a chosen / rejected pair
+DEFAULT_EXPORT_SHARD_MB = 100  # Uncompressed JSONL per shard
+EXPORT_SHARD_MAX_MB = 1024  # Zip entries stay below the zip64 size limit
+EXPORT_SPLIT_SALT = "split-v1"  # Changing it reshuffles train / validation
+
+# Inference job queue
+DEFAULT_INFERENCE_WORKERS = 0  # Background workers per server process, 0 = disabled
+DEFAULT_JOBS_POLL_INTERVAL = 2  # secs
+DEFAULT_JOBS_LEASE = 900  # secs a claimed job stays locked to its worker, renewed while generating
+DEFAULT_JOBS_MAX_ATTEMPTS = 5
+DEFAULT_JOBS_BACKOFF_BASE = 10  # secs, doubled on every attempt
+DEFAULT_JOBS_BACKOFF_MAX = 1800  # secs
+INFERENCE_JOB_STATUSES = ("pending", "running", "done", "failed")
+MAX_INFERENCE_SWEEP_SAMPLES = 100  # Inferences per (question, model, temperature) cell
+INFERENCE_SWEEP_LOCK_ID = 360036  # Advisory lock: concurrent sweeps must not plan the same cells
+INFERENCE_BATCH_COPY_ROWS = 5000  # Imported batch results written per COPY
+INFERENCE_BATCH_MAX_ERRORS = 100  # Line errors reported back by a batch import
 
 # Questions
 QUESTION_MULTICHOICE_TYPES = ("multichoice", "multichoiceset")
@@ -32,6 +101,8 @@ KNOWN_QUESTION_TYPES = (
 
 # Frontend
 DEFAULT_FRONTEND_LANGUAGE = "ru"
+DEFAULT_PAGE_CACHE_MAX_ENTRIES = 1000  # Rendered pages kept by each worker
+DEFAULT_PAGE_CACHE_TTL = 600  # 10 min, bounds staleness if an invalidation misses Redis
 
 # Redis Session Storage
 DEFAULT_REDIS_HOST = "redis"
@@ -42,3 +113,6 @@ DEFAULT_REDIS_USER_PASSWORD = "my_user_password"
 DEFAULT_REDIS_POOL_SIZE = 20
 DEFAULT_REDIS_DB = 0
 DEFAULT_REDIS_EX = 900  # 15 min
+REDIS_POOL_STATS_KEY_PREFIX = "pool:worker:"
+REDIS_PAGE_CACHE_VERSION_KEY = "pages:version"
+REDIS_PAGE_CACHE_KEY_PREFIX = "pages:html:"
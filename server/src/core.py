@@ -11,6 +11,7 @@ from src.constraints import (
 from src.logger import LoggerFactory
 from src.utils import safe_deep_find
 from src.database.crud import update_db_state
+from src.models.prompts import PromptRegistry
 from src.exceptions import InvalidQuestionException
 from src.schemas import AnswerMultichoice, AnswerCoderunner, TestCase, Question
 
@@ -23,6 +24,7 @@ async def ingest_quiz_xml(xml_contents: str, cursor: cursor) -> List[int]:
     questions = extract_quiz_data(xml_contents=xml_contents)
     for question in questions:
         question_id = await update_db_state(question=question, cursor=cursor)
+        await PromptRegistry.store_question_prompt(question_id=question_id, cursor=cursor)
         affected_question_ids.append(question_id)
     return affected_question_ids
 
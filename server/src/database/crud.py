@@ -1,6 +1,10 @@
 from psycopg2.extensions import cursor
-from typing import List, Optional, Literal
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional, Literal, Dict, Any, Iterator, Tuple
+from io import StringIO
+import csv
 import datetime
+import json
 from src.logger import LoggerFactory
 from src.types import UserGroupCD
 from src.schemas import (
@@ -22,12 +26,23 @@ from src.schemas import (
     PostSetUserGroupLevelRequest,
     UserGroup,
     LLModelResponse,
+    PostInferenceRequest,
+    InferenceJob,
+    GetInferenceJobsStatsResponse,
+    GetCompletionCacheStatsResponse,
+    PostInferenceSweepRequest,
+    PostInferenceSweepResponse,
+    GetModelUsageResponse,
+    PromptTemplate,
+    GetPromptTemplateResponse,
+    Prompt,
 )
 from src.exceptions import AnswerMismatchException, UnauthorizedException
 from src.constraints import (
     QUESTION_MULTICHOICE_TYPES,
     QUESTION_CODERUNNER_TYPES,
     QUESTION_CLOZE_TYPES,
+    INFERENCE_SWEEP_LOCK_ID,
 )
 from src.utils import replace_and_append_options
 
@@ -155,7 +170,9 @@ async def get_questions_all(
                 ON q.level_cd = link.level_cd
             ;
     """
-    cursor.execute(select_query, (user_group_cd,))
+    # The page runs a query per question: all of them run off the event loop, so a client
+    # disconnect can cancel them and the loop keeps serving other requests meanwhile
+    await run_in_threadpool(cursor.execute, select_query, (user_group_cd,))
 
     question_records = cursor.fetchall()
     questions = []
@@ -288,7 +305,7 @@ async def get_answers_multichoice(
             AND deleted_flg = false
         ;
     """
-    cursor.execute(select_query, (question_id,))
+    await run_in_threadpool(cursor.execute, select_query, (question_id,))
     answer_records = cursor.fetchall()
     return [
         AnswerMultichoice(text=text, is_correct=is_correct, fraction=fraction)
@@ -309,7 +326,7 @@ async def get_answers_coderunner(
             AND deleted_flg = false
         ;
     """
-    cursor.execute(select_query, (question_id,))
+    await run_in_threadpool(cursor.execute, select_query, (question_id,))
     answer_records = cursor.fetchall()
     return [AnswerCoderunner(text=record[0]) for record in answer_records]
 
@@ -325,7 +342,7 @@ async def get_test_cases(question_id: int, cursor: cursor) -> List[TestCase]:
             AND deleted_flg = false
         ;
     """
-    cursor.execute(select_query, (question_id,))
+    await run_in_threadpool(cursor.execute, select_query, (question_id,))
     test_case_records = cursor.fetchall()
     return [
         TestCase(
@@ -359,18 +376,23 @@ async def get_random_question_id(
 
 async def create_model(model: PostModelRequest, cursor: cursor) -> int:
     upsert_query = """
-        INSERT INTO prod_storage.models (base_model_name, model_name, version)
-        VALUES (%(base_model_name)s, %(model_name)s, (SELECT COALESCE(MAX(version), -1) + 1 FROM prod_storage.models WHERE base_model_name = %(base_model_name)s))
+        INSERT INTO prod_storage.models (base_model_name, model_name, version, prompt_price, completion_price)
+        VALUES (%(base_model_name)s, %(model_name)s, (SELECT COALESCE(MAX(version), -1) + 1 FROM prod_storage.models WHERE base_model_name = %(base_model_name)s), %(prompt_price)s, %(completion_price)s)
         ON CONFLICT ON CONSTRAINT models_source_key_unique DO UPDATE
         SET 
             model_name = %(model_name)s,
+            prompt_price = COALESCE(%(prompt_price)s, prod_storage.models.prompt_price),
+            completion_price = COALESCE(%(completion_price)s, prod_storage.models.completion_price),
             updated_at = CURRENT_TIMESTAMP,
             deleted_flg = false
         RETURNING id
         ;
     """
     cursor.execute(
-        upsert_query, model.model_dump(include={"base_model_name", "model_name"})
+        upsert_query,
+        model.model_dump(
+            include={"base_model_name", "model_name", "prompt_price", "completion_price"}
+        ),
     )
     model_id = cursor.fetchone()[0]
     return model_id
@@ -392,6 +414,82 @@ async def get_models_all(cursor: cursor) -> List[GetModelResponse]:
     ]
 
 
+async def get_models_usage(
+    cursor: cursor, since: Optional[datetime.datetime] = None
+) -> List[GetModelUsageResponse]:
+    select_query = """
+        SELECT
+            m.id,
+            m.model_name,
+            COUNT(t.id) FILTER (WHERE NOT t.cached) AS inferences,
+            COUNT(t.id) FILTER (WHERE t.cached) AS cached_inferences,
+            COALESCE(SUM(t.prompt_tokens) FILTER (WHERE NOT t.cached), 0) AS prompt_tokens,
+            COALESCE(SUM(t.completion_tokens) FILTER (WHERE NOT t.cached), 0) AS completion_tokens,
+            COALESCE(SUM(t.reasoning_tokens) FILTER (WHERE NOT t.cached), 0) AS reasoning_tokens,
+            (
+                COALESCE(SUM(t.prompt_tokens) FILTER (WHERE NOT t.cached), 0) * m.prompt_price
+                + COALESCE(SUM(t.completion_tokens) FILTER (WHERE NOT t.cached), 0) * m.completion_price
+            ) / 1000000 AS cost,
+            AVG(t.latency_ms) FILTER (WHERE NOT t.cached) AS avg_latency_ms,
+            PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY t.latency_ms) FILTER (WHERE NOT t.cached) AS p50_latency_ms,
+            PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY t.latency_ms) FILTER (WHERE NOT t.cached) AS p95_latency_ms,
+            PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY t.ttft_ms) FILTER (WHERE NOT t.cached) AS p50_ttft_ms,
+            PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY t.ttft_ms) FILTER (WHERE NOT t.cached) AS p95_ttft_ms,
+            SUM(t.completion_tokens) FILTER (WHERE NOT t.cached AND t.latency_ms > 0) * 1000.0
+                / NULLIF(SUM(t.latency_ms) FILTER (
+                    WHERE NOT t.cached AND t.latency_ms > 0 AND t.completion_tokens IS NOT NULL
+                ), 0) AS completion_tokens_per_sec
+        FROM
+            prod_storage.models AS m
+            LEFT JOIN prod_storage.questions_transformed AS t
+                ON t.model_id = m.id
+                AND t.deleted_flg = false
+                AND (%(since)s::TIMESTAMP IS NULL OR t.created_at >= %(since)s::TIMESTAMP)
+        WHERE
+            m.deleted_flg = false
+        GROUP BY
+            m.id, m.model_name, m.prompt_price, m.completion_price
+        ORDER BY
+            m.id
+        ;
+    """
+    await run_in_threadpool(cursor.execute, select_query, {"since": since})
+    return [
+        GetModelUsageResponse(
+            model_id=model_id,
+            model_name=model_name,
+            inferences=inferences,
+            cached_inferences=cached_inferences,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            reasoning_tokens=reasoning_tokens,
+            cost=cost,
+            avg_latency_ms=avg_latency_ms,
+            p50_latency_ms=p50_latency_ms,
+            p95_latency_ms=p95_latency_ms,
+            p50_ttft_ms=p50_ttft_ms,
+            p95_ttft_ms=p95_ttft_ms,
+            completion_tokens_per_sec=completion_tokens_per_sec,
+        )
+        for (
+            model_id,
+            model_name,
+            inferences,
+            cached_inferences,
+            prompt_tokens,
+            completion_tokens,
+            reasoning_tokens,
+            cost,
+            avg_latency_ms,
+            p50_latency_ms,
+            p95_latency_ms,
+            p50_ttft_ms,
+            p95_ttft_ms,
+            completion_tokens_per_sec,
+        ) in cursor.fetchall()
+    ]
+
+
 async def get_model(id: int, cursor: cursor) -> Optional[GetModelResponse]:
     select_query = "SELECT id, base_model_name, model_name, version FROM prod_storage.models WHERE id = %s AND deleted_flg = false;"
     cursor.execute(select_query, (id,))
@@ -405,41 +503,852 @@ async def get_model(id: int, cursor: cursor) -> Optional[GetModelResponse]:
 
 
 async def create_inference(
-    question_id: int, model_id: int, inference: LLModelResponse, cursor: cursor
+    question_id: int,
+    model_id: int,
+    inference: LLModelResponse,
+    cursor: cursor,
+    prompt_id: Optional[int] = None,
+    prompt_template_version: Optional[int] = None,
 ) -> int:
     insert_query = """
         INSERT INTO prod_storage.questions_transformed
-            (question_id, model_id, thinking, text, temperature)
+            (question_id, model_id, thinking, text, temperature,
+             prompt_tokens, completion_tokens, reasoning_tokens, ttft_ms, latency_ms, cached,
+             prompt_id, prompt_template_version)
         VALUES
-            (%(question_id)s, %(model_id)s, %(reasoning)s, %(response)s, %(temperature)s)
+            (%(question_id)s, %(model_id)s, %(reasoning)s, %(response)s, %(temperature)s,
+             %(prompt_tokens)s, %(completion_tokens)s, %(reasoning_tokens)s, %(ttft_ms)s, %(latency_ms)s, %(cached)s,
+             %(prompt_id)s, %(prompt_template_version)s)
         RETURNING id
         ;
     """
-    data = inference.model_dump(include={"reasoning", "response", "temperature"})
+    data = inference.model_dump(
+        include={
+            "reasoning",
+            "response",
+            "temperature",
+            "prompt_tokens",
+            "completion_tokens",
+            "reasoning_tokens",
+            "ttft_ms",
+            "latency_ms",
+            "cached",
+        }
+    )
     if "reasoning" not in data:
         data["reasoning"] = None
     data["question_id"] = question_id
     data["model_id"] = model_id
+    data["prompt_id"] = prompt_id
+    data["prompt_template_version"] = prompt_template_version
     cursor.execute(insert_query, data)
     inference_id = cursor.fetchone()[0]
     return inference_id
 
 
 async def get_inference(id: int, cursor: cursor) -> Optional[GetInferenceResponse]:
-    select_query = "SELECT id, question_id, model_id, thinking, text FROM prod_storage.questions_transformed WHERE id = %s AND deleted_flg = false;"
+    select_query = "SELECT id, question_id, model_id, thinking, text, prompt_id, prompt_template_version FROM prod_storage.questions_transformed WHERE id = %s AND deleted_flg = false;"
     cursor.execute(select_query, (id,))
     record = cursor.fetchone()
     if record is None:
         return None
-    id, question_id, model_id, thinking, text = record
+    id, question_id, model_id, thinking, text, prompt_id, prompt_template_version = record
     return GetInferenceResponse(
-        id=id, question_id=question_id, model_id=model_id, thinking=thinking, text=text
+        id=id,
+        question_id=question_id,
+        model_id=model_id,
+        thinking=thinking,
+        text=text,
+        prompt_id=prompt_id,
+        prompt_template_version=prompt_template_version,
+    )
+
+
+async def copy_batch_inferences(rows: List[tuple], cursor: cursor) -> Tuple[int, int]:
+    """
+    Bulk insert batch results with COPY through a staging table. Rows of unknown or
+    deleted questions/models are dropped, unknown prompt IDs are stored as NULL,
+    rows whose batch request ID is already stored are skipped.
+    Row: (question_id, model_id, thinking, text, temperature,
+          prompt_tokens, completion_tokens, reasoning_tokens, prompt_id, batch_request_id).
+    Returns the number of inserted rows and of already imported rows.
+    """
+    cursor.execute(
+        """
+        CREATE TEMPORARY TABLE IF NOT EXISTS batch_inferences (
+            question_id INT,
+            model_id INT,
+            thinking TEXT,
+            text TEXT,
+            temperature FLOAT,
+            prompt_tokens INT,
+            completion_tokens INT,
+            reasoning_tokens INT,
+            prompt_id INT,
+            batch_request_id TEXT
+        ) ON COMMIT DROP
+        ;
+        TRUNCATE batch_inferences;
+        """
+    )
+    buffer = StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(
+        "COPY batch_inferences FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (text));",
+        buffer,
+    )
+    insert_query = """
+        WITH known AS (
+            SELECT
+                b.question_id, b.model_id, b.thinking, b.text, b.temperature,
+                b.prompt_tokens, b.completion_tokens, b.reasoning_tokens,
+                p.id AS prompt_id, p.template_version, b.batch_request_id
+            FROM
+                batch_inferences AS b
+                INNER JOIN prod_storage.questions AS q
+                    ON q.id = b.question_id AND q.deleted_flg = false
+                INNER JOIN prod_storage.models AS m
+                    ON m.id = b.model_id AND m.deleted_flg = false
+                LEFT JOIN prod_storage.prompts AS p
+                    ON p.id = b.prompt_id
+        ),
+        inserted AS (
+            INSERT INTO prod_storage.questions_transformed
+                (question_id, model_id, thinking, text, temperature,
+                 prompt_tokens, completion_tokens, reasoning_tokens, prompt_id,
+                 prompt_template_version, batch_request_id)
+            SELECT * FROM known
+            ON CONFLICT (batch_request_id) WHERE batch_request_id IS NOT NULL DO NOTHING
+            RETURNING 1
+        )
+        SELECT
+            (SELECT COUNT(*) FROM inserted),
+            (SELECT COUNT(*) FROM known) - (SELECT COUNT(*) FROM inserted)
+        ;
+    """
+    cursor.execute(insert_query)
+    inserted, duplicates = cursor.fetchone()
+    return inserted, duplicates
+
+
+async def create_prompt_template(template: PromptTemplate, hash: str, cursor: cursor) -> int:
+    """Register a template version, an already known template keeps its version"""
+    insert_query = """
+        INSERT INTO prod_storage.prompt_templates
+            (hash, system_prompt, multichoice, coderunner, other)
+        VALUES
+            (%(hash)s, %(system_prompt)s, %(multichoice)s, %(coderunner)s, %(other)s)
+        ON CONFLICT (hash) DO UPDATE
+        SET
+            deleted_flg = false
+        RETURNING version
+        ;
+    """
+    data = template.model_dump(include={"system_prompt", "multichoice", "coderunner", "other"})
+    data["hash"] = hash
+    cursor.execute(insert_query, data)
+    return cursor.fetchone()[0]
+
+
+async def get_active_prompt_template(cursor: cursor) -> Optional[GetPromptTemplateResponse]:
+    select_query = """
+        SELECT version, system_prompt, multichoice, coderunner, other, created_at
+        FROM prod_storage.prompt_templates
+        WHERE deleted_flg = false
+        ORDER BY version DESC
+        LIMIT 1
+        ;
+    """
+    cursor.execute(select_query)
+    record = cursor.fetchone()
+    if record is None:
+        return None
+    version, system_prompt, multichoice, coderunner, other, created_at = record
+    return GetPromptTemplateResponse(
+        version=version,
+        system_prompt=system_prompt,
+        multichoice=multichoice,
+        coderunner=coderunner,
+        other=other,
+        created_at=created_at,
+    )
+
+
+async def get_prompt_template_by_hash(
+    hash: str, cursor: cursor
+) -> Optional[GetPromptTemplateResponse]:
+    """Registered template with the given content hash, deleted or not"""
+    select_query = """
+        SELECT version, system_prompt, multichoice, coderunner, other, created_at
+        FROM prod_storage.prompt_templates
+        WHERE hash = %s
+        ;
+    """
+    cursor.execute(select_query, (hash,))
+    record = cursor.fetchone()
+    if record is None:
+        return None
+    version, system_prompt, multichoice, coderunner, other, created_at = record
+    return GetPromptTemplateResponse(
+        version=version,
+        system_prompt=system_prompt,
+        multichoice=multichoice,
+        coderunner=coderunner,
+        other=other,
+        created_at=created_at,
+    )
+
+
+async def get_prompt_templates_all(cursor: cursor) -> List[GetPromptTemplateResponse]:
+    select_query = """
+        SELECT version, system_prompt, multichoice, coderunner, other, created_at
+        FROM prod_storage.prompt_templates
+        WHERE deleted_flg = false
+        ORDER BY version
+        ;
+    """
+    cursor.execute(select_query)
+    return [
+        GetPromptTemplateResponse(
+            version=version,
+            system_prompt=system_prompt,
+            multichoice=multichoice,
+            coderunner=coderunner,
+            other=other,
+            created_at=created_at,
+        )
+        for version, system_prompt, multichoice, coderunner, other, created_at in cursor.fetchall()
+    ]
+
+
+async def get_prompt(
+    question_hash: str, template_version: int, cursor: cursor
+) -> Optional[Prompt]:
+    select_query = """
+        SELECT id, messages
+        FROM prod_storage.prompts
+        WHERE question_hash = %s AND template_version = %s
+        ;
+    """
+    cursor.execute(select_query, (question_hash, template_version))
+    record = cursor.fetchone()
+    if record is None:
+        return None
+    id, messages = record
+    return Prompt(
+        id=id,
+        question_hash=question_hash,
+        template_version=template_version,
+        messages=messages,
+    )
+
+
+async def get_prompts_by_ids(ids: List[int], cursor: cursor) -> Dict[int, Prompt]:
+    select_query = """
+        SELECT id, question_hash, template_version, messages
+        FROM prod_storage.prompts
+        WHERE id = ANY(%s::INT[])
+        ;
+    """
+    cursor.execute(select_query, (list(ids),))
+    return {
+        id: Prompt(
+            id=id,
+            question_hash=question_hash,
+            template_version=template_version,
+            messages=messages,
+        )
+        for id, question_hash, template_version, messages in cursor.fetchall()
+    }
+
+
+async def create_prompt(
+    question_hash: str, template_version: int, messages: List[Dict[str, str]], cursor: cursor
+) -> Prompt:
+    """Store a rendered prompt. If a concurrent transaction stored it first, that row is returned"""
+    insert_query = """
+        INSERT INTO prod_storage.prompts
+            (question_hash, template_version, messages)
+        VALUES
+            (%(question_hash)s, %(template_version)s, %(messages)s::JSONB)
+        ON CONFLICT (question_hash, template_version) DO UPDATE
+        SET
+            messages = prod_storage.prompts.messages
+        RETURNING id, messages
+        ;
+    """
+    cursor.execute(
+        insert_query,
+        {
+            "question_hash": question_hash,
+            "template_version": template_version,
+            "messages": json.dumps(messages, ensure_ascii=False),
+        },
+    )
+    id, messages = cursor.fetchone()
+    return Prompt(
+        id=id,
+        question_hash=question_hash,
+        template_version=template_version,
+        messages=messages,
+    )
+
+
+async def set_question_prompt(question_id: int, prompt: Prompt, cursor: cursor) -> None:
+    """Store the prompt of the question with the active template"""
+    update_query = """
+        UPDATE prod_storage.questions
+        SET prompt_id = %(prompt_id)s
+        WHERE id = %(question_id)s AND prompt_id IS DISTINCT FROM %(prompt_id)s
+        ;
+    """
+    cursor.execute(update_query, {"question_id": question_id, "prompt_id": prompt.id})
+
+
+async def get_questions_missing_prompt(cursor: cursor) -> List[int]:
+    """
+    Questions with inferences generated before prompts were stored. Batch imported
+    inferences are left out: their prompt is known from the batch or not at all
+    """
+    select_query = """
+        SELECT DISTINCT qt.question_id
+        FROM
+            prod_storage.questions_transformed AS qt
+            INNER JOIN prod_storage.questions AS q
+                ON q.id = qt.question_id AND q.deleted_flg = false
+        WHERE
+            qt.prompt_id IS NULL
+            AND qt.batch_request_id IS NULL
+            AND qt.deleted_flg = false
+        ORDER BY qt.question_id
+        ;
+    """
+    cursor.execute(select_query)
+    return [record[0] for record in cursor.fetchall()]
+
+
+async def set_inference_prompts(question_id: int, prompt: Prompt, cursor: cursor) -> int:
+    """Record prompt on the question's inferences generated before prompts were stored"""
+    update_query = """
+        UPDATE prod_storage.questions_transformed
+        SET
+            prompt_id = %(prompt_id)s,
+            prompt_template_version = %(template_version)s
+        WHERE
+            question_id = %(question_id)s
+            AND prompt_id IS NULL
+            AND batch_request_id IS NULL
+            AND deleted_flg = false
+        ;
+    """
+    cursor.execute(
+        update_query,
+        {
+            "question_id": question_id,
+            "prompt_id": prompt.id,
+            "template_version": prompt.template_version,
+        },
+    )
+    return cursor.rowcount
+
+
+async def get_question_prompts(
+    question_ids: Optional[List[int]], cursor: cursor
+) -> List[Tuple[int, Prompt]]:
+    """(question ID, stored prompt) of question_ids in the given order, else of all questions"""
+    select_query = """
+        SELECT q.id, p.id, p.question_hash, p.template_version, p.messages
+        FROM
+            prod_storage.questions AS q
+            INNER JOIN prod_storage.prompts AS p
+                ON p.id = q.prompt_id
+            LEFT JOIN UNNEST(%(question_ids)s::INT[]) WITH ORDINALITY AS d (question_id, idx)
+                ON d.question_id = q.id
+        WHERE
+            q.deleted_flg = false
+            AND (%(question_ids)s::INT[] IS NULL OR d.idx IS NOT NULL)
+        ORDER BY d.idx, q.id
+        ;
+    """
+    cursor.execute(select_query, {"question_ids": question_ids})
+    return [
+        (
+            question_id,
+            Prompt(
+                id=id,
+                question_hash=question_hash,
+                template_version=template_version,
+                messages=messages,
+            ),
+        )
+        for question_id, id, question_hash, template_version, messages in cursor.fetchall()
+    ]
+
+
+async def get_questions_stale_prompt(template_version: int, cursor: cursor) -> List[int]:
+    """Questions whose stored prompt is missing or was rendered with another template version"""
+    select_query = """
+        SELECT q.id
+        FROM
+            prod_storage.questions AS q
+            LEFT JOIN prod_storage.prompts AS p
+                ON p.id = q.prompt_id
+        WHERE
+            q.deleted_flg = false
+            AND (p.id IS NULL OR p.template_version <> %(template_version)s)
+        ORDER BY q.id
+        ;
+    """
+    cursor.execute(select_query, {"template_version": template_version})
+    return [record[0] for record in cursor.fetchall()]
+
+
+async def create_inference_jobs(
+    inference_requests: List[PostInferenceRequest],
+    openai_url: Optional[str],
+    max_attempts: int,
+    cursor: cursor,
+) -> List[int]:
+    """
+    Queue a job per request. Requests repeating a (question, model, temperature) cell are
+    samples: they bypass the completion cache, or they would all get the same completion.
+    """
+    insert_query = """
+        INSERT INTO prod_storage.inference_jobs
+            (question_id, model_id, temperature, bypass_cache, openai_url, max_attempts)
+        SELECT
+            question_id,
+            model_id,
+            temperature,
+            bypass_cache OR COUNT(*) OVER (PARTITION BY question_id, model_id, temperature) > 1,
+            %(openai_url)s,
+            %(max_attempts)s
+        FROM
+            UNNEST(
+                %(question_ids)s::INT[],
+                %(model_ids)s::INT[],
+                %(temperatures)s::FLOAT[],
+                %(bypass_caches)s::BOOLEAN[]
+            ) WITH ORDINALITY AS t (question_id, model_id, temperature, bypass_cache, idx)
+        ORDER BY idx
+        RETURNING id
+        ;
+    """
+    cursor.execute(
+        insert_query,
+        {
+            "openai_url": openai_url,
+            "max_attempts": max_attempts,
+            "question_ids": [request.question_id for request in inference_requests],
+            "model_ids": [request.model_id for request in inference_requests],
+            "temperatures": [request.temperature for request in inference_requests],
+            "bypass_caches": [request.bypass_cache for request in inference_requests],
+        },
+    )
+    return [record[0] for record in cursor.fetchall()]
+
+
+async def create_inference_sweep_jobs(
+    sweep: PostInferenceSweepRequest,
+    openai_url: Optional[str],
+    max_attempts: int,
+    cursor: cursor,
+) -> PostInferenceSweepResponse:
+    """
+    Enqueue jobs only for the samples each (question, model, temperature) cell is missing,
+    counting stored inferences and jobs still pending/running. Reruns are incremental.
+    Cached inferences repeat an earlier completion, so they do not count as samples and
+    sweep jobs bypass the completion cache.
+    """
+    # Serialize sweeps: the next one only plans after this transaction's jobs are visible
+    cursor.execute("SELECT pg_advisory_xact_lock(%s);", (INFERENCE_SWEEP_LOCK_ID,))
+    sweep_query = """
+        WITH cells AS (
+            SELECT
+                q.id AS question_id,
+                m.id AS model_id,
+                t.temperature
+            FROM
+                prod_storage.questions AS q
+                CROSS JOIN prod_storage.models AS m
+                CROSS JOIN UNNEST(%(temperatures)s::FLOAT[]) AS t (temperature)
+            WHERE
+                q.deleted_flg = false
+                AND m.deleted_flg = false
+                AND m.id = ANY(%(model_ids)s::INT[])
+                AND (%(question_ids)s::INT[] IS NULL OR q.id = ANY(%(question_ids)s::INT[]))
+                AND (%(question_types)s::TEXT[] IS NULL OR q.type = ANY(%(question_types)s::TEXT[]))
+                AND (%(level_cds)s::TEXT[] IS NULL OR q.level_cd = ANY(%(level_cds)s::TEXT[]))
+        ),
+        existing AS (
+            SELECT question_id, model_id, temperature, COUNT(*) AS cnt
+            FROM prod_storage.questions_transformed
+            WHERE
+                deleted_flg = false
+                AND cached = false
+                AND model_id = ANY(%(model_ids)s::INT[])
+                AND temperature = ANY(%(temperatures)s::FLOAT[])
+            GROUP BY question_id, model_id, temperature
+        ),
+        queued AS (
+            SELECT question_id, model_id, temperature, COUNT(*) AS cnt
+            FROM prod_storage.inference_jobs
+            WHERE
+                status IN ('pending', 'running')
+                AND model_id = ANY(%(model_ids)s::INT[])
+                AND temperature = ANY(%(temperatures)s::FLOAT[])
+            GROUP BY question_id, model_id, temperature
+        ),
+        plan AS (
+            SELECT
+                c.question_id,
+                c.model_id,
+                c.temperature,
+                LEAST(COALESCE(e.cnt, 0), %(samples)s) AS existing,
+                COALESCE(j.cnt, 0) AS queued,
+                GREATEST(%(samples)s - COALESCE(e.cnt, 0) - COALESCE(j.cnt, 0), 0) AS missing
+            FROM
+                cells AS c
+                LEFT JOIN existing AS e USING (question_id, model_id, temperature)
+                LEFT JOIN queued AS j USING (question_id, model_id, temperature)
+        ),
+        inserted AS (
+            INSERT INTO prod_storage.inference_jobs
+                (question_id, model_id, temperature, bypass_cache, openai_url, max_attempts)
+            SELECT
+                p.question_id, p.model_id, p.temperature, true, %(openai_url)s, %(max_attempts)s
+            FROM
+                plan AS p
+                CROSS JOIN LATERAL generate_series(1, p.missing) AS sample
+            WHERE NOT %(dry_run)s
+            RETURNING id
+        )
+        SELECT
+            (SELECT COUNT(*) FROM plan) AS cells,
+            (SELECT COALESCE(SUM(existing), 0) FROM plan) AS existing,
+            (SELECT COALESCE(SUM(queued), 0) FROM plan) AS queued,
+            (SELECT COALESCE(SUM(missing), 0) FROM plan) AS missing,
+            (SELECT COALESCE(ARRAY_AGG(id ORDER BY id), '{}') FROM inserted) AS job_ids
+        ;
+    """
+    cursor.execute(
+        sweep_query,
+        {
+            "question_ids": sweep.question_ids,
+            "question_types": sweep.question_types,
+            "level_cds": sweep.level_cds,
+            "model_ids": sweep.model_ids,
+            "temperatures": sweep.temperatures,
+            "samples": sweep.samples,
+            "openai_url": openai_url,
+            "max_attempts": max_attempts,
+            "dry_run": sweep.dry_run,
+        },
+    )
+    cells, existing, queued, missing, job_ids = cursor.fetchone()
+    if sweep.dry_run:
+        message = f"Sweep of {cells} cells is missing {missing} inferences"
+    else:
+        message = f"Queued {len(job_ids)} inference jobs for {cells} cells"
+    return PostInferenceSweepResponse(
+        message=message,
+        cells=cells,
+        existing=existing,
+        queued=queued,
+        missing=missing,
+        job_ids=job_ids,
+    )
+
+
+async def claim_inference_job(lease: int, cursor: cursor) -> Optional[InferenceJob]:
+    """Lock the next ready job (or one whose worker lease expired) for this worker"""
+    update_query = """
+        UPDATE prod_storage.inference_jobs
+        SET
+            status = 'running',
+            attempts = attempts + 1,
+            locked_until = CURRENT_TIMESTAMP + make_interval(secs => %(lease)s),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = (
+            SELECT id
+            FROM prod_storage.inference_jobs
+            WHERE
+                (status = 'pending' AND run_after <= CURRENT_TIMESTAMP)
+                OR (
+                    status = 'running'
+                    AND locked_until < CURRENT_TIMESTAMP
+                    AND attempts < max_attempts
+                )
+            ORDER BY run_after, id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING
+            id, question_id, model_id, temperature, openai_url, bypass_cache, attempts, max_attempts
+        ;
+    """
+    cursor.execute(update_query, {"lease": lease})
+    record = cursor.fetchone()
+    if record is None:
+        return None
+    (
+        id,
+        question_id,
+        model_id,
+        temperature,
+        openai_url,
+        bypass_cache,
+        attempts,
+        max_attempts,
+    ) = record
+    return InferenceJob(
+        id=id,
+        question_id=question_id,
+        model_id=model_id,
+        temperature=temperature,
+        openai_url=openai_url,
+        bypass_cache=bypass_cache,
+        attempts=attempts,
+        max_attempts=max_attempts,
+    )
+
+
+async def renew_inference_job(job_id: int, attempts: int, lease: int, cursor: cursor) -> bool:
+    """Extend the lease of a running job. False if the lease was lost to another worker"""
+    update_query = """
+        UPDATE prod_storage.inference_jobs
+        SET
+            locked_until = CURRENT_TIMESTAMP + make_interval(secs => %(lease)s),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = %(job_id)s AND status = 'running' AND attempts = %(attempts)s
+        ;
+    """
+    cursor.execute(update_query, {"job_id": job_id, "attempts": attempts, "lease": lease})
+    return cursor.rowcount == 1
+
+
+async def fail_expired_inference_jobs(cursor: cursor) -> int:
+    """Fail running jobs whose lease expired on the last attempt: their worker keeps dying"""
+    update_query = """
+        UPDATE prod_storage.inference_jobs
+        SET
+            status = 'failed',
+            locked_until = NULL,
+            last_error = 'Lease expired on the last attempt',
+            finished_at = CURRENT_TIMESTAMP,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE
+            status = 'running'
+            AND locked_until < CURRENT_TIMESTAMP
+            AND attempts >= max_attempts
+        ;
+    """
+    cursor.execute(update_query)
+    return cursor.rowcount
+
+
+async def complete_inference_job(
+    job_id: int, attempts: int, inference_id: int, cursor: cursor
+) -> bool:
+    """
+    Mark the job done. Fenced by the claim (attempts): False if the lease expired and the
+    job was claimed again or finished meanwhile, then the caller must roll back
+    """
+    update_query = """
+        UPDATE prod_storage.inference_jobs
+        SET
+            status = 'done',
+            inference_id = %(inference_id)s,
+            locked_until = NULL,
+            last_error = NULL,
+            finished_at = CURRENT_TIMESTAMP,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = %(job_id)s AND status = 'running' AND attempts = %(attempts)s
+        ;
+    """
+    cursor.execute(
+        update_query, {"job_id": job_id, "attempts": attempts, "inference_id": inference_id}
+    )
+    return cursor.rowcount == 1
+
+
+async def fail_inference_job(
+    job_id: int, attempts: int, error: str, retry_delay: Optional[float], cursor: cursor
+) -> bool:
+    """
+    Schedule a retry after retry_delay secs, or fail for good if None/out of attempts.
+    Fenced by the claim like complete_inference_job(): False if the job is not ours anymore
+    """
+    update_query = """
+        UPDATE prod_storage.inference_jobs
+        SET
+            status = CASE
+                WHEN %(retry_delay)s::FLOAT IS NULL OR attempts >= max_attempts THEN 'failed'
+                ELSE 'pending'
+            END,
+            run_after = CURRENT_TIMESTAMP + make_interval(secs => COALESCE(%(retry_delay)s::FLOAT, 0)),
+            locked_until = NULL,
+            last_error = %(error)s,
+            finished_at = CASE
+                WHEN %(retry_delay)s::FLOAT IS NULL OR attempts >= max_attempts THEN CURRENT_TIMESTAMP
+            END,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = %(job_id)s AND status = 'running' AND attempts = %(attempts)s
+        ;
+    """
+    cursor.execute(
+        update_query,
+        {"job_id": job_id, "attempts": attempts, "error": error, "retry_delay": retry_delay},
+    )
+    return cursor.rowcount == 1
+
+
+async def get_inference_jobs_stats(cursor: cursor) -> GetInferenceJobsStatsResponse:
+    select_query = """
+        SELECT
+            COUNT(*) FILTER (WHERE status = 'pending') AS pending,
+            COUNT(*) FILTER (WHERE status = 'running') AS running,
+            COUNT(*) FILTER (WHERE status = 'done') AS done,
+            COUNT(*) FILTER (WHERE status = 'failed') AS failed,
+            COUNT(*) FILTER (WHERE status = 'pending' AND run_after <= CURRENT_TIMESTAMP) AS ready,
+            EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - MIN(run_after) FILTER (
+                WHERE status = 'pending' AND run_after <= CURRENT_TIMESTAMP
+            )) AS oldest_ready_age_secs,
+            COUNT(*) FILTER (
+                WHERE status = 'done' AND finished_at > CURRENT_TIMESTAMP - INTERVAL '1 minute'
+            ) AS done_last_minute,
+            COUNT(*) FILTER (
+                WHERE status = 'done' AND finished_at > CURRENT_TIMESTAMP - INTERVAL '1 hour'
+            ) AS done_last_hour
+        FROM
+            prod_storage.inference_jobs
+        ;
+    """
+    cursor.execute(select_query)
+    (
+        pending,
+        running,
+        done,
+        failed,
+        ready,
+        oldest_ready_age_secs,
+        done_last_minute,
+        done_last_hour,
+    ) = cursor.fetchone()
+    return GetInferenceJobsStatsResponse(
+        pending=pending,
+        running=running,
+        done=done,
+        failed=failed,
+        ready=ready,
+        oldest_ready_age_secs=oldest_ready_age_secs,
+        done_last_minute=done_last_minute,
+        done_last_hour=done_last_hour,
+    )
+
+
+async def get_cached_completion(
+    key: str, ttl: int, cursor: cursor
+) -> Optional[LLModelResponse]:
+    """Fetch a live cache entry and count the hit"""
+    update_query = """
+        UPDATE prod_storage.completion_cache
+        SET
+            hits = hits + 1,
+            last_used_at = CURRENT_TIMESTAMP
+        WHERE
+            key = %(key)s
+            AND created_at > CURRENT_TIMESTAMP - make_interval(secs => %(ttl)s)
+        RETURNING thinking, text, temperature, prompt_tokens, completion_tokens
+        ;
+    """
+    cursor.execute(update_query, {"key": key, "ttl": ttl})
+    record = cursor.fetchone()
+    if record is None:
+        return None
+    thinking, text, temperature, prompt_tokens, completion_tokens = record
+    data = dict(
+        response=text,
+        temperature=temperature,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        cached=True,
+    )
+    if thinking is None:
+        return LLModelResponse(**data)
+    return ReasoningLLModelResponse(reasoning=thinking, **data)
+
+
+async def create_cached_completion(
+    key: str, model_name: str, model_response: LLModelResponse, cursor: cursor
+) -> None:
+    insert_query = """
+        INSERT INTO prod_storage.completion_cache
+            (key, model_name, temperature, thinking, text, prompt_tokens, completion_tokens)
+        VALUES
+            (%(key)s, %(model_name)s, %(temperature)s, %(reasoning)s, %(response)s, %(prompt_tokens)s, %(completion_tokens)s)
+        ON CONFLICT (key) DO UPDATE SET
+            thinking = EXCLUDED.thinking,
+            text = EXCLUDED.text,
+            prompt_tokens = EXCLUDED.prompt_tokens,
+            completion_tokens = EXCLUDED.completion_tokens,
+            created_at = CURRENT_TIMESTAMP,
+            last_used_at = CURRENT_TIMESTAMP
+        ;
+    """
+    data = model_response.model_dump(
+        include={"reasoning", "response", "temperature", "prompt_tokens", "completion_tokens"}
+    )
+    data.setdefault("reasoning", None)
+    data["key"] = key
+    data["model_name"] = model_name
+    cursor.execute(insert_query, data)
+
+
+async def evict_completion_cache(ttl: int, max_entries: int, cursor: cursor) -> int:
+    """Delete expired entries and the least recently used ones above max_entries"""
+    delete_query = """
+        DELETE FROM prod_storage.completion_cache
+        WHERE
+            created_at <= CURRENT_TIMESTAMP - make_interval(secs => %(ttl)s)
+            OR key IN (
+                SELECT key
+                FROM prod_storage.completion_cache
+                ORDER BY last_used_at DESC
+                OFFSET %(max_entries)s
+            )
+        ;
+    """
+    cursor.execute(delete_query, {"ttl": ttl, "max_entries": max_entries})
+    return cursor.rowcount
+
+
+async def get_completion_cache_stats(cursor: cursor) -> GetCompletionCacheStatsResponse:
+    select_query = """
+        SELECT
+            COUNT(*) AS entries,
+            COALESCE(SUM(hits), 0) AS hits,
+            COALESCE(SUM(hits * prompt_tokens), 0) AS saved_prompt_tokens,
+            COALESCE(SUM(hits * completion_tokens), 0) AS saved_completion_tokens
+        FROM
+            prod_storage.completion_cache
+        ;
+    """
+    cursor.execute(select_query)
+    entries, hits, saved_prompt_tokens, saved_completion_tokens = cursor.fetchone()
+    return GetCompletionCacheStatsResponse(
+        entries=entries,
+        hits=hits,
+        saved_prompt_tokens=saved_prompt_tokens,
+        saved_completion_tokens=saved_completion_tokens,
     )
 
 
 async def get_question_inference_ids(question_id: int, cursor: cursor) -> List[int]:
     select_query = "SELECT id FROM prod_storage.questions_transformed WHERE question_id = %s AND deleted_flg = false;"
-    cursor.execute(select_query, (question_id,))
+    # Scans the inferences of every listed question: off the event loop, cancellable
+    await run_in_threadpool(cursor.execute, select_query, (question_id,))
     return [record[0] for record in cursor.fetchall()]
 
 
@@ -493,7 +1402,8 @@ async def get_inference_scores_all(
                 AND link.user_group_cd = %s
         ;
     """
-    cursor.execute(select_query, (user_group_cd,))
+    # Potentially long scan: run off the event loop so a client disconnect can cancel it
+    await run_in_threadpool(cursor.execute, select_query, (user_group_cd,))
     return [
         GetInferenceScoreResponse(
             id=id,
@@ -672,6 +1582,260 @@ async def get_scores_for_inference(
     ]
 
 
+def get_report_query(
+    cursor: cursor,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+) -> str:
+    """
+    SELECT of the report: a row per score, optionally only scores created in [since, until).
+    Not ordered, so rows stream out as they are joined instead of after a sort of the
+    whole report. Parameters are inlined so the query can be wrapped in COPY, and the planner
+    sees the window bounds (index scan for a short window).
+    """
+    select_query = """
+        SELECT
+            m.base_model_name,
+            m.version AS model_version,
+            isc.user_group_cd,
+            p.messages,
+            q.id AS prompt_id,
+            p.messages -> 1 ->> 'content' AS prompt,
+            p.template_version AS prompt_template_version,
+            qt.id AS response_id,
+            qt.text AS response,
+            isc.helpful,
+            isc.does_not_reveal_answer,
+            isc.does_not_contain_errors > 1 AS does_not_contain_errors,
+            isc.only_relevant_info
+        FROM
+            prod_storage.inference_scores AS isc
+            INNER JOIN prod_storage.questions_transformed AS qt
+                ON qt.id = isc.inference_id AND qt.deleted_flg = false
+            INNER JOIN prod_storage.questions AS q
+                ON q.id = qt.question_id AND q.deleted_flg = false
+            INNER JOIN prod_storage.models AS m
+                ON m.id = qt.model_id AND m.deleted_flg = false
+            LEFT JOIN prod_storage.prompts AS p
+                ON p.id = qt.prompt_id
+        WHERE
+            isc.deleted_flg = false
+            AND (%(since)s::TIMESTAMP IS NULL OR isc.created_at >= %(since)s::TIMESTAMP)
+            AND (%(until)s::TIMESTAMP IS NULL OR isc.created_at < %(until)s::TIMESTAMP)
+    """
+    return cursor.mogrify(
+        select_query,
+        {"since": since, "until": until},
+    ).decode("utf-8")
+
+
+async def get_preference_question_ids(cursor: cursor) -> List[int]:
+    """Questions with scored inferences"""
+    select_query = """
+        SELECT DISTINCT qt.question_id
+        FROM
+            prod_storage.questions_transformed AS qt
+            INNER JOIN prod_storage.inference_scores AS isc
+                ON isc.inference_id = qt.id AND isc.deleted_flg = false
+        WHERE qt.deleted_flg = false
+        ORDER BY qt.question_id
+        ;
+    """
+    cursor.execute(select_query)
+    return [record[0] for record in cursor.fetchall()]
+
+
+def get_preferences_query(question_ids: List[int], cursor: cursor) -> str:
+    """
+    SELECT of preference records: a row per (question, prompt) of question_ids with the
+    scored inferences generated from the prompt and their mean ratings, best score first.
+    score is the mean of the four criteria (all on the 1-5 scale). Ordered by question
+    and prompt so exports of the same data are identical.
+    """
+    select_query = """
+        WITH rated AS (
+            SELECT
+                qt.id,
+                qt.question_id,
+                qt.prompt_id,
+                m.model_name,
+                qt.temperature,
+                qt.thinking,
+                qt.text,
+                COUNT(*) AS ratings,
+                AVG(isc.helpful) AS helpful,
+                AVG(isc.does_not_reveal_answer) AS does_not_reveal_answer,
+                AVG(isc.does_not_contain_errors) AS does_not_contain_errors,
+                AVG(isc.only_relevant_info) AS only_relevant_info,
+                AVG(
+                    isc.helpful
+                    + isc.does_not_reveal_answer
+                    + isc.does_not_contain_errors
+                    + isc.only_relevant_info
+                ) / 4 AS score
+            FROM
+                prod_storage.inference_scores AS isc
+                INNER JOIN prod_storage.questions_transformed AS qt
+                    ON qt.id = isc.inference_id AND qt.deleted_flg = false
+                INNER JOIN prod_storage.questions AS q
+                    ON q.id = qt.question_id AND q.deleted_flg = false
+                INNER JOIN prod_storage.models AS m
+                    ON m.id = qt.model_id AND m.deleted_flg = false
+            WHERE
+                isc.deleted_flg = false
+                AND qt.question_id = ANY(%(question_ids)s::INT[])
+            GROUP BY qt.id, m.model_name
+        )
+        SELECT
+            grouped.question_id,
+            grouped.prompt_id,
+            p.messages,
+            grouped.responses
+        FROM
+            (
+                SELECT
+                    question_id,
+                    prompt_id,
+                    jsonb_agg(
+                        jsonb_build_object(
+                            'inference_id', id,
+                            'model_name', model_name,
+                            'temperature', temperature,
+                            'content', text,
+                            'reasoning', thinking,
+                            'ratings', ratings,
+                            'helpful', ROUND(helpful, 3),
+                            'does_not_reveal_answer', ROUND(does_not_reveal_answer, 3),
+                            'does_not_contain_errors', ROUND(does_not_contain_errors, 3),
+                            'only_relevant_info', ROUND(only_relevant_info, 3),
+                            'score', ROUND(score, 3)
+                        )
+                        ORDER BY score DESC, id
+                    ) AS responses
+                FROM rated
+                GROUP BY question_id, prompt_id
+            ) AS grouped
+            INNER JOIN prod_storage.prompts AS p
+                ON p.id = grouped.prompt_id
+        ORDER BY grouped.question_id, grouped.prompt_id
+    """
+    return cursor.mogrify(
+        select_query,
+        {"question_ids": question_ids},
+    ).decode("utf-8")
+
+
+async def get_export_data_versions(cursor: cursor) -> Dict[str, int]:
+    """
+    Version of every table exports read (prod_storage.data_versions), bumped by the
+    transaction that inserts, updates or deletes its rows. Tables never changed are missing
+    """
+    select_query = """
+        SELECT table_name, version
+        FROM prod_storage.data_versions
+        ;
+    """
+    cursor.execute(select_query)
+    return dict(cursor.fetchall())
+
+
+async def get_report_window_version(until: datetime.datetime, cursor: cursor) -> str:
+    """
+    Change marker of the scores created before until: a full report cut at the watermark
+    changes when a score crosses it, not when the score is written
+    """
+    select_query = """
+        SELECT concat_ws('/', MAX(id), COUNT(*))
+        FROM prod_storage.inference_scores
+        WHERE created_at < %s
+        ;
+    """
+    cursor.execute(select_query, (until,))
+    return cursor.fetchone()[0]
+
+
+async def get_export_watermark(lag: int, cursor: cursor) -> datetime.datetime:
+    """Database time lag secs ago: rows created before it are committed (or rolled back)"""
+    cursor.execute("SELECT LOCALTIMESTAMP - make_interval(secs => %s);", (lag,))
+    return cursor.fetchone()[0]
+
+
+def get_dataset_query(question_ids: Optional[List[int]], cursor: cursor) -> str:
+    """
+    SELECT of the dataset: a row per question with its stored prompt, questions of
+    question_ids (without duplicates) in the given order, all questions by ID otherwise
+    """
+    select_query = """
+        SELECT
+            p.messages,
+            q.id AS prompt_id,
+            p.messages -> 1 ->> 'content' AS prompt,
+            p.template_version AS prompt_template_version
+        FROM
+            prod_storage.questions AS q
+            INNER JOIN prod_storage.prompts AS p
+                ON p.id = q.prompt_id
+            LEFT JOIN UNNEST(%(question_ids)s::INT[]) WITH ORDINALITY AS d (question_id, idx)
+                ON d.question_id = q.id
+        WHERE
+            q.deleted_flg = false
+            AND (%(question_ids)s::INT[] IS NULL OR d.idx IS NOT NULL)
+        ORDER BY d.idx, q.id
+    """
+    return cursor.mogrify(select_query, {"question_ids": question_ids}).decode("utf-8")
+
+
+def copy_csv(query: str, file: Any, cursor: cursor) -> None:
+    """Write the result of query as CSV with header into file, formatted by Postgres"""
+    cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", file)
+
+
+def copy_report_csv(query: str, file: Any, cursor: cursor) -> None:
+    """Report CSV of get_report_query(): messages as JSON text, booleans as True/False"""
+    csv_query = f"""
+        SELECT
+            base_model_name,
+            model_version,
+            user_group_cd,
+            messages::TEXT AS messages,
+            prompt_id,
+            prompt,
+            prompt_template_version,
+            response_id,
+            response,
+            helpful,
+            does_not_reveal_answer,
+            INITCAP(does_not_contain_errors::TEXT) AS does_not_contain_errors,
+            only_relevant_info
+        FROM ({query}) AS report
+    """
+    copy_csv(query=csv_query, file=file, cursor=cursor)
+
+
+def copy_dataset_csv(query: str, file: Any, cursor: cursor) -> None:
+    """Dataset CSV of get_dataset_query(): messages as JSON text"""
+    csv_query = f"""
+        SELECT
+            messages::TEXT AS messages,
+            prompt_id,
+            prompt,
+            prompt_template_version
+        FROM ({query}) AS dataset
+    """
+    copy_csv(query=csv_query, file=file, cursor=cursor)
+
+
+def fetch_batches(query: str, batch_size: int, cursor: cursor) -> Iterator[List[tuple]]:
+    """Rows of query in batches. Use a named (server-side) cursor to keep memory constant."""
+    cursor.itersize = batch_size
+    cursor.execute(query)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
 async def get_questions(
     user_group_cd: UserGroupCD, cursor: cursor
 ) -> List[GetQuestionResponse]:
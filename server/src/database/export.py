@@ -0,0 +1,200 @@
+from typing import Callable, Iterator, Optional, Any, Literal, Union
+from psycopg2.extensions import cursor
+import queue
+import threading
+import zlib
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src.constraints import (
+    EXPORT_COPY_CHUNK_BYTES,
+    EXPORT_COPY_QUEUE_CHUNKS,
+    EXPORT_ROW_GROUP_ROWS,
+    EXPORT_ARROW_COMPRESSION,
+    EXPORT_GZIP_LEVEL,
+)
+from src.database.pool import ConnectionPoolManager, LazyCursor
+from src.database.crud import fetch_batches
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+class QueueWriter:
+    """
+    File-like target of COPY ... TO STDOUT. psycopg2 writes one row at a time,
+    rows are joined into chunks of EXPORT_COPY_CHUNK_BYTES before they are queued.
+    """
+
+    def __init__(self, chunks: queue.Queue) -> None:
+        self._chunks = chunks
+        self._buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        if len(self._buffer) >= EXPORT_COPY_CHUNK_BYTES:
+            self.flush()
+        return len(data)
+
+    def flush(self) -> None:
+        if self._buffer:
+            self._chunks.put(bytes(self._buffer))
+            self._buffer = bytearray()
+
+
+def stream_copy(
+    copy: Callable[[LazyCursor, Any], None], statement_timeout: Optional[int] = None
+) -> Iterator[bytes]:
+    """
+    Stream the output of copy(cursor, file), a COPY ... TO STDOUT into file.
+    COPY blocks, so it runs in its own thread with its own connection and hands chunks
+    over a bounded queue: the response starts with the first rows and at most
+    EXPORT_COPY_QUEUE_CHUNKS chunks are held in memory. Closing the generator early
+    (client disconnected) cancels the query.
+    A sync generator: StreamingResponse iterates it in a threadpool.
+    """
+    chunks: queue.Queue = queue.Queue(maxsize=EXPORT_COPY_QUEUE_CHUNKS)
+    cursor = LazyCursor(statement_timeout=statement_timeout)
+
+    def produce() -> None:
+        result: Optional[Exception] = None  # Last item of the queue, None if COPY succeeded
+        try:
+            try:
+                writer = QueueWriter(chunks=chunks)
+                copy(cursor, writer)
+                writer.flush()
+            finally:
+                cursor.release(commit=False)  # Read only
+        except Exception as e:
+            result = e
+        chunks.put(result)
+
+    threading.Thread(target=produce, name="copy-export", daemon=True).start()
+    finished = False
+    try:
+        while isinstance(chunk := chunks.get(), bytes):
+            yield chunk
+        finished = True
+        if chunk is not None:
+            logger.error(f"Export failed: {chunk}")
+            raise chunk
+    finally:
+        if not finished:
+            cursor.cancel()
+            while isinstance(chunks.get(), bytes):  # Unblock the thread until it is done
+                pass
+
+
+class BufferSink:
+    """Write-only file for pyarrow writers, drained by the response after every batch"""
+
+    closed = False
+
+    def __init__(self) -> None:
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data: Any) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_arrow(
+    get_query: Callable[[cursor], str],
+    schema: pa.Schema,
+    format: Literal["parquet", "arrow"],
+    statement_timeout: Optional[int] = None,
+) -> Iterator[bytes]:
+    """
+    Stream the rows of get_query(cursor) as Parquet or Arrow IPC stream with typed columns,
+    EXPORT_ROW_GROUP_ROWS rows per row group / record batch. Rows come from a server-side
+    cursor and each batch is sent as soon as it is written, so memory holds one batch.
+    Dictionary columns get a dictionary per batch: Arrow IPC file format does not allow
+    that, hence the stream format.
+    A sync generator: StreamingResponse iterates it in a threadpool.
+    """
+    sink = BufferSink()
+    if format == "parquet":
+        writer = pq.ParquetWriter(sink, schema=schema, compression=EXPORT_ARROW_COMPRESSION)
+    else:
+        writer = pa.ipc.new_stream(
+            sink, schema, options=pa.ipc.IpcWriteOptions(compression=EXPORT_ARROW_COMPRESSION)
+        )
+    conn = ConnectionPoolManager.acquire_connection(statement_timeout=statement_timeout)
+    try:
+        with conn.cursor(name="export_arrow") as named_cursor:
+            for rows in fetch_batches(
+                query=get_query(named_cursor),
+                batch_size=EXPORT_ROW_GROUP_ROWS,
+                cursor=named_cursor,
+            ):
+                batch = pa.RecordBatch.from_arrays(
+                    [
+                        pa.array(column, type=field.type)
+                        for column, field in zip(zip(*rows), schema)
+                    ],
+                    schema=schema,
+                )
+                writer.write_batch(batch)
+                yield sink.take()
+    finally:
+        ConnectionPoolManager.release_connection(conn, commit=False)  # Read only
+    writer.close()
+    yield sink.take()
+
+
+def compress_stream(
+    chunks: Iterator[Union[bytes, str]], codec: Optional[Literal["zstd", "gzip"]]
+) -> Iterator[Union[bytes, str]]:
+    """
+    gzip or zstd encode an export chunk by chunk, chunks unchanged if codec is None.
+    Compressed bytes are sent as soon as the compressor emits them, so memory holds one
+    compressor window. Closing the result closes chunks (cancels the export query).
+    """
+    if codec is None:
+        return chunks
+    return _compress_stream(chunks=chunks, codec=codec)
+
+
+def _compress_stream(
+    chunks: Iterator[Union[bytes, str]], codec: Literal["zstd", "gzip"]
+) -> Iterator[bytes]:
+    sink = BufferSink()
+    if codec == "gzip":
+        compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+        def write(data: bytes) -> None:
+            sink.write(compressor.compress(data))
+
+        def finish() -> None:
+            sink.write(compressor.flush())
+
+    else:
+        stream = pa.CompressedOutputStream(sink, codec)
+        write = stream.write
+        finish = stream.close
+    try:
+        for chunk in chunks:
+            write(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+            if data := sink.take():
+                yield data
+        finish()
+        yield sink.take()
+    finally:
+        chunks.close()
@@ -1,21 +1,35 @@
 from contextlib import asynccontextmanager, contextmanager
-from psycopg2.pool import SimpleConnectionPool
-from psycopg2 import OperationalError
-from psycopg2.extensions import connection
-from typing import Generator, Optional
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from psycopg2 import OperationalError, ProgrammingError
+from psycopg2.errors import QueryCanceled
+from psycopg2.extensions import connection, cursor
+from typing import Generator, Optional, Any
 import asyncio
+import datetime
+import os
+import socket
+import threading
 from time import sleep
 from src.logger import LoggerFactory
 from src.config import settings
-from src.exceptions import DatabaseUnavailableException
+from src.exceptions import (
+    DatabaseUnavailableException,
+    DatabaseTimeoutException,
+    ClientDisconnectedException,
+)
 from src.utils import get_connection_id
+from src.schemas import PoolStats
 
 
 logger = LoggerFactory.getLogger(__name__)
 
 
 class ConnectionPoolManager:
-    _pool: Optional[SimpleConnectionPool] = None
+    _pool: Optional[ThreadedConnectionPool] = None
+    _stats_lock = threading.Lock()
+    _in_use: int = 0
+    _peak_in_use: int = 0
+    _exhausted_count: int = 0
 
     @classmethod
     def initialize_pool(cls) -> None:
@@ -24,16 +38,20 @@ class ConnectionPoolManager:
 
         for attempt in range(max_retries):
             try:
-                cls._pool = SimpleConnectionPool(
-                    minconn=settings.postgres.minconn,
-                    maxconn=settings.postgres.maxconn,
+                # Threaded pool: connections may be checked out on the event loop and returned from a worker thread
+                # Per-worker share of the global connection budget (if configured)
+                cls._pool = ThreadedConnectionPool(
+                    minconn=settings.postgres.worker_minconn,
+                    maxconn=settings.postgres.worker_maxconn,
                     user=settings.postgres.user,
                     password=settings.postgres.password,
                     host=settings.postgres.host,
                     port=settings.postgres.port,
                     dbname=settings.postgres.dbname,
                 )
-                logger.info("Database connection pool initialized successfully")
+                logger.info(
+                    f"Database connection pool initialized successfully (maxconn {settings.postgres.worker_maxconn})"
+                )
                 break
             except OperationalError as ex:
                 logger.error(
@@ -59,30 +77,232 @@ class ConnectionPoolManager:
                 raise
 
     @classmethod
-    @contextmanager
-    def get_connection(cls) -> Generator:
+    def acquire_connection(cls, statement_timeout: Optional[int] = None) -> connection:
+        """
+        Check a connection out of the pool. Must be handed back with release_connection().
+        statement_timeout (ms) applies to the transaction opened on this checkout only.
+        """
         if cls._pool is None:
             cls.initialize_pool()
 
-        conn_id = None
-        with cls._pool.getconn() as conn:
+        try:
+            conn = cls._pool.getconn()
+        except PoolError as e:
+            with cls._stats_lock:
+                cls._exhausted_count += 1
+            logger.error(f"Connection pool exhausted: {e}")
+            raise DatabaseUnavailableException(
+                detail="Connection pool exhausted, try again later"
+            )
+        with cls._stats_lock:
+            cls._in_use += 1
+            cls._peak_in_use = max(cls._peak_in_use, cls._in_use)
+        logger.info(f"Acquired connection (ID {get_connection_id(conn)}) from pool")
+        if statement_timeout is not None:
             try:
-                conn_id = get_connection_id(conn)
-                logger.info(f"Acquired connection (ID {conn_id}) from pool")
-                yield conn
-                conn.commit()  # Commit transaction
-            except Exception as e:
-                conn.rollback()  # Rollback on error
-                logger.error(f"Database operation failed: {e}")
+                cls.set_statement_timeout(conn=conn, statement_timeout=statement_timeout)
+            except Exception:
+                cls.release_connection(conn, commit=False)
                 raise
-            finally:
-                if conn:
-                    cls._pool.putconn(conn)
-                logger.info(f"Returned connection (ID {conn_id}) to pool")
+        return conn
+
+    @staticmethod
+    def set_statement_timeout(conn: connection, statement_timeout: int) -> None:
+        """SET LOCAL statement_timeout: resets on commit/rollback so pooled connections stay clean"""
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT set_config('statement_timeout', %s, true);",
+                (str(statement_timeout),),
+            )
+
+    @classmethod
+    def release_connection(cls, conn: connection, commit: bool = True) -> None:
+        """Finish the open transaction (commit or rollback) and return connection to pool"""
+        conn_id = get_connection_id(conn)
+        try:
+            if commit:
+                conn.commit()
+            else:
+                conn.rollback()
+        finally:
+            cls._pool.putconn(conn)
+            with cls._stats_lock:
+                cls._in_use -= 1
+            logger.info(f"Returned connection (ID {conn_id}) to pool")
+
+    @classmethod
+    def get_stats(cls) -> PoolStats:
+        """Connection usage of this worker process"""
+        with cls._stats_lock:
+            return PoolStats(
+                host=socket.gethostname(),
+                pid=os.getpid(),
+                minconn=cls._pool.minconn if cls._pool else 0,
+                maxconn=cls._pool.maxconn if cls._pool else 0,
+                in_use=cls._in_use,
+                peak_in_use=cls._peak_in_use,
+                exhausted_count=cls._exhausted_count,
+                updated_at=datetime.datetime.now(datetime.timezone.utc),
+            )
+
+    @classmethod
+    @contextmanager
+    def get_connection(cls, statement_timeout: Optional[int] = None) -> Generator:
+        conn = cls.acquire_connection(statement_timeout=statement_timeout)
+        try:
+            yield conn
+        except Exception as e:
+            logger.error(f"Database operation failed: {e}")
+            cls.release_connection(conn, commit=False)  # Rollback on error
+            raise
+        else:
+            cls.release_connection(conn, commit=True)  # Commit transaction
 
     @classmethod
     @contextmanager
-    def get_cursor(cls) -> Generator:
-        with cls.get_connection() as conn:
+    def get_cursor(cls, statement_timeout: Optional[int] = None) -> Generator:
+        with cls.get_connection(statement_timeout=statement_timeout) as conn:
             with conn.cursor() as cursor:
                 yield cursor
+
+
+class LazyCursor:
+    """
+    Cursor proxy that checks a connection out of the pool only on the first execute().
+
+    Without an explicit transaction all queries run in one transaction that lasts
+    until release() (or the end of the `with` block). Use transaction() to run a few
+    queries in a short transaction and hand the connection back right after it.
+    statement_timeout (ms) is applied to every transaction the cursor opens,
+    cancel() aborts the running query from another task/thread.
+
+    Usage:
+        with LazyCursor() as cursor:
+            with cursor.transaction():
+                cursor.execute(...)
+            await slow_call()  # no connection is held here
+    """
+
+    def __init__(self, statement_timeout: Optional[int] = None) -> None:
+        self._statement_timeout = statement_timeout
+        self._connection: Optional[connection] = None
+        self._cursor: Optional[cursor] = None
+        self._in_transaction: bool = False
+        self._cancelled: bool = False
+
+    @property
+    def acquired(self) -> bool:
+        """Whether a pooled connection is currently held"""
+        return self._connection is not None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def _get_cursor(self) -> cursor:
+        if self._cancelled:
+            raise ClientDisconnectedException()
+        if self._cursor is None:
+            self._connection = ConnectionPoolManager.acquire_connection(
+                statement_timeout=self._statement_timeout
+            )
+            self._cursor = self._connection.cursor()
+        return self._cursor
+
+    def _get_acquired_cursor(self) -> cursor:
+        if self._cursor is None:
+            raise ProgrammingError("no results to fetch: no query was executed")
+        return self._cursor
+
+    @contextmanager
+    def _handle_cancel(self) -> Generator:
+        try:
+            yield
+        except QueryCanceled as e:
+            if self._cancelled:
+                raise ClientDisconnectedException() from e
+            raise DatabaseTimeoutException(
+                f"Database query exceeded statement timeout of {self._statement_timeout} ms"
+            ) from e
+
+    def execute(self, query: Any, vars: Any = None) -> None:
+        with self._handle_cancel():
+            self._get_cursor().execute(query, vars)
+
+    def executemany(self, query: Any, vars_list: Any) -> None:
+        with self._handle_cancel():
+            self._get_cursor().executemany(query, vars_list)
+
+    def copy_expert(self, sql: str, file: Any, size: int = 8192) -> None:
+        with self._handle_cancel():
+            self._get_cursor().copy_expert(sql, file, size)
+
+    def mogrify(self, query: Any, vars: Any = None) -> bytes:
+        return self._get_cursor().mogrify(query, vars)
+
+    def fetchone(self) -> Optional[tuple]:
+        return self._get_acquired_cursor().fetchone()
+
+    def fetchmany(self, size: Optional[int] = None) -> list:
+        cursor = self._get_acquired_cursor()
+        return cursor.fetchmany() if size is None else cursor.fetchmany(size)
+
+    def fetchall(self) -> list:
+        return self._get_acquired_cursor().fetchall()
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount if self._cursor is not None else -1
+
+    @property
+    def description(self) -> Optional[tuple]:
+        return self._cursor.description if self._cursor is not None else None
+
+    def cancel(self) -> None:
+        """Cancel the query running on the held connection (if any), further queries are refused"""
+        self._cancelled = True
+        conn = self._connection
+        if conn is not None:
+            logger.info(f"Cancelling query on connection (ID {get_connection_id(conn)})")
+            conn.cancel()  # Thread-safe: sends cancel request for the running backend query
+
+    def release(self, commit: bool = True) -> None:
+        """End current transaction and return the connection to pool (no-op if none held)"""
+        if self._connection is None:
+            return
+        conn, cur = self._connection, self._cursor
+        self._connection, self._cursor = None, None
+        try:
+            cur.close()
+        finally:
+            ConnectionPoolManager.release_connection(conn, commit=commit)
+
+    @contextmanager
+    def transaction(self) -> Generator:
+        """Short explicit transaction: commit (or rollback) and release connection on exit"""
+        if self._in_transaction:  # Nested blocks join the outer transaction
+            yield self
+            return
+
+        self.release()  # Finish any implicit transaction started before
+        self._in_transaction = True
+        try:
+            yield self
+        except BaseException:
+            self.release(commit=False)
+            raise
+        else:
+            self.release(commit=True)
+        finally:
+            self._in_transaction = False
+
+    def close(self) -> None:
+        self.release(commit=True)
+
+    def __enter__(self) -> "LazyCursor":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is not None:
+            logger.error(f"Database operation failed: {exc_value}")
+        self.release(commit=exc_type is None)
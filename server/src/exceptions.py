@@ -11,6 +11,18 @@ class DatabaseUnavailableException(HTTPException):
         )
 
 
+class DatabaseTimeoutException(HTTPException):
+    def __init__(self, detail: Any = "Database query exceeded statement timeout"):
+        super().__init__(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=detail)
+
+
+class ClientDisconnectedException(HTTPException):
+    def __init__(
+        self, detail: Any = "Client disconnected, database query was cancelled"
+    ):
+        super().__init__(status_code=status.HTTP_408_REQUEST_TIMEOUT, detail=detail)
+
+
 class InvalidXMLException(HTTPException):
     def __init__(self, detail: Any = "Invalid XML structure"):
         super().__init__(
@@ -61,3 +73,35 @@ class RedisUnavailableException(HTTPException):
         super().__init__(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=detail
         )
+
+
+class ModelNotFoundException(HTTPException):
+    def __init__(self, detail: Any = "Model does not exist in database or was deleted"):
+        super().__init__(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+
+
+class QuestionNotFoundException(HTTPException):
+    def __init__(
+        self, detail: Any = "Question does not exist in database or was deleted"
+    ):
+        super().__init__(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+
+
+class InferenceNotFoundException(HTTPException):
+    def __init__(self, detail: Any = "Inference was not found: wrong ID or was deleted"):
+        super().__init__(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+
+
+class InvalidQueryListException(HTTPException):
+    def __init__(self, detail: Any = "Invalid comma separated list in query"):
+        super().__init__(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+class InvalidExportCursorException(HTTPException):
+    def __init__(self, detail: Any = "Invalid export cursor"):
+        super().__init__(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+class InferenceJobLeaseLostException(HTTPException):
+    def __init__(self, detail: Any = "Inference job lease expired, the job was claimed again"):
+        super().__init__(status_code=status.HTTP_409_CONFLICT, detail=detail)
@@ -0,0 +1,241 @@
+from typing import AsyncIterator, List, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import os
+import random
+import signal
+from fastapi.exceptions import HTTPException
+from src.config import settings
+from src.logger import LoggerFactory
+from src.database.pool import ConnectionPoolManager, LazyCursor
+from src.database.crud import (
+    claim_inference_job,
+    renew_inference_job,
+    fail_expired_inference_jobs,
+    complete_inference_job,
+    fail_inference_job,
+)
+from src.exceptions import (
+    ModelNotFoundException,
+    QuestionNotFoundException,
+    InferenceJobLeaseLostException,
+)
+from src.models.core import (
+    load_inference_context,
+    generate_inference,
+    persist_inference,
+)
+from src.models.cache import CompletionCache
+from src.models.page_cache import PageCache
+from src.models.clients import OpenAIClientRegistry
+from src.models.routing import ModelRouter
+from src.schemas import InferenceJob
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+def get_retry_delay(attempts: int) -> float:
+    """Exponential backoff with full jitter"""
+    delay = min(
+        settings.jobs.backoff_max, settings.jobs.backoff_base * 2 ** (attempts - 1)
+    )
+    return random.uniform(delay / 2, delay)
+
+
+class InferenceWorker:
+    """
+    Claims inference jobs one by one and writes them into questions_transformed.
+    The lease of a job is renewed while it is generated (retries of a generation can outlast
+    it), and completing or failing a job is fenced by its claim: a worker whose lease expired
+    and whose job was claimed again rolls its result back instead of storing it twice.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    async def run(self, stop: asyncio.Event) -> None:
+        logger.info(f"Inference worker {self.name} started")
+        try:
+            while not stop.is_set():
+                try:
+                    processed = await self.process_next()
+                except Exception as e:  # Database hiccup: keep the worker alive
+                    logger.error(f"Inference worker {self.name} failed to process job: {e}")
+                    processed = False
+                if not processed:
+                    try:
+                        await asyncio.wait_for(
+                            stop.wait(), timeout=settings.jobs.poll_interval
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            logger.info(f"Inference worker {self.name} stopped")
+
+    async def process_next(self) -> bool:
+        """Process one job. Returns False if the queue had nothing ready"""
+        statement_timeout = settings.postgres.get_statement_timeout("admin")
+        with LazyCursor(statement_timeout=statement_timeout) as cursor:
+            with cursor.transaction():
+                expired = await fail_expired_inference_jobs(cursor=cursor)
+                job = await claim_inference_job(lease=settings.jobs.lease, cursor=cursor)
+            if expired:
+                logger.warning(f"{expired} jobs failed: their lease expired on the last attempt")
+            if job is None:
+                return False
+
+            logger.info(f"Inference worker {self.name} claimed job ID {job.id}")
+            try:
+                await self.process(job=job, cursor=cursor)
+            except InferenceJobLeaseLostException:
+                logger.warning(f"Job ID {job.id} result dropped: {self.name} lost its lease")
+            except (ModelNotFoundException, QuestionNotFoundException) as e:
+                await self.fail(job=job, error=str(e.detail), retry=False, cursor=cursor)
+            except Exception as e:
+                error = str(e.detail) if isinstance(e, HTTPException) else str(e)
+                await self.fail(job=job, error=error, retry=True, cursor=cursor)
+        return True
+
+    async def process(self, job: InferenceJob, cursor: LazyCursor) -> int:
+        model_response = None
+        with cursor.transaction():
+            context = await load_inference_context(
+                model_id=job.model_id, question_id=job.question_id, cursor=cursor
+            )
+            if CompletionCache.enabled(bypass=job.bypass_cache):
+                model_response = await CompletionCache.get(
+                    context=context, temperature=job.temperature, cursor=cursor
+                )
+
+        if model_response is None:
+            async with OpenAIClientRegistry.use(
+                base_url=job.openai_url or settings.openai.base_url,
+                api_key=settings.jobs.openai_api_key,
+            ) as client, self.keep_lease(job=job):
+                model_response = await generate_inference(
+                    client=client, context=context, temperature=job.temperature
+                )
+
+        with cursor.transaction():
+            inference_id = await persist_inference(
+                context=context, model_response=model_response, cursor=cursor
+            )
+            if CompletionCache.enabled() and not model_response.cached:
+                await CompletionCache.put(
+                    context=context, model_response=model_response, cursor=cursor
+                )
+            completed = await complete_inference_job(
+                job_id=job.id, attempts=job.attempts, inference_id=inference_id, cursor=cursor
+            )
+            if not completed:  # Rolls the inference back
+                raise InferenceJobLeaseLostException()
+        await PageCache.invalidate()
+        logger.info(f"Job ID {job.id} done: inference ID {inference_id}")
+        return inference_id
+
+    async def fail(
+        self, job: InferenceJob, error: str, retry: bool, cursor: LazyCursor
+    ) -> None:
+        retry_delay = get_retry_delay(attempts=job.attempts) if retry else None
+        logger.warning(
+            f"Job ID {job.id} failed (attempt {job.attempts} of {job.max_attempts}): {error}"
+        )
+        with cursor.transaction():
+            failed = await fail_inference_job(
+                job_id=job.id,
+                attempts=job.attempts,
+                error=error,
+                retry_delay=retry_delay,
+                cursor=cursor,
+            )
+        if not failed:
+            logger.warning(f"Job ID {job.id} failure dropped: {self.name} lost its lease")
+
+    @asynccontextmanager
+    async def keep_lease(self, job: InferenceJob) -> AsyncIterator[None]:
+        """Renew the lease of job every third of settings.jobs.lease while the block runs"""
+
+        async def heartbeat() -> None:
+            statement_timeout = settings.postgres.get_statement_timeout("admin")
+            while True:
+                await asyncio.sleep(settings.jobs.lease / 3)
+                try:
+                    with LazyCursor(statement_timeout=statement_timeout) as cursor:
+                        with cursor.transaction():
+                            renewed = await renew_inference_job(
+                                job_id=job.id,
+                                attempts=job.attempts,
+                                lease=settings.jobs.lease,
+                                cursor=cursor,
+                            )
+                except Exception as e:  # Database hiccup: try again before the lease ends
+                    logger.warning(f"Lease of job ID {job.id} was not renewed: {e}")
+                    continue
+                if not renewed:
+                    logger.warning(f"Lease of job ID {job.id} lost, it was claimed again")
+                    return
+
+        task = asyncio.create_task(heartbeat())
+        try:
+            yield
+        finally:
+            task.cancel()
+
+
+class InferenceWorkerPool:
+    """Background inference workers running on the current event loop"""
+
+    _stop: Optional[asyncio.Event] = None
+    _tasks: List[asyncio.Task] = []
+
+    @classmethod
+    def start(cls, workers: int) -> None:
+        if workers <= 0 or cls._tasks:
+            return
+        cls._stop = asyncio.Event()
+        cls._tasks = [
+            asyncio.create_task(
+                InferenceWorker(name=f"{os.getpid()}-{idx}").run(stop=cls._stop)
+            )
+            for idx in range(workers)
+        ]
+
+    @classmethod
+    async def stop(cls) -> None:
+        if not cls._tasks:
+            return
+        cls._stop.set()
+        # Jobs interrupted mid-generation are claimed again once their lease expires
+        done, pending = await asyncio.wait(cls._tasks, timeout=settings.jobs.poll_interval)
+        for task in pending:
+            task.cancel()
+        cls._tasks = []
+
+
+async def main() -> None:
+    """Standalone worker process: python -m src.jobs.worker"""
+    ConnectionPoolManager.initialize_pool()
+    await OpenAIClientRegistry.initialize()
+    await ModelRouter.initialize()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    workers = max(1, settings.jobs.inference_workers)
+    try:
+        await asyncio.gather(
+            *[
+                InferenceWorker(name=f"{os.getpid()}-{idx}").run(stop=stop)
+                for idx in range(workers)
+            ]
+        )
+    finally:
+        await ModelRouter.close()
+        await OpenAIClientRegistry.close()
+        ConnectionPoolManager.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
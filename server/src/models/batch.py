@@ -0,0 +1,173 @@
+from typing import List, Optional, Tuple, AsyncIterator, Iterator
+from psycopg2.extensions import cursor
+from openai.types.chat import ChatCompletion
+from pydantic import ValidationError
+import json
+import re
+from src.constraints import INFERENCE_BATCH_COPY_ROWS, INFERENCE_BATCH_MAX_ERRORS
+from src.schemas import (
+    GetModelResponse,
+    Prompt,
+    ReasoningLLModelResponse,
+    PostInferenceBatchImportResponse,
+)
+from src.exceptions import ModelNotFoundException
+from src.models.prompts import PromptRegistry
+from src.database.crud import (
+    get_model,
+    get_question_prompts,
+    copy_batch_inferences,
+)
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+CUSTOM_ID_PATTERN = re.compile(r"q(\d+)-m(\d+)-t(\d+(?:\.\d+)?)-p(\d+)")
+
+
+def make_custom_id(question_id: int, model_id: int, temperature: float, prompt_id: int) -> str:
+    return f"q{question_id}-m{model_id}-t{temperature}-p{prompt_id}"
+
+
+def parse_custom_id(custom_id: str) -> Tuple[int, int, float, int]:
+    """(question ID, model ID, temperature, prompt ID) of a batch request"""
+    match = CUSTOM_ID_PATTERN.fullmatch(custom_id or "")
+    if match is None:
+        raise ValueError(f"Unrecognized custom_id '{custom_id}'")
+    question_id, model_id, temperature, prompt_id = match.groups()
+    temperature = float(temperature)
+    if not 0 < temperature <= 1:
+        raise ValueError(f"Temperature {temperature} of '{custom_id}' is out of (0, 1]")
+    return int(question_id), int(model_id), temperature, int(prompt_id)
+
+
+async def load_batch_prompts(
+    model_ids: List[int], question_ids: Optional[List[int]], cursor: cursor
+) -> Tuple[List[GetModelResponse], List[Tuple[int, Prompt]]]:
+    """Models and stored (question ID, prompt) pairs of a batch export"""
+    models = []
+    for model_id in model_ids:
+        model = await get_model(id=model_id, cursor=cursor)
+        if model is None:
+            raise ModelNotFoundException(f"Model ID {model_id} does not exist in database")
+        models.append(model)
+    await PromptRegistry.refresh_prompts(cursor=cursor)
+    if question_ids is not None:
+        question_ids = list(dict.fromkeys(question_ids))
+    prompts = await get_question_prompts(question_ids=question_ids, cursor=cursor)
+    return models, prompts
+
+
+def iter_batch_requests(
+    models: List[GetModelResponse],
+    prompts: List[Tuple[int, Prompt]],
+    temperatures: List[float],
+) -> Iterator[str]:
+    """
+    OpenAI Batch API input: one chat completion request per question x model x temperature.
+    Also accepted by vLLM offline batch runner (python -m vllm.entrypoints.openai.run_batch)
+    """
+    for question_id, prompt in prompts:
+        for model in models:
+            for temperature in temperatures:
+                request = {
+                    "custom_id": make_custom_id(
+                        question_id=question_id,
+                        model_id=model.id,
+                        temperature=temperature,
+                        prompt_id=prompt.id,
+                    ),
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {
+                        "model": model.model_name,
+                        "messages": prompt.messages,
+                        "temperature": temperature,
+                    },
+                }
+                yield json.dumps(request, ensure_ascii=False) + "\n"
+
+
+def parse_batch_result(line: str) -> tuple:
+    """Batch output line -> copy_batch_inferences() row"""
+    result = json.loads(line)
+    custom_id = result.get("custom_id")
+    question_id, model_id, temperature, prompt_id = parse_custom_id(custom_id)
+    response = result.get("response") or {}
+    if result.get("error") or response.get("status_code") != 200:
+        error = result.get("error") or (response.get("body") or {}).get("error")
+        raise ValueError(f"Request '{custom_id}' failed: {error}")
+    completion = ChatCompletion.model_validate(response["body"])
+    model_response = ReasoningLLModelResponse.from_completion(
+        completion=completion, temperature=temperature
+    )
+    return (
+        question_id,
+        model_id,
+        getattr(model_response, "reasoning", None),
+        model_response.response,
+        temperature,
+        model_response.prompt_tokens,
+        model_response.completion_tokens,
+        model_response.reasoning_tokens,
+        prompt_id,
+        # Provider's request ID (OpenAI batch_req_..., vLLM run_batch), else the completion ID
+        result.get("id") or completion.id,
+    )
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8")
+    if buffer:
+        yield buffer.decode("utf-8")
+
+
+async def import_batch_results(
+    chunks: AsyncIterator[bytes], cursor: cursor
+) -> PostInferenceBatchImportResponse:
+    """
+    Stream batch output JSONL into questions_transformed, INFERENCE_BATCH_COPY_ROWS rows per COPY.
+    Failed requests and malformed lines are counted and reported, not raised.
+    Results imported before (same batch request ID) are counted as duplicates.
+    """
+    result = PostInferenceBatchImportResponse(imported=0, failed=0)
+    rows = []
+    copied = 0
+
+    async def flush() -> None:
+        nonlocal rows, copied
+        imported, duplicates = await copy_batch_inferences(rows=rows, cursor=cursor)
+        result.imported += imported
+        result.duplicates += duplicates
+        copied += len(rows)
+        rows = []
+
+    line_number = 0
+    async for line in iter_lines(chunks):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            rows.append(parse_batch_result(line))
+        except (ValueError, KeyError, TypeError, ValidationError) as e:
+            result.failed += 1
+            if len(result.errors) < INFERENCE_BATCH_MAX_ERRORS:
+                result.errors.append(f"Line {line_number}: {e}")
+            continue
+        if len(rows) >= INFERENCE_BATCH_COPY_ROWS:
+            await flush()
+    if rows:
+        await flush()
+    result.skipped = copied - result.imported - result.duplicates
+    logger.info(
+        f"Batch import: {result.imported} imported, {result.duplicates} duplicates, "
+        f"{result.skipped} skipped, {result.failed} failed"
+    )
+    return result
@@ -0,0 +1,96 @@
+from typing import Optional
+import hashlib
+import json
+import threading
+from psycopg2.extensions import cursor
+from src.config import settings
+from src.logger import LoggerFactory
+from src.models.constraints import COMPLETION_CACHE_EVICT_EVERY
+from src.schemas import (
+    InferenceContext,
+    LLModelResponse,
+    GetCompletionCacheStatsResponse,
+)
+from src.database.crud import (
+    get_cached_completion,
+    create_cached_completion,
+    evict_completion_cache,
+    get_completion_cache_stats,
+)
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+class CompletionCache:
+    """
+    Completions stored in Postgres (completion_cache table), shared by all workers.
+    Lookups and stores run inside the caller's load/persist transactions.
+    """
+
+    _stats_lock = threading.Lock()
+    _lookups: int = 0
+    _hits: int = 0
+    _stores: int = 0
+
+    @staticmethod
+    def enabled(bypass: bool = False) -> bool:
+        return settings.openai.completion_cache and not bypass
+
+    @staticmethod
+    def get_key(context: InferenceContext, temperature: float) -> str:
+        payload = json.dumps(
+            [context.model.model_name, context.messages, temperature],
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @classmethod
+    async def get(
+        cls, context: InferenceContext, temperature: float, cursor: cursor
+    ) -> Optional[LLModelResponse]:
+        model_response = await get_cached_completion(
+            key=cls.get_key(context=context, temperature=temperature),
+            ttl=settings.openai.completion_cache_ttl,
+            cursor=cursor,
+        )
+        with cls._stats_lock:
+            cls._lookups += 1
+            cls._hits += model_response is not None
+        if model_response is not None:
+            logger.info(
+                f"Completion cache hit for question ID {context.question.id} with model {context.model.model_name}"
+            )
+        return model_response
+
+    @classmethod
+    async def put(
+        cls, context: InferenceContext, model_response: LLModelResponse, cursor: cursor
+    ) -> None:
+        await create_cached_completion(
+            key=cls.get_key(context=context, temperature=model_response.temperature),
+            model_name=context.model.model_name,
+            model_response=model_response,
+            cursor=cursor,
+        )
+        with cls._stats_lock:
+            cls._stores += 1
+            evict = cls._stores % COMPLETION_CACHE_EVICT_EVERY == 0
+        if evict:
+            evicted = await evict_completion_cache(
+                ttl=settings.openai.completion_cache_ttl,
+                max_entries=settings.openai.completion_cache_max_entries,
+                cursor=cursor,
+            )
+            logger.info(f"Evicted {evicted} completion cache entries")
+
+    @classmethod
+    async def get_stats(cls, cursor: cursor) -> GetCompletionCacheStatsResponse:
+        stats = await get_completion_cache_stats(cursor=cursor)
+        with cls._stats_lock:
+            stats.worker_lookups = cls._lookups
+            stats.worker_hits = cls._hits
+        if stats.worker_lookups:
+            stats.worker_hit_rate = stats.worker_hits / stats.worker_lookups
+        return stats
@@ -0,0 +1,120 @@
+from typing import Dict, Tuple, Optional, AsyncGenerator
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import time
+import httpx
+import openai
+from src.config import settings
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+class RegisteredClient:
+    def __init__(self, client: openai.AsyncClient) -> None:
+        self.client = client
+        self.in_use: int = 0
+        self.last_used_at: float = time.monotonic()
+
+
+class OpenAIClientRegistry:
+    """
+    One long-lived openai.AsyncClient (and its HTTP/2 keep-alive pool) per
+    (base URL, API key hash), so inferences skip TCP/TLS setup to the model endpoint.
+    Clients unused for client_idle_ttl secs are closed by a background task.
+    """
+
+    _clients: Dict[Tuple[str, str], RegisteredClient] = {}
+    _evict_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    async def initialize(cls) -> None:
+        if cls._evict_task is None:
+            cls._evict_task = asyncio.create_task(cls._evict_idle_loop())
+        logger.info("OpenAI client registry initialized")
+
+    @classmethod
+    async def close(cls) -> None:
+        if cls._evict_task is not None:
+            cls._evict_task.cancel()
+            cls._evict_task = None
+        clients, cls._clients = cls._clients, {}
+        for entry in clients.values():
+            await entry.client.close()
+        logger.info(f"Closed {len(clients)} OpenAI clients")
+
+    @staticmethod
+    def get_key(base_url: str, api_key: Optional[str]) -> Tuple[str, str]:
+        api_key_hash = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+        return base_url, api_key_hash
+
+    @staticmethod
+    def build_client(base_url: str, api_key: Optional[str]) -> openai.AsyncClient:
+        http_client = httpx.AsyncClient(
+            http2=settings.openai.http2,
+            limits=httpx.Limits(
+                max_connections=settings.openai.max_connections,
+                max_keepalive_connections=settings.openai.max_keepalive_connections,
+                keepalive_expiry=settings.openai.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                settings.openai.request_timeout, connect=settings.openai.connect_timeout
+            ),
+        )
+        # Retries are done by get_completion() so they go through the rate limiter
+        return openai.AsyncClient(
+            base_url=base_url, api_key=api_key, http_client=http_client, max_retries=0
+        )
+
+    @classmethod
+    def _get_entry(cls, base_url: str, api_key: Optional[str]) -> RegisteredClient:
+        key = cls.get_key(base_url=base_url, api_key=api_key)
+        entry = cls._clients.get(key)
+        if entry is None:
+            logger.info(f"Creating OpenAI client for {base_url}")
+            entry = RegisteredClient(
+                client=cls.build_client(base_url=base_url, api_key=api_key)
+            )
+            cls._clients[key] = entry
+        entry.last_used_at = time.monotonic()
+        return entry
+
+    @classmethod
+    @asynccontextmanager
+    async def use(
+        cls, base_url: str, api_key: Optional[str]
+    ) -> AsyncGenerator[openai.AsyncClient, None]:
+        """Borrow the shared client, it is not evicted while borrowed"""
+        entry = cls._get_entry(base_url=base_url, api_key=api_key)
+        entry.in_use += 1
+        try:
+            yield entry.client
+        finally:
+            entry.in_use -= 1
+            entry.last_used_at = time.monotonic()
+
+    @classmethod
+    async def evict_idle(cls) -> int:
+        now = time.monotonic()
+        idle = [
+            key
+            for key, entry in cls._clients.items()
+            if entry.in_use == 0
+            and now - entry.last_used_at > settings.openai.client_idle_ttl
+        ]
+        for key in idle:
+            entry = cls._clients.pop(key)
+            logger.info(f"Closing idle OpenAI client for {key[0]}")
+            await entry.client.close()
+        return len(idle)
+
+    @classmethod
+    async def _evict_idle_loop(cls) -> None:
+        while True:
+            await asyncio.sleep(settings.openai.client_evict_interval)
+            try:
+                await cls.evict_idle()
+            except Exception as e:
+                logger.error(f"Failed to evict idle OpenAI clients: {e}")
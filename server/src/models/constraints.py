@@ -1,3 +1,5 @@
+PROMPT_SYSTEM = "Ты опытный преподаватель Python для студентов гуманитарных специальностей"
+
 PROMPT_TEMPLATE_MULTICHOICE = """
 Ты помощник по реформулировке учебных заданий по Python для студентов гуманитарных направлений, сдающих экзамен по программированию/анализу данных. 
 Перепиши техническое задание на более понятный русский язык для начинающих, 
@@ -82,3 +84,43 @@ PROMPT_TEMPLATE_OTHER = """
 DEFAULT_MODEL_TEMPERATURE = 0.6
 
 DEFAULT_OPENAI_BASE_URL = "https://api.studio.nebius.com/v1/"
+
+# Max simultaneous generations per (base URL, model) in one worker
+DEFAULT_OPENAI_MAX_CONCURRENCY = 8
+
+# Rate limits per (base URL, model): None = learn from x-ratelimit-* response headers
+DEFAULT_OPENAI_REQUESTS_PER_MINUTE = None
+DEFAULT_OPENAI_TOKENS_PER_MINUTE = None
+DEFAULT_OPENAI_MAX_RETRIES = 5
+DEFAULT_OPENAI_RETRY_BACKOFF_BASE = 1  # secs, doubled on every attempt
+DEFAULT_OPENAI_RETRY_BACKOFF_MAX = 60  # secs
+OPENAI_RETRY_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+OPENAI_AIMD_INCREASE = 1  # Concurrency slots regained per "limit" successful calls
+OPENAI_AIMD_DECREASE_FACTOR = 0.5
+OPENAI_AIMD_DECREASE_COOLDOWN = 2  # secs
+OPENAI_CHARS_PER_TOKEN = 3  # Rough prompt size estimate before usage is known
+
+# Shared HTTP client per (base URL, API key)
+DEFAULT_OPENAI_HTTP2 = True
+DEFAULT_OPENAI_MAX_CONNECTIONS = 100
+DEFAULT_OPENAI_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_OPENAI_KEEPALIVE_EXPIRY = 60  # secs an idle connection stays open
+DEFAULT_OPENAI_TIMEOUT = 600  # secs, reasoning models answer slowly
+DEFAULT_OPENAI_CONNECT_TIMEOUT = 10  # secs
+DEFAULT_OPENAI_CLIENT_IDLE_TTL = 1800  # secs before an unused client is closed
+DEFAULT_OPENAI_CLIENT_EVICT_INTERVAL = 60  # secs
+
+# Replicas of one model (MODEL_ENDPOINTS): load balancing and failover
+DEFAULT_OPENAI_ENDPOINT_MAX_FAILURES = 3  # Consecutive failures before an endpoint is taken out of rotation
+DEFAULT_OPENAI_ENDPOINT_PROBE_INTERVAL = 10  # secs between health probes of ejected endpoints
+DEFAULT_OPENAI_ENDPOINT_PROBE_TIMEOUT = 5  # secs
+OPENAI_ENDPOINT_LATENCY_EWMA_ALPHA = 0.3  # Weight of the newest latency sample
+
+DEFAULT_COMPLETION_CACHE = False  # Opt-in: repeated sampling at the same temperature returns the cached answer
+DEFAULT_COMPLETION_CACHE_TTL = 7 * 24 * 3600  # secs
+DEFAULT_COMPLETION_CACHE_MAX_ENTRIES = 100_000
+COMPLETION_CACHE_EVICT_EVERY = 100  # Stores per worker between eviction runs
+
+# Prompt templates are versioned in database, the built-in ones above are registered as the first version
+PROMPT_TEMPLATE_REFRESH_INTERVAL = 30  # secs before a worker checks for a newer active template
+PROMPT_CACHE_MAX_ENTRIES = 10_000  # Rendered prompts kept in memory per worker
@@ -1,108 +1,99 @@
-from typing import List, Optional
+from typing import List, Optional, Tuple, Iterator
+from contextlib import AsyncExitStack
 import re
 from psycopg2.extensions import cursor
 from typing import List
 from openai import AsyncClient
 from openai.types.chat import ChatCompletion
 import string
-import json
-import pandas as pd
+import base64
+import datetime
+import anyio
+import asyncio
+import time
+import openai
+import pyarrow as pa
+from fastapi.exceptions import HTTPException
 from src.models.constraints import (
-    PROMPT_TEMPLATE_MULTICHOICE,
-    PROMPT_TEMPLATE_CODERUNNER,
-    PROMPT_TEMPLATE_OTHER,
     DEFAULT_MODEL_TEMPERATURE,
+    OPENAI_RETRY_STATUS_CODES,
 )
 from src.constraints import (
-    QUESTION_MULTICHOICE_TYPES,
-    QUESTION_CODERUNNER_TYPES,
     QUESTION_CLOZE_TYPES,
+    EXPORT_WATERMARK_LAG,
+    EXPORT_CURSOR_VERSION,
 )
-from src.schemas import Question, ReasoningLLModelResponse, GetPromptResponse
+from src.schemas import (
+    ReasoningLLModelResponse,
+    LLModelResponse,
+    GetPromptResponse,
+    InferenceContext,
+    PostInferenceRequest,
+    InferenceResult,
+    get_completion_usage,
+)
+from src.exceptions import (
+    ModelNotFoundException,
+    QuestionNotFoundException,
+    InvalidExportCursorException,
+)
+from src.database.pool import LazyCursor
+from src.database.export import stream_copy, stream_arrow
+from src.models.limits import (
+    RateLimiter,
+    get_retry_after,
+    get_backoff_delay,
+    estimate_tokens,
+)
+from src.models.cache import CompletionCache
+from src.models.page_cache import PageCache
+from src.models.prompts import PromptRegistry
+from src.models.routing import ModelRouter, is_endpoint_failure
+from src.config import settings
+from src.logger import LoggerFactory
+from src.types import ExportFormat
 from src.database.crud import (
     get_model,
     get_question,
     create_inference,
     get_question_admin,
-    get_questions_all_admin,
-    get_inference,
-    get_scores_for_inference,
+    get_report_query,
+    get_export_watermark,
+    get_dataset_query,
+    copy_report_csv,
+    copy_dataset_csv,
 )
 
 
-class PromptBuilder:
-    prompt_template_multichoice: str = PROMPT_TEMPLATE_MULTICHOICE
-    prompt_template_coderunner: str = PROMPT_TEMPLATE_CODERUNNER
-    prompt_template_other: str = PROMPT_TEMPLATE_OTHER
-
-    @staticmethod
-    def build(question: Question) -> str:
-        if question.type in QUESTION_MULTICHOICE_TYPES:
-            return PromptBuilder.build_multichoice(question=question)
-        if question.type in QUESTION_CODERUNNER_TYPES:
-            return PromptBuilder.build_coderunner(question=question)
-        return PromptBuilder.build_other(question=question)
-
-    @classmethod
-    def build_multichoice(cls, question: Question) -> str:
-        if question.type not in QUESTION_MULTICHOICE_TYPES:
-            raise ValueError(
-                f"Question of type '{question.type}' wrongly passeed to Multichoice prompt build method"
-            )
-        all_answers = [answer.text for answer in question.answers]
-        correct_answers = [
-            answer.text for answer in question.answers if answer.is_correct
-        ]
-        return cls.prompt_template_multichoice.format(
-            task_type=question.type,
-            task_text=question.text,
-            all_answers=all_answers,
-            correct_answers=correct_answers,
-        )
-
-    @classmethod
-    def build_coderunner(cls, question: Question) -> str:
-        if question.type not in QUESTION_CODERUNNER_TYPES:
-            raise ValueError(
-                f"Question of type '{question.type}' wrongly passeed to Coderunner prompt build method"
-            )
-        correct_answers = [
-            answer.text for answer in question.answers
-        ]  # Coderunner only contains correct answers
-        test_cases = [
-            f"[{idx+1}] Входные данные:\n{test_case.input}\nОжидаемый вывод:\n{test_case.expected_output}\n\n"
-            for idx, test_case in enumerate(question.test_cases)
-        ]
-        return cls.prompt_template_coderunner.format(
-            task_type=question.type,
-            task_text=question.text,
-            correct_answers=correct_answers,
-            test_cases=test_cases,
-        )
-
-    @classmethod
-    def build_other(cls, question: Question) -> str:
-        if question.type in QUESTION_MULTICHOICE_TYPES:
-            raise ValueError(
-                f"Question of type '{question.type}' wrongly passeed to Other prompt build method. Must be passed to Multichoice builder."
-            )
-        if question.type in QUESTION_CODERUNNER_TYPES:
-            raise ValueError(
-                f"Question of type '{question.type}' wrongly passeed to Other prompt build method. Must be passed to Coderunner builder."
-            )
-        return cls.prompt_template_other.format(
-            task_type=question.type, task_text=question.text
-        )
+logger = LoggerFactory.getLogger(__name__)
 
 
-def construct_messages(question: Question) -> List[dict]:
-    return [
-        {
-            "role": "system",
-            "content": "Ты опытный преподаватель Python для студентов гуманитарных специальностей",
-        },
-        {"role": "user", "content": PromptBuilder.build(question=question)},
+MESSAGES_ARROW_TYPE = pa.list_(pa.struct([("role", pa.string()), ("content", pa.string())]))
+REPORT_ARROW_SCHEMA = pa.schema(
+    [
+        ("base_model_name", pa.dictionary(pa.int32(), pa.string())),
+        ("model_version", pa.int32()),
+        ("user_group_cd", pa.dictionary(pa.int32(), pa.string())),
+        ("messages", MESSAGES_ARROW_TYPE),
+        ("prompt_id", pa.int32()),
+        ("prompt", pa.string()),
+        ("prompt_template_version", pa.int32()),
+        ("response_id", pa.int32()),
+        ("response", pa.string()),
+        ("helpful", pa.int8()),
+        ("does_not_reveal_answer", pa.int8()),
+        ("does_not_contain_errors", pa.bool_()),
+        ("only_relevant_info", pa.int8()),
     ]
+)
+DATASET_ARROW_SCHEMA = pa.schema(
+    [
+        ("messages", MESSAGES_ARROW_TYPE),
+        ("prompt_id", pa.int32()),
+        ("prompt", pa.string()),
+        ("prompt_template_version", pa.int32()),
+    ]
+)
 
 
 async def get_completion(
@@ -110,102 +101,323 @@ async def get_completion(
     model: str,
     messages: List[dict],
     temperature: float = DEFAULT_MODEL_TEMPERATURE,
-) -> ChatCompletion:
-    response = await client.chat.completions.create(
-        model=model,
-        messages=messages,
-        temperature=temperature,
-    )
-    return response
+) -> Tuple[ChatCompletion, int]:
+    """
+    Call the model within the endpoint's rate and concurrency limits.
+    Rate limits (429), timeouts and server errors are retried with jittered backoff,
+    honoring Retry-After; no concurrency slot is held while backing off.
+    Models with replicas (ModelRouter) are called on the best healthy replica with the
+    client's API key, a retry goes to another replica when there is one.
+    Returns the completion and latency (ms) of the successful call.
+    """
+    router = ModelRouter.get(model_name=model)
+    prompt_tokens = estimate_tokens(messages)
+    endpoint = None
+    attempt = 0
+    while True:
+        attempt += 1
+        retry_after = None
+        async with AsyncExitStack() as stack:
+            attempt_client = client
+            if router is not None:
+                endpoint = router.choose(exclude=endpoint)
+                attempt_client = await stack.enter_async_context(
+                    endpoint.use(api_key=client.api_key)
+                )
+            limiter = RateLimiter.get(base_url=str(attempt_client.base_url), model_name=model)
+            try:
+                async with limiter.limit(tokens=prompt_tokens):
+                    started_at = time.monotonic()
+                    raw_response = await attempt_client.chat.completions.with_raw_response.create(
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                    )
+            except (openai.APIStatusError, openai.APIConnectionError) as e:
+                error = e
+            else:
+                latency_ms = round((time.monotonic() - started_at) * 1000)
+                response = raw_response.parse()
+                usage = get_completion_usage(response)
+                limiter.on_success(
+                    headers=raw_response.headers,
+                    extra_tokens=usage["completion_tokens"] or 0,
+                )
+                if endpoint is not None:
+                    router.on_success(
+                        endpoint=endpoint,
+                        latency_ms=latency_ms,
+                        completion_tokens=usage["completion_tokens"],
+                    )
+                return response, latency_ms
+
+        if endpoint is not None and is_endpoint_failure(error):
+            router.on_failure(endpoint=endpoint, error=error)
+        if isinstance(error, openai.APIStatusError):
+            if error.status_code not in OPENAI_RETRY_STATUS_CODES or error.code == "insufficient_quota":
+                raise error
+            if error.status_code == 429:
+                retry_after = limiter.on_rate_limited(headers=error.response.headers)
+            else:
+                retry_after = get_retry_after(error.response.headers)
+        if attempt > settings.openai.max_retries:
+            raise error
+        delay = get_backoff_delay(attempt=attempt, retry_after=retry_after)
+        logger.warning(
+            f"Completion with {model} failed (attempt {attempt}): {error}. Retrying in {delay:.1f} secs"
+        )
+        await asyncio.sleep(delay)
 
 
 async def make_prompt(question_id: int, cursor: cursor) -> GetPromptResponse:
     question = await get_question_admin(id=question_id, cursor=cursor)
-    messages = construct_messages(question=question)
-    return GetPromptResponse(messages=messages, prompt=messages[1]["content"])
+    prompt = await PromptRegistry.get_prompt(question=question, cursor=cursor)
+    return GetPromptResponse(
+        messages=prompt.messages,
+        prompt=prompt.messages[1]["content"],
+        prompt_id=prompt.id,
+        template_version=prompt.template_version,
+    )
 
 
-async def make_inference(
-    client: AsyncClient,
-    model_id: int,
-    question_id: int,
-    cursor: cursor,
-    temperature: float = DEFAULT_MODEL_TEMPERATURE,
-) -> int:
+async def load_inference_context(
+    model_id: int, question_id: int, cursor: cursor
+) -> InferenceContext:
+    """Phase 1 of inference: read model and question, get the stored prompt messages"""
     model = await get_model(id=model_id, cursor=cursor)
+    if model is None:
+        raise ModelNotFoundException(f"Model ID {model_id} does not exist in database")
     question = await get_question_admin(id=question_id, cursor=cursor)
-    messages = construct_messages(question=question)
-    completion = await get_completion(
+    if question is None:
+        raise QuestionNotFoundException(
+            f"Question ID {question_id} does not exist in database"
+        )
+    prompt = await PromptRegistry.get_prompt(question=question, cursor=cursor)
+    return InferenceContext(
+        model=model,
+        question=question,
+        messages=prompt.messages,
+        prompt_id=prompt.id,
+        prompt_template_version=prompt.template_version,
+    )
+
+
+async def generate_inference(
+    client: AsyncClient,
+    context: InferenceContext,
+    temperature: float = DEFAULT_MODEL_TEMPERATURE,
+) -> LLModelResponse:
+    """Phase 2 of inference: call the model. Does not touch the database"""
+    completion, latency_ms = await get_completion(
         client=client,
-        model=model.model_name,
-        messages=messages,
+        model=context.model.model_name,
+        messages=context.messages,
         temperature=temperature,
     )
     model_response = ReasoningLLModelResponse.from_completion(
         completion=completion, temperature=temperature
     )
+    model_response.latency_ms = latency_ms
+    return model_response
+
+
+async def persist_inference(
+    context: InferenceContext, model_response: LLModelResponse, cursor: cursor
+) -> int:
+    """Phase 3 of inference: save model response"""
     return await create_inference(
-        question_id=question_id,
-        model_id=model_id,
+        question_id=context.question.id,
+        model_id=context.model.id,
         inference=model_response,
         cursor=cursor,
+        prompt_id=context.prompt_id,
+        prompt_template_version=context.prompt_template_version,
     )
 
 
-async def build_report_df(cursor: cursor) -> pd.DataFrame:
-    all_questions_in_db = await get_questions_all_admin(cursor=cursor)
-    data = []
-    for question in all_questions_in_db:
-        messages = construct_messages(question=question)
-        prompt = PromptBuilder.build(question=question)
-        for inference_id in question.inference_ids:
-            inference = await get_inference(id=inference_id, cursor=cursor)
-            model = await get_model(id=inference.model_id, cursor=cursor)
-            scores = await get_scores_for_inference(
-                inference_id=inference.id, cursor=cursor
+async def make_inference(
+    client: AsyncClient,
+    model_id: int,
+    question_id: int,
+    cursor: LazyCursor,
+    temperature: float = DEFAULT_MODEL_TEMPERATURE,
+    bypass_cache: bool = False,
+) -> Tuple[int, LLModelResponse]:
+    """
+    Load -> generate -> persist, each database phase in its own short transaction.
+    No connection is held while waiting for the model response.
+    With completion cache enabled the lookup joins the load transaction and
+    generation is skipped on a hit. Returns inference ID and the saved response.
+    """
+    use_cache = CompletionCache.enabled(bypass=bypass_cache)
+    model_response = None
+    with cursor.transaction():
+        context = await load_inference_context(
+            model_id=model_id, question_id=question_id, cursor=cursor
+        )
+        if use_cache:
+            model_response = await CompletionCache.get(
+                context=context, temperature=temperature, cursor=cursor
+            )
+
+    if model_response is None:
+        model_response = await generate_inference(
+            client=client, context=context, temperature=temperature
+        )
+
+    with cursor.transaction():
+        inference_id = await persist_inference(
+            context=context, model_response=model_response, cursor=cursor
+        )
+        if CompletionCache.enabled() and not model_response.cached:
+            await CompletionCache.put(
+                context=context, model_response=model_response, cursor=cursor
+            )
+    await PageCache.invalidate()
+    return inference_id, model_response
+
+
+async def make_inference_result(
+    client: AsyncClient,
+    inference_request: PostInferenceRequest,
+    statement_timeout: Optional[int] = None,
+) -> InferenceResult:
+    """Run one inference on its own cursor, reporting failure instead of raising"""
+    result = InferenceResult(
+        question_id=inference_request.question_id,
+        model_id=inference_request.model_id,
+        temperature=inference_request.temperature,
+    )
+    try:
+        with LazyCursor(statement_timeout=statement_timeout) as cursor:
+            result.inference_id, model_response = await make_inference(
+                client=client,
+                model_id=inference_request.model_id,
+                question_id=inference_request.question_id,
+                cursor=cursor,
+                temperature=inference_request.temperature,
+                bypass_cache=inference_request.bypass_cache,
             )
-            for score in scores:
-                data.append(
-                    {
-                        "base_model_name": model.base_model_name,
-                        "model_version": model.version,
-                        "user_group_cd": score.user_group_cd,
-                        "messages": json.dumps(messages),
-                        "prompt_id": question.id,
-                        "prompt": prompt,
-                        "response_id": inference.id,
-                        "response": inference.text,
-                        "helpful": score.helpful,
-                        "does_not_reveal_answer": score.does_not_reveal_answer,
-                        "does_not_contain_errors": (score.does_not_contain_errors > 1),
-                        "only_relevant_info": score.only_relevant_info,
-                    }
-                )
-    return pd.DataFrame(data)
-
-
-async def build_dataset_df(
-    cursor: cursor, question_ids: Optional[List[int]] = None
-) -> pd.DataFrame:
-    if question_ids is None:
-        questions = await get_questions_all_admin(cursor=cursor)
-    else:
-        questions = [
-            question
-            for question_id in question_ids
-            if (question := await get_question_admin(id=question_id, cursor=cursor))
-            is not None
-        ]
-
-    data = []
-    for question in questions:
-        messages = construct_messages(question=question)
-        prompt = PromptBuilder.build(question=question)
-        data.append(
-            {
-                "messages": json.dumps(messages),
-                "prompt_id": question.id,
-                "prompt": prompt,
-            }
+            result.cached = model_response.cached
+    except Exception as e:
+        logger.error(
+            f"Inference for question ID {inference_request.question_id} with model ID {inference_request.model_id} failed: {e}"
+        )
+        result.error = str(e.detail) if isinstance(e, HTTPException) else str(e)
+    return result
+
+
+async def make_inferences(
+    client: AsyncClient,
+    inference_requests: List[PostInferenceRequest],
+    statement_timeout: Optional[int] = None,
+) -> List[InferenceResult]:
+    """
+    Run a batch of inferences concurrently (bounded by RateLimiter).
+    Each inference is saved as soon as it completes, failures do not stop the batch.
+    """
+    results: List[Optional[InferenceResult]] = [None] * len(inference_requests)
+
+    async def run(idx: int, inference_request: PostInferenceRequest) -> None:
+        results[idx] = await make_inference_result(
+            client=client,
+            inference_request=inference_request,
+            statement_timeout=statement_timeout,
+        )
+
+    async with anyio.create_task_group() as task_group:
+        for idx, inference_request in enumerate(inference_requests):
+            task_group.start_soon(run, idx, inference_request)
+    return results
+
+
+def make_export_cursor(until: datetime.datetime) -> str:
+    """Opaque cursor of an incremental export: the next export starts where this one ended"""
+    payload = f"{EXPORT_CURSOR_VERSION}:{until.isoformat()}".encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def parse_export_cursor(value: str) -> datetime.datetime:
+    try:
+        payload = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).decode("utf-8")
+        version, until = payload.split(":", 1)
+        if version != EXPORT_CURSOR_VERSION:
+            raise ValueError(f"Unsupported cursor version '{version}'")
+        return datetime.datetime.fromisoformat(until)
+    except ValueError as e:  # Includes binascii.Error and UnicodeDecodeError
+        raise InvalidExportCursorException(f"Invalid export cursor: {e}")
+
+
+async def get_report_window(
+    since: Optional[datetime.datetime], export_cursor: Optional[str], cursor: cursor
+) -> Tuple[Optional[datetime.datetime], datetime.datetime]:
+    """
+    [since, until) creation time window of the scores to export. until lags behind now by
+    EXPORT_WATERMARK_LAG secs, so scores of transactions still in flight are not skipped:
+    they fall into the next window. Without since or a cursor the window is all history.
+    """
+    if since is not None and export_cursor is not None:
+        raise InvalidExportCursorException("Pass either since or cursor, not both")
+    if export_cursor is not None:
+        since = parse_export_cursor(export_cursor)
+    until = await get_export_watermark(lag=EXPORT_WATERMARK_LAG, cursor=cursor)
+    return since, until
+
+
+def stream_report(
+    format: ExportFormat = "csv",
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    statement_timeout: Optional[int] = None,
+) -> Iterator[bytes]:
+    """
+    Report (scores created in [since, until) if given) streamed as it is produced:
+    CSV formatted by Postgres (COPY TO STDOUT), Parquet / Arrow with typed columns
+    """
+
+    def get_query(cursor: cursor) -> str:
+        return get_report_query(since=since, until=until, cursor=cursor)
+
+    if format == "csv":
+        return stream_copy(
+            copy=lambda cursor, file: copy_report_csv(
+                query=get_query(cursor), file=file, cursor=cursor
+            ),
+            statement_timeout=statement_timeout,
+        )
+    return stream_arrow(
+        get_query=get_query,
+        schema=REPORT_ARROW_SCHEMA,
+        format=format,
+        statement_timeout=statement_timeout,
+    )
+
+
+def stream_dataset(
+    question_ids: Optional[List[int]] = None,
+    format: ExportFormat = "csv",
+    statement_timeout: Optional[int] = None,
+) -> Iterator[bytes]:
+    """
+    Dataset (all questions, or question_ids in the given order) streamed as it is produced:
+    CSV formatted by Postgres (COPY TO STDOUT), Parquet / Arrow with typed columns
+    """
+    if question_ids is not None:
+        question_ids = list(dict.fromkeys(question_ids))
+
+    def get_query(cursor: cursor) -> str:
+        return get_dataset_query(question_ids=question_ids, cursor=cursor)
+
+    if format == "csv":
+        return stream_copy(
+            copy=lambda cursor, file: copy_dataset_csv(
+                query=get_query(cursor), file=file, cursor=cursor
+            ),
+            statement_timeout=statement_timeout,
         )
-    return pd.DataFrame(data)
+    return stream_arrow(
+        get_query=get_query,
+        schema=DATASET_ARROW_SCHEMA,
+        format=format,
+        statement_timeout=statement_timeout,
+    )
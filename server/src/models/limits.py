@@ -0,0 +1,263 @@
+from typing import Dict, Tuple, AsyncGenerator, Optional, Mapping, List
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+import asyncio
+import datetime
+import random
+import re
+import time
+from src.config import settings
+from src.logger import LoggerFactory
+from src.models.constraints import (
+    OPENAI_AIMD_INCREASE,
+    OPENAI_AIMD_DECREASE_FACTOR,
+    OPENAI_AIMD_DECREASE_COOLDOWN,
+    OPENAI_CHARS_PER_TOKEN,
+)
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse rate limit reset values: "1s", "6m0s", "20ms", "0.5" -> secs"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", value)
+    if not parts:
+        return None
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+
+def parse_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def get_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Delay requested by the server: retry-after-ms, retry-after (secs or HTTP date)"""
+    if headers is None:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms is not None:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.datetime.now(retry_at.tzinfo)).total_seconds())
+
+
+def get_backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Exponential backoff with full jitter, never shorter than what the server asked for"""
+    delay = random.uniform(
+        0,
+        min(
+            settings.openai.retry_backoff_max,
+            settings.openai.retry_backoff_base * 2 ** (attempt - 1),
+        ),
+    )
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, settings.openai.retry_backoff_base))
+    return delay
+
+
+def estimate_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(len(message.get("content") or "") for message in messages) // OPENAI_CHARS_PER_TOKEN + 1
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at rate per sec up to capacity. Without a rate it never waits
+    until one is learned from x-ratelimit-* headers. May go into debt (consume()).
+    """
+
+    def __init__(self, rate: Optional[float] = None, capacity: Optional[float] = None) -> None:
+        self._configured = rate is not None
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens: float = capacity or 0.0
+        self._updated_at = time.monotonic()
+        self._blocked_until: float = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.rate is not None:
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated_at) * self.rate
+            )
+        self._updated_at = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        async with self._lock:  # FIFO: waiters do not overtake each other
+            while True:
+                blocked_for = self._blocked_until - time.monotonic()
+                if blocked_for > 0:
+                    await asyncio.sleep(blocked_for)
+                    continue
+                self._refill()
+                if self.rate is None:
+                    return
+                # Requests larger than the bucket wait for a full bucket instead of forever
+                needed = min(amount, self.capacity)
+                if self._tokens >= needed:
+                    self._tokens -= amount
+                    return
+                await asyncio.sleep((needed - self._tokens) / self.rate)
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self._tokens -= amount
+
+    def block(self, secs: float) -> None:
+        self._blocked_until = max(self._blocked_until, time.monotonic() + secs)
+
+    def observe(
+        self, limit: Optional[int], remaining: Optional[int], reset: Optional[float]
+    ) -> None:
+        """Sync with provider state from x-ratelimit-{limit,remaining,reset}-* headers"""
+        if limit and not self._configured:
+            if self.rate is None:
+                self._tokens = float(limit)
+            self.capacity = float(limit)
+            self.rate = limit / 60  # Providers report per-minute limits
+        self._refill()
+        if remaining is not None and self.rate is not None:
+            self._tokens = min(self._tokens, float(remaining))
+        if remaining == 0 and reset:
+            self.block(reset)
+
+
+class AdaptiveConcurrency:
+    """
+    Concurrency limit adjusted by AIMD: grows by OPENAI_AIMD_INCREASE / limit on
+    every success up to max_limit, shrinks by OPENAI_AIMD_DECREASE_FACTOR when throttled.
+    """
+
+    def __init__(self, max_limit: int) -> None:
+        self.max_limit = max_limit
+        self.limit: float = float(max_limit)
+        self.in_flight: int = 0
+        self._last_decrease_at: float = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self) -> None:
+        self.limit = min(float(self.max_limit), self.limit + OPENAI_AIMD_INCREASE / self.limit)
+
+    def on_throttle(self) -> None:
+        now = time.monotonic()
+        # One decrease per cooldown: a burst of 429s from the same overload counts once
+        if now - self._last_decrease_at < OPENAI_AIMD_DECREASE_COOLDOWN:
+            return
+        self._last_decrease_at = now
+        self.limit = max(1.0, self.limit * OPENAI_AIMD_DECREASE_FACTOR)
+        logger.warning(f"Throttled: concurrency limit lowered to {int(self.limit)}")
+
+
+class EndpointLimiter:
+    """Request rate, token rate and adaptive concurrency of one (base URL, model)"""
+
+    def __init__(self, base_url: str, model_name: str) -> None:
+        self.base_url = base_url
+        self.model_name = model_name
+        rpm = settings.openai.requests_per_minute
+        tpm = settings.openai.tokens_per_minute
+        self.requests = TokenBucket(rate=rpm / 60 if rpm else None, capacity=rpm)
+        self.tokens = TokenBucket(rate=tpm / 60 if tpm else None, capacity=tpm)
+        self.concurrency = AdaptiveConcurrency(
+            max_limit=settings.openai.get_max_concurrency(
+                base_url=base_url, model_name=model_name
+            )
+        )
+
+    @asynccontextmanager
+    async def limit(self, tokens: int = 0) -> AsyncGenerator:
+        await self.requests.acquire(1)
+        if tokens:
+            await self.tokens.acquire(tokens)
+        await self.concurrency.acquire()
+        try:
+            yield
+        finally:
+            await self.concurrency.release()
+
+    def observe_headers(self, headers: Optional[Mapping[str, str]]) -> None:
+        if headers is None:
+            return
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            bucket.observe(
+                limit=parse_int(headers.get(f"x-ratelimit-limit-{kind}")),
+                remaining=parse_int(headers.get(f"x-ratelimit-remaining-{kind}")),
+                reset=parse_duration(headers.get(f"x-ratelimit-reset-{kind}")),
+            )
+
+    def on_success(
+        self, headers: Optional[Mapping[str, str]] = None, extra_tokens: int = 0
+    ) -> None:
+        self.observe_headers(headers)
+        if extra_tokens:  # Completion tokens are only known afterwards
+            self.tokens.consume(extra_tokens)
+        self.concurrency.on_success()
+
+    def on_rate_limited(self, headers: Optional[Mapping[str, str]] = None) -> Optional[float]:
+        """Register a 429: pause everyone for Retry-After and lower concurrency"""
+        self.observe_headers(headers)
+        retry_after = get_retry_after(headers)
+        if retry_after is not None:
+            self.requests.block(retry_after)
+        self.concurrency.on_throttle()
+        logger.warning(
+            f"Rate limited by {self.base_url} for {self.model_name}, retry after {retry_after} secs"
+        )
+        return retry_after
+
+
+class RateLimiter:
+    """Per (base URL, model) limiters shared by all generations in this worker"""
+
+    _limiters: Dict[Tuple[str, str], EndpointLimiter] = {}
+
+    @classmethod
+    def get(cls, base_url: str, model_name: str) -> EndpointLimiter:
+        key = (base_url, model_name)
+        if key not in cls._limiters:
+            limiter = EndpointLimiter(base_url=base_url, model_name=model_name)
+            logger.info(
+                f"Concurrency limit for {model_name} at {base_url}: {limiter.concurrency.max_limit}"
+            )
+            cls._limiters[key] = limiter
+        return cls._limiters[key]
+
+    @classmethod
+    @asynccontextmanager
+    async def limit(cls, base_url: str, model_name: str, tokens: int = 0) -> AsyncGenerator:
+        async with cls.get(base_url=base_url, model_name=model_name).limit(tokens=tokens):
+            yield
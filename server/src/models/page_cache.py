@@ -0,0 +1,201 @@
+from typing import Awaitable, Callable, Dict, Optional, Sequence
+from collections import OrderedDict
+import asyncio
+import threading
+import time
+from redis.asyncio import RedisError
+from src.config import settings
+from src.logger import LoggerFactory
+from src.schemas import GetPageCacheStatsResponse
+from src.session.storage import SessionStorage, RedisConnection
+from src.types import Language, UserGroupCD
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+class PageCache:
+    """
+    Rendered student pages, the same for every student of a User Group and language.
+    Keyed by (data version, base URL, template, User Group, language, object IDs): the data
+    version is a Redis counter shared by all workers, bumped by invalidate() once a write of
+    page data (quiz ingest, new inferences, User Group levels) has committed, so stale pages
+    are never looked up again. Pages are kept in an in-process LRU and, with
+    page_cache_redis, in Redis for the other workers. Concurrent views of a page being
+    rendered wait for that render instead of starting their own.
+    """
+
+    _lock = threading.Lock()
+    _entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires at, html)
+    _rendering: Dict[str, asyncio.Future] = {}
+    _hits: int = 0
+    _redis_hits: int = 0
+    _renders: int = 0
+    _bypassed: int = 0
+    _invalidations: int = 0
+
+    @staticmethod
+    def enabled() -> bool:
+        return settings.frontend.page_cache_max_entries > 0
+
+    @staticmethod
+    def get_key(
+        version: int,
+        base_url: str,
+        template: str,
+        user_group_cd: UserGroupCD,
+        lang: Language,
+        ids: Sequence[int] = (),
+    ) -> str:
+        # Templates build absolute static URLs from the request, hence the base URL
+        object_ids = ",".join(str(id) for id in ids)
+        return f"{version}:{base_url}:{template}:{user_group_cd}:{lang}:{object_ids}"
+
+    @classmethod
+    async def get_or_render(
+        cls,
+        render: Callable[[], Awaitable[str]],
+        base_url: str,
+        template: str,
+        user_group_cd: UserGroupCD,
+        lang: Language,
+        ids: Sequence[int] = (),
+    ) -> str:
+        """HTML of the page: cached, or from render() (which reads the data and renders it)"""
+        if not cls.enabled():
+            return await render()
+
+        async with SessionStorage.get_connection() as redis_connection:
+            try:
+                version = await redis_connection.get_page_cache_version()
+            except RedisError as e:
+                logger.warning(f"Page cache bypassed, data version is unavailable: {e}")
+                with cls._lock:
+                    cls._bypassed += 1
+                return await render()
+
+            key = cls.get_key(
+                version=version,
+                base_url=base_url,
+                template=template,
+                user_group_cd=user_group_cd,
+                lang=lang,
+                ids=ids,
+            )
+            while True:
+                html = cls._get_local(key=key)
+                if html is not None:
+                    return html
+
+                future = cls._rendering.get(key)
+                if future is None:
+                    break
+                await asyncio.wait({future})
+                if not future.cancelled():
+                    with cls._lock:
+                        cls._hits += 1
+                    return future.result()
+                # Render failed (or its client left): look again, one of us renders it
+
+            future = asyncio.get_running_loop().create_future()
+            cls._rendering[key] = future
+            try:
+                html = await cls._get_or_render(
+                    key=key, render=render, redis_connection=redis_connection
+                )
+                future.set_result(html)
+                return html
+            finally:
+                del cls._rendering[key]
+                if not future.done():
+                    future.cancel()
+
+    @classmethod
+    async def _get_or_render(
+        cls, key: str, render: Callable[[], Awaitable[str]], redis_connection: RedisConnection
+    ) -> str:
+        html = None
+        if settings.frontend.page_cache_redis:
+            try:
+                html = await redis_connection.get_page(key=key)
+            except RedisError as e:
+                logger.warning(f"Page cache Redis lookup failed: {e}")
+        if html is not None:
+            with cls._lock:
+                cls._redis_hits += 1
+        else:
+            html = await render()
+            with cls._lock:
+                cls._renders += 1
+            if settings.frontend.page_cache_redis:
+                try:
+                    await redis_connection.set_page(key=key, html=html)
+                except RedisError as e:
+                    logger.warning(f"Page cache Redis store failed: {e}")
+        cls._put_local(key=key, html=html)
+        return html
+
+    @classmethod
+    def _get_local(cls, key: str) -> Optional[str]:
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, html = entry
+            if expires_at <= time.monotonic():
+                del cls._entries[key]
+                return None
+            cls._entries.move_to_end(key)
+            cls._hits += 1
+            return html
+
+    @classmethod
+    def _put_local(cls, key: str, html: str) -> None:
+        expires_at = time.monotonic() + settings.frontend.page_cache_ttl
+        with cls._lock:
+            cls._entries[key] = (expires_at, html)
+            cls._entries.move_to_end(key)
+            while len(cls._entries) > settings.frontend.page_cache_max_entries:
+                cls._entries.popitem(last=False)
+
+    @classmethod
+    async def invalidate(cls) -> None:
+        """Drop every cached page, call after the transaction writing page data committed"""
+        if not cls.enabled():
+            return
+        with cls._lock:
+            cls._entries.clear()
+            cls._invalidations += 1
+        try:
+            async with SessionStorage.get_connection() as redis_connection:
+                await redis_connection.incr_page_cache_version()
+        except RedisError as e:
+            # Other workers keep serving their pages until page_cache_ttl expires them
+            logger.warning(f"Page cache data version was not bumped: {e}")
+
+    @classmethod
+    async def get_stats(cls) -> GetPageCacheStatsResponse:
+        version = None
+        try:
+            async with SessionStorage.get_connection() as redis_connection:
+                version = await redis_connection.get_page_cache_version()
+        except RedisError as e:
+            logger.warning(f"Page cache data version is unavailable: {e}")
+        with cls._lock:
+            stats = GetPageCacheStatsResponse(
+                enabled=cls.enabled(),
+                redis=settings.frontend.page_cache_redis,
+                version=version,
+                entries=len(cls._entries),
+                max_entries=settings.frontend.page_cache_max_entries,
+                hits=cls._hits,
+                redis_hits=cls._redis_hits,
+                renders=cls._renders,
+                bypassed=cls._bypassed,
+                invalidations=cls._invalidations,
+            )
+        views = stats.hits + stats.redis_hits + stats.renders
+        if views:
+            stats.hit_rate = stats.hits / views
+            stats.render_rate = stats.renders / views
+        return stats
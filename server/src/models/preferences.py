@@ -0,0 +1,184 @@
+from typing import Dict, Iterator, List, Optional
+from psycopg2.extensions import cursor
+import hashlib
+import json
+import zipfile
+from src.constraints import (
+    EXPORT_PREFERENCE_BATCH_ROWS,
+    EXPORT_SPLIT_SALT,
+    EXPORT_GZIP_LEVEL,
+)
+from src.database.pool import ConnectionPoolManager
+from src.database.export import BufferSink
+from src.database.crud import (
+    fetch_batches,
+    get_preference_question_ids,
+    get_preferences_query,
+)
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+SPLITS = ("train", "validation")
+
+
+def assign_split(question_id: int, validation_ratio: float) -> str:
+    """
+    train or validation by a hash of the question, so the split does not change between
+    exports and all prompts of a question land in the same split. Raising validation_ratio
+    only moves questions from train to validation.
+    """
+    digest = hashlib.sha256(f"{EXPORT_SPLIT_SALT}:{question_id}".encode("utf-8")).digest()
+    position = int.from_bytes(digest[:8], "big") / 2**64
+    return "validation" if position < validation_ratio else "train"
+
+
+async def get_split_question_ids(validation_ratio: float, cursor: cursor) -> Dict[str, List[int]]:
+    """Split -> IDs of the questions with scored inferences in it"""
+    split_question_ids = {split: [] for split in SPLITS}
+    for question_id in await get_preference_question_ids(cursor=cursor):
+        split = assign_split(question_id=question_id, validation_ratio=validation_ratio)
+        split_question_ids[split].append(question_id)
+    return split_question_ids
+
+
+def make_preference_record(
+    question_id: int,
+    prompt_id: int,
+    messages: List[dict],
+    responses: List[dict],
+    split: str,
+    min_margin: float,
+) -> dict:
+    """
+    Chat format preference record: the prompt messages, the best scored response as chosen
+    and the worst as rejected (null unless their scores differ by min_margin or more), and
+    every scored response with its mean ratings
+    """
+    best, worst = responses[0], responses[-1]  # Sorted by score
+    paired = len(responses) > 1 and best["score"] - worst["score"] >= min_margin
+    return {
+        "question_id": question_id,
+        "prompt_id": prompt_id,
+        "split": split,
+        "prompt": messages,
+        "chosen": [{"role": "assistant", "content": best["content"]}] if paired else None,
+        "rejected": [{"role": "assistant", "content": worst["content"]}] if paired else None,
+        "score_chosen": best["score"] if paired else None,
+        "score_rejected": worst["score"] if paired else None,
+        "responses": responses,
+    }
+
+
+class PreferenceShards:
+    """
+    Zip archive of JSONL shards, written into sink as it goes (zip entries with data
+    descriptors, no seeking): {split}-00000.jsonl, {split}-00001.jsonl, ... each holding
+    at most max_bytes of records (at least one), then manifest.json with their counts.
+    One shard is open at a time, so splits must be written one after the other.
+    """
+
+    def __init__(self, sink: BufferSink, max_bytes: int, manifest: dict) -> None:
+        self._archive = zipfile.ZipFile(
+            sink, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=EXPORT_GZIP_LEVEL
+        )
+        self._max_bytes = max_bytes
+        self._shard = None
+        self._split: Optional[str] = None
+        self._shard_info: Optional[dict] = None
+        self.manifest = dict(manifest, splits={split: [] for split in SPLITS})
+
+    def write(self, split: str, line: bytes) -> None:
+        info = self._shard_info
+        if split != self._split or (
+            info["records"] and info["bytes"] + len(line) > self._max_bytes
+        ):
+            self._open(split=split)
+            info = self._shard_info
+        self._shard.write(line)
+        info["records"] += 1
+        info["bytes"] += len(line)
+
+    def _open(self, split: str) -> None:
+        self._close_shard()
+        shards = self.manifest["splits"][split]
+        name = f"{split}-{len(shards):05d}.jsonl"
+        self._shard = self._archive.open(name, "w")
+        self._split = split
+        self._shard_info = {"name": name, "records": 0, "bytes": 0}
+        shards.append(self._shard_info)
+
+    def _close_shard(self) -> None:
+        if self._shard is not None:
+            self._shard.close()
+            self._shard = None
+
+    def close(self) -> None:
+        self._close_shard()
+        self._archive.writestr("manifest.json", json.dumps(self.manifest, indent=2))
+        self._archive.close()
+
+
+def stream_preferences(
+    split_question_ids: Dict[str, List[int]],
+    validation_ratio: float,
+    min_margin: float,
+    pairs_only: bool = True,
+    shard_bytes: Optional[int] = None,
+    statement_timeout: Optional[int] = None,
+) -> Iterator[bytes]:
+    """
+    Preference records of every split (get_split_question_ids), one after the other,
+    fetched EXPORT_PREFERENCE_BATCH_ROWS at a time from a server-side cursor and sent after
+    every batch, so memory holds one batch. With shard_bytes records go into a zip of size
+    capped shards (PreferenceShards), otherwise into one JSONL stream. pairs_only skips
+    records without a chosen / rejected pair.
+    A sync generator: StreamingResponse iterates it in a threadpool.
+    """
+    sink = BufferSink()
+    shards = None
+    if shard_bytes is not None:
+        shards = PreferenceShards(
+            sink=sink,
+            max_bytes=shard_bytes,
+            manifest={
+                "validation_ratio": validation_ratio,
+                "min_margin": min_margin,
+                "pairs_only": pairs_only,
+            },
+        )
+    conn = ConnectionPoolManager.acquire_connection(statement_timeout=statement_timeout)
+    try:
+        for split, question_ids in split_question_ids.items():
+            if not question_ids:
+                continue
+            with conn.cursor(name="export_preferences") as named_cursor:
+                query = get_preferences_query(question_ids=question_ids, cursor=named_cursor)
+                for rows in fetch_batches(
+                    query=query, batch_size=EXPORT_PREFERENCE_BATCH_ROWS, cursor=named_cursor
+                ):
+                    for question_id, prompt_id, messages, responses in rows:
+                        record = make_preference_record(
+                            question_id=question_id,
+                            prompt_id=prompt_id,
+                            messages=messages,
+                            responses=responses,
+                            split=split,
+                            min_margin=min_margin,
+                        )
+                        if pairs_only and record["chosen"] is None:
+                            continue
+                        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+                        if shards is None:
+                            sink.write(line)
+                        else:
+                            shards.write(split=split, line=line)
+                    yield sink.take()
+    finally:
+        ConnectionPoolManager.release_connection(conn, commit=False)  # Read only
+    if shards is not None:
+        shards.close()
+        logger.info(f"Preference export shards: {shards.manifest['splits']}")
+    yield sink.take()
@@ -0,0 +1,287 @@
+from typing import List, Optional, Tuple
+from collections import OrderedDict
+from psycopg2.extensions import cursor
+import hashlib
+import json
+import time
+from src.models.constraints import (
+    PROMPT_SYSTEM,
+    PROMPT_TEMPLATE_MULTICHOICE,
+    PROMPT_TEMPLATE_CODERUNNER,
+    PROMPT_TEMPLATE_OTHER,
+    PROMPT_TEMPLATE_REFRESH_INTERVAL,
+    PROMPT_CACHE_MAX_ENTRIES,
+)
+from src.constraints import QUESTION_MULTICHOICE_TYPES, QUESTION_CODERUNNER_TYPES
+from src.schemas import Question, PromptTemplate, GetPromptTemplateResponse, Prompt
+from src.logger import LoggerFactory
+from src.database.crud import (
+    create_prompt_template,
+    get_active_prompt_template,
+    get_prompt,
+    create_prompt,
+    get_prompt_template_by_hash,
+    get_question_admin,
+    set_question_prompt,
+    get_questions_stale_prompt,
+    get_questions_missing_prompt,
+    set_inference_prompts,
+)
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+class PromptBuilder:
+    default_template: PromptTemplate = PromptTemplate(
+        system_prompt=PROMPT_SYSTEM,
+        multichoice=PROMPT_TEMPLATE_MULTICHOICE,
+        coderunner=PROMPT_TEMPLATE_CODERUNNER,
+        other=PROMPT_TEMPLATE_OTHER,
+    )
+
+    @staticmethod
+    def build(question: Question, template: Optional[PromptTemplate] = None) -> str:
+        if question.type in QUESTION_MULTICHOICE_TYPES:
+            return PromptBuilder.build_multichoice(question=question, template=template)
+        if question.type in QUESTION_CODERUNNER_TYPES:
+            return PromptBuilder.build_coderunner(question=question, template=template)
+        return PromptBuilder.build_other(question=question, template=template)
+
+    @classmethod
+    def build_multichoice(
+        cls, question: Question, template: Optional[PromptTemplate] = None
+    ) -> str:
+        if question.type not in QUESTION_MULTICHOICE_TYPES:
+            raise ValueError(
+                f"Question of type '{question.type}' wrongly passeed to Multichoice prompt build method"
+            )
+        template = template or cls.default_template
+        all_answers = [answer.text for answer in question.answers]
+        correct_answers = [
+            answer.text for answer in question.answers if answer.is_correct
+        ]
+        return template.multichoice.format(
+            task_type=question.type,
+            task_text=question.text,
+            all_answers=all_answers,
+            correct_answers=correct_answers,
+        )
+
+    @classmethod
+    def build_coderunner(
+        cls, question: Question, template: Optional[PromptTemplate] = None
+    ) -> str:
+        if question.type not in QUESTION_CODERUNNER_TYPES:
+            raise ValueError(
+                f"Question of type '{question.type}' wrongly passeed to Coderunner prompt build method"
+            )
+        template = template or cls.default_template
+        correct_answers = [
+            answer.text for answer in question.answers
+        ]  # Coderunner only contains correct answers
+        test_cases = [
+            f"[{idx+1}] Входные данные:\n{test_case.input}\nОжидаемый вывод:\n{test_case.expected_output}\n\n"
+            for idx, test_case in enumerate(question.test_cases)
+        ]
+        return template.coderunner.format(
+            task_type=question.type,
+            task_text=question.text,
+            correct_answers=correct_answers,
+            test_cases=test_cases,
+        )
+
+    @classmethod
+    def build_other(
+        cls, question: Question, template: Optional[PromptTemplate] = None
+    ) -> str:
+        if question.type in QUESTION_MULTICHOICE_TYPES:
+            raise ValueError(
+                f"Question of type '{question.type}' wrongly passeed to Other prompt build method. Must be passed to Multichoice builder."
+            )
+        if question.type in QUESTION_CODERUNNER_TYPES:
+            raise ValueError(
+                f"Question of type '{question.type}' wrongly passeed to Other prompt build method. Must be passed to Coderunner builder."
+            )
+        template = template or cls.default_template
+        return template.other.format(task_type=question.type, task_text=question.text)
+
+
+def construct_messages(
+    question: Question, template: Optional[PromptTemplate] = None
+) -> List[dict]:
+    template = template or PromptBuilder.default_template
+    return [
+        {"role": "system", "content": template.system_prompt},
+        {"role": "user", "content": PromptBuilder.build(question=question, template=template)},
+    ]
+
+
+class PromptRegistry:
+    """
+    Versioned prompt templates (prompt_templates table, the latest version is active) and
+    prompts rendered once per (question content hash, template version) into prompts table.
+    The active template is re-read every PROMPT_TEMPLATE_REFRESH_INTERVAL secs, so a new
+    version reaches all workers without a restart. Only rows read back from database are
+    cached in memory: a row created by a transaction that later rolls back is never reused.
+    The prompt of every question is stored on it at ingest (questions.prompt_id), exports
+    join it instead of rendering; refresh_prompts() catches up after a template change.
+    Inferences generated before prompts were stored get the prompt of the built-in
+    templates that generated them (backfill_inference_prompts()).
+    """
+
+    _template: Optional[GetPromptTemplateResponse] = None
+    _template_loaded_at: float = 0.0
+    _prompts: "OrderedDict[Tuple[str, int], Prompt]" = OrderedDict()
+
+    @staticmethod
+    def get_template_hash(template: PromptTemplate) -> str:
+        payload = json.dumps(
+            template.model_dump(include={"system_prompt", "multichoice", "coderunner", "other"}),
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def get_question_hash(question: Question) -> str:
+        """Hash of the question fields templates are rendered from"""
+        payload = json.dumps(
+            question.model_dump(include={"type", "text", "answers", "test_cases"}),
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def invalidate(cls) -> None:
+        cls._template = None
+
+    @classmethod
+    async def create_template(cls, template: PromptTemplate, cursor: cursor) -> int:
+        version = await create_prompt_template(
+            template=template, hash=cls.get_template_hash(template), cursor=cursor
+        )
+        cls.invalidate()
+        logger.info(f"Prompt template version {version} registered")
+        return version
+
+    @classmethod
+    async def get_active_template(cls, cursor: cursor) -> GetPromptTemplateResponse:
+        now = time.monotonic()
+        if (
+            cls._template is not None
+            and now - cls._template_loaded_at < PROMPT_TEMPLATE_REFRESH_INTERVAL
+        ):
+            return cls._template
+        template = await get_active_prompt_template(cursor=cursor)
+        if template is None:  # Empty registry: the built-in templates become version 1
+            await create_prompt_template(
+                template=PromptBuilder.default_template,
+                hash=cls.get_template_hash(PromptBuilder.default_template),
+                cursor=cursor,
+            )
+            return await get_active_prompt_template(cursor=cursor)
+        if cls._template is None or cls._template.version != template.version:
+            logger.info(f"Active prompt template version: {template.version}")
+        cls._template = template
+        cls._template_loaded_at = now
+        return template
+
+    @classmethod
+    async def get_prompt(
+        cls,
+        question: Question,
+        cursor: cursor,
+        template: Optional[GetPromptTemplateResponse] = None,
+    ) -> Prompt:
+        """
+        Prompt of the question with the active (or given) template, rendered and stored
+        on first use
+        """
+        template = template or await cls.get_active_template(cursor=cursor)
+        key = (cls.get_question_hash(question), template.version)
+        prompt = cls._prompts.get(key)
+        if prompt is not None:
+            cls._prompts.move_to_end(key)
+            return prompt
+        prompt = await get_prompt(
+            question_hash=key[0], template_version=template.version, cursor=cursor
+        )
+        if prompt is None:
+            return await create_prompt(
+                question_hash=key[0],
+                template_version=template.version,
+                messages=construct_messages(question=question, template=template),
+                cursor=cursor,
+            )
+        cls._prompts[key] = prompt
+        if len(cls._prompts) > PROMPT_CACHE_MAX_ENTRIES:
+            cls._prompts.popitem(last=False)
+        return prompt
+
+    @classmethod
+    async def store_question_prompt(cls, question_id: int, cursor: cursor) -> Optional[Prompt]:
+        """Store the prompt of a question with the active template on it"""
+        question = await get_question_admin(id=question_id, cursor=cursor)
+        if question is None:
+            return None
+        prompt = await cls.get_prompt(question=question, cursor=cursor)
+        await set_question_prompt(question_id=question_id, prompt=prompt, cursor=cursor)
+        return prompt
+
+    @classmethod
+    async def refresh_prompts(cls, cursor: cursor) -> int:
+        """
+        Store prompts of the questions whose prompt is missing or of an older template
+        version. A no-op query once caught up. Returns the number of refreshed questions
+        """
+        cls.invalidate()  # Compare with the active version in database, not a cached one
+        template = await cls.get_active_template(cursor=cursor)
+        question_ids = await get_questions_stale_prompt(
+            template_version=template.version, cursor=cursor
+        )
+        for question_id in question_ids:
+            await cls.store_question_prompt(question_id=question_id, cursor=cursor)
+        if question_ids:
+            logger.info(
+                f"Prompts of {len(question_ids)} questions stored "
+                f"(template version {template.version})"
+            )
+        return len(question_ids)
+
+    @classmethod
+    async def backfill_inference_prompts(cls, cursor: cursor) -> int:
+        """
+        Record the prompt of inferences generated before prompts were stored. Those were
+        rendered by the built-in templates, so they get the question's prompt with the
+        built-in template version, whatever version is active now. A no-op query once
+        caught up. Returns the number of backfilled inferences
+        """
+        question_ids = await get_questions_missing_prompt(cursor=cursor)
+        if not question_ids:
+            return 0
+        await cls.get_active_template(cursor=cursor)  # An empty registry gets the built-in ones
+        template = await get_prompt_template_by_hash(
+            hash=cls.get_template_hash(PromptBuilder.default_template), cursor=cursor
+        )
+        if template is None:  # Another template was registered first: version is unknown
+            logger.warning(
+                f"Prompts of inferences of {len(question_ids)} questions are unknown: "
+                "built-in templates are not registered"
+            )
+            return 0
+        backfilled = 0
+        for question_id in question_ids:
+            question = await get_question_admin(id=question_id, cursor=cursor)
+            if question is None:
+                continue
+            prompt = await cls.get_prompt(question=question, cursor=cursor, template=template)
+            backfilled += await set_inference_prompts(
+                question_id=question_id, prompt=prompt, cursor=cursor
+            )
+        logger.info(
+            f"Prompts of {backfilled} inferences backfilled "
+            f"(built-in template version {template.version})"
+        )
+        return backfilled
@@ -0,0 +1,201 @@
+from typing import Dict, List, Optional, AsyncGenerator
+from contextlib import asynccontextmanager
+import asyncio
+import random
+import statistics
+import time
+import openai
+from src.config import settings
+from src.logger import LoggerFactory
+from src.models.clients import OpenAIClientRegistry
+from src.models.constraints import OPENAI_ENDPOINT_LATENCY_EWMA_ALPHA
+from src.schemas import EndpointStats, GetModelEndpointsResponse
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+class Endpoint:
+    """One OpenAI-compatible replica serving a model"""
+
+    def __init__(self, base_url: str) -> None:
+        self.base_url = base_url
+        self.api_key: Optional[str] = None  # Last key used, health probes reuse it
+        self.in_flight: int = 0
+        self.latency: Optional[float] = None  # EWMA of ms per completion token
+        self.consecutive_failures: int = 0
+        self.ejected_at: Optional[float] = None
+
+    @property
+    def healthy(self) -> bool:
+        return self.ejected_at is None
+
+    def get_score(self, default_latency: float) -> float:
+        """Expected wait: requests ahead of us (and ours) times observed speed"""
+        return (self.in_flight + 1) * (self.latency or default_latency)
+
+    @asynccontextmanager
+    async def use(self, api_key: Optional[str]) -> AsyncGenerator[openai.AsyncClient, None]:
+        self.api_key = api_key
+        self.in_flight += 1
+        try:
+            async with OpenAIClientRegistry.use(
+                base_url=self.base_url, api_key=api_key
+            ) as client:
+                yield client
+        finally:
+            self.in_flight -= 1
+
+
+class ModelRouter:
+    """
+    Balances generations of a model over its replicas (settings.openai.model_endpoints):
+    the healthy endpoint with the lowest (in-flight + 1) x latency EWMA is chosen.
+    After endpoint_max_failures consecutive errors an endpoint is taken out of rotation
+    until a health probe (GET /models) succeeds. Routing state is per worker.
+    """
+
+    _routers: Dict[str, "ModelRouter"] = {}
+    _probe_task: Optional[asyncio.Task] = None
+
+    def __init__(self, model_name: str, base_urls: List[str]) -> None:
+        self.model_name = model_name
+        self.endpoints = [Endpoint(base_url=base_url) for base_url in base_urls]
+
+    @classmethod
+    def get(cls, model_name: str) -> Optional["ModelRouter"]:
+        """Router of the model, None if it has no replicas configured"""
+        base_urls = settings.openai.model_endpoints.get(model_name)
+        if not base_urls:
+            return None
+        if model_name not in cls._routers:
+            logger.info(f"Routing {model_name} over {len(base_urls)} endpoints")
+            cls._routers[model_name] = cls(model_name=model_name, base_urls=base_urls)
+        return cls._routers[model_name]
+
+    @classmethod
+    async def initialize(cls) -> None:
+        if cls._probe_task is None and settings.openai.model_endpoints:
+            cls._probe_task = asyncio.create_task(cls._probe_loop())
+
+    @classmethod
+    async def close(cls) -> None:
+        if cls._probe_task is not None:
+            cls._probe_task.cancel()
+            cls._probe_task = None
+        cls._routers = {}
+
+    def choose(self, exclude: Optional[Endpoint] = None) -> Endpoint:
+        """Best healthy endpoint, avoiding exclude (the one a retry failed on) if possible"""
+        healthy = [endpoint for endpoint in self.endpoints if endpoint.healthy]
+        if not healthy:  # Everything ejected: try the longest ejected rather than fail
+            return min(self.endpoints, key=lambda endpoint: endpoint.ejected_at)
+        candidates = [endpoint for endpoint in healthy if endpoint is not exclude] or healthy
+        # Unmeasured endpoints are assumed average so they get traffic and a measurement
+        known = [endpoint.latency for endpoint in candidates if endpoint.latency is not None]
+        default_latency = statistics.mean(known) if known else 1.0
+        best_score = min(endpoint.get_score(default_latency) for endpoint in candidates)
+        return random.choice(
+            [
+                endpoint
+                for endpoint in candidates
+                if endpoint.get_score(default_latency) == best_score
+            ]
+        )
+
+    def on_success(
+        self, endpoint: Endpoint, latency_ms: int, completion_tokens: Optional[int] = None
+    ) -> None:
+        endpoint.consecutive_failures = 0
+        if endpoint.ejected_at is not None:
+            self.reinstate(endpoint=endpoint)
+        if not completion_tokens:  # Latency alone mostly measures answer length
+            return
+        sample = latency_ms / completion_tokens
+        if endpoint.latency is None:
+            endpoint.latency = sample
+        else:
+            endpoint.latency = (
+                OPENAI_ENDPOINT_LATENCY_EWMA_ALPHA * sample
+                + (1 - OPENAI_ENDPOINT_LATENCY_EWMA_ALPHA) * endpoint.latency
+            )
+
+    def on_failure(self, endpoint: Endpoint, error: Exception) -> None:
+        """Count a connection error, timeout or 5xx of the endpoint"""
+        endpoint.consecutive_failures += 1
+        if (
+            endpoint.healthy
+            and endpoint.consecutive_failures >= settings.openai.endpoint_max_failures
+        ):
+            endpoint.ejected_at = time.monotonic()
+            logger.warning(
+                f"Endpoint {endpoint.base_url} of {self.model_name} taken out of rotation "
+                f"after {endpoint.consecutive_failures} failures: {error}"
+            )
+
+    def reinstate(self, endpoint: Endpoint) -> None:
+        endpoint.ejected_at = None
+        endpoint.consecutive_failures = 0
+        endpoint.latency = None  # Old measurements say nothing about the restarted replica
+        logger.info(f"Endpoint {endpoint.base_url} of {self.model_name} back in rotation")
+
+    async def probe(self) -> None:
+        """Health check ejected endpoints, reinstating the ones that answer"""
+        for endpoint in self.endpoints:
+            if endpoint.healthy:
+                continue
+            try:
+                async with OpenAIClientRegistry.use(
+                    base_url=endpoint.base_url, api_key=endpoint.api_key
+                ) as client:
+                    await asyncio.wait_for(
+                        client.models.list(), timeout=settings.openai.endpoint_probe_timeout
+                    )
+            except Exception as e:
+                logger.info(f"Health probe of {endpoint.base_url} failed: {e}")
+                continue
+            self.reinstate(endpoint=endpoint)
+
+    @classmethod
+    async def _probe_loop(cls) -> None:
+        while True:
+            await asyncio.sleep(settings.openai.endpoint_probe_interval)
+            for router in list(cls._routers.values()):
+                try:
+                    await router.probe()
+                except Exception as e:
+                    logger.error(f"Failed to probe endpoints of {router.model_name}: {e}")
+
+    def get_stats(self) -> GetModelEndpointsResponse:
+        now = time.monotonic()
+        return GetModelEndpointsResponse(
+            model_name=self.model_name,
+            endpoints=[
+                EndpointStats(
+                    base_url=endpoint.base_url,
+                    healthy=endpoint.healthy,
+                    in_flight=endpoint.in_flight,
+                    latency_ms_per_token=endpoint.latency,
+                    consecutive_failures=endpoint.consecutive_failures,
+                    ejected_for_secs=(
+                        None if endpoint.healthy else round(now - endpoint.ejected_at, 1)
+                    ),
+                )
+                for endpoint in self.endpoints
+            ],
+        )
+
+    @classmethod
+    def get_stats_all(cls) -> List[GetModelEndpointsResponse]:
+        return [
+            router.get_stats()
+            for model_name in settings.openai.model_endpoints
+            if (router := cls.get(model_name=model_name)) is not None
+        ]
+
+
+def is_endpoint_failure(error: Exception) -> bool:
+    """Errors that say the replica is unwell, as opposed to the request or quota"""
+    if isinstance(error, openai.APIConnectionError):  # Includes timeouts
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
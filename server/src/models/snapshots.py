@@ -0,0 +1,135 @@
+from typing import Dict, Iterator, Optional
+from email.utils import formatdate
+from psycopg2.extensions import cursor
+from fastapi import Response, status
+from fastapi.responses import FileResponse
+import hashlib
+import json
+import os
+import uuid
+from src.config import settings
+from src.constraints import EXPORT_SNAPSHOT_TABLES, EXPORT_FORMATS
+from src.database.crud import get_export_data_versions
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+class ExportSnapshots:
+    """
+    Full exports saved to settings.exports.export_snapshot_dir, one file per
+    (export, parameters, data version). The data version is read from the tables the
+    export depends on (EXPORT_SNAPSHOT_TABLES), so any change makes a new snapshot and
+    repeated downloads of unchanged data get the same bytes without running the export.
+    The ETag is derived from the data version: it is known before the export runs,
+    If-None-Match is answered with 304 without touching the snapshot.
+    The first request streams the export and saves it on the way (files are renamed into
+    place once complete). Snapshot files are shared by all workers, the oldest beyond
+    export_snapshot_max_files are removed.
+    """
+
+    @staticmethod
+    def enabled() -> bool:
+        return settings.exports.export_snapshot_dir is not None
+
+    @staticmethod
+    async def get_etag(kind: str, format: str, params: dict, cursor: cursor) -> str:
+        versions = await get_export_data_versions(cursor=cursor)
+        tables = EXPORT_SNAPSHOT_TABLES[kind]
+        payload = json.dumps(
+            [kind, format, params, [versions.get(table, 0) for table in tables]],
+            sort_keys=True,
+            default=str,
+        )
+        return '"' + hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32] + '"'
+
+    @staticmethod
+    def get_cache_headers(etag: str) -> dict:
+        """Clients revalidate (If-None-Match) before every reuse"""
+        return {"ETag": etag, "Cache-Control": "no-cache"}
+
+    @staticmethod
+    def matches(if_none_match: Optional[str], etag: str) -> bool:
+        if if_none_match is None:
+            return False
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    @staticmethod
+    def get_path(kind: str, format: str, etag: str) -> str:
+        tag = etag.strip('"')
+        filename = f"{kind}-{tag}{EXPORT_FORMATS[format][1]}"
+        return os.path.join(settings.exports.export_snapshot_dir, filename)
+
+    @classmethod
+    def get_response(
+        cls, kind: str, format: str, etag: str, if_none_match: Optional[str], headers: dict
+    ) -> Optional[Response]:
+        """304 or the saved snapshot, None if the snapshot has not been built yet"""
+        headers = dict(headers, **cls.get_cache_headers(etag=etag))
+        if cls.matches(if_none_match=if_none_match, etag=etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        path = cls.get_path(kind=kind, format=format, etag=etag)
+        try:
+            with open(path + ".json") as file:
+                headers.update(json.load(file))  # Headers of the export that built it
+            modified_at = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        headers["Last-Modified"] = formatdate(modified_at, usegmt=True)
+        logger.info(f"Serving export snapshot {path}")
+        if settings.exports.export_accel_redirect is not None:  # nginx sends the file
+            location = settings.exports.export_accel_redirect.rstrip("/")
+            headers["X-Accel-Redirect"] = f"{location}/{os.path.basename(path)}"
+            return Response(media_type=EXPORT_FORMATS[format][0], headers=headers)
+        return FileResponse(path, media_type=EXPORT_FORMATS[format][0], headers=headers)
+
+    @classmethod
+    def save(
+        cls, chunks: Iterator[bytes], kind: str, format: str, etag: str, headers: Dict[str, str]
+    ) -> Iterator[bytes]:
+        """
+        Pass export chunks through while writing them to the snapshot of etag.
+        headers are stored with the snapshot and sent again whenever it is served.
+        An export that fails or is not read to the end is discarded.
+        """
+        path = cls.get_path(kind=kind, format=format, etag=etag)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            with open(tmp_path, "wb") as file:
+                for chunk in chunks:
+                    file.write(chunk)
+                    yield chunk
+            with open(path + ".json", "w") as file:
+                json.dump(headers, file)
+            os.replace(tmp_path, path)  # Snapshot exists once complete
+        finally:
+            chunks.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        logger.info(f"Saved export snapshot {path}")
+        cls.evict()
+
+    @staticmethod
+    def evict() -> None:
+        directory = settings.exports.export_snapshot_dir
+        extensions = tuple(extension for _, extension in EXPORT_FORMATS.values())
+        snapshots = []
+        for filename in os.listdir(directory):
+            if not filename.endswith(extensions):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                snapshots.append((os.path.getmtime(path), path))
+            except FileNotFoundError:  # Evicted by another worker meanwhile
+                continue
+        snapshots.sort(reverse=True)
+        for _, path in snapshots[settings.exports.export_snapshot_max_files :]:
+            for stale_path in (path, path + ".json"):
+                try:
+                    os.remove(stale_path)
+                except FileNotFoundError:  # Removed by another worker
+                    pass
+            logger.info(f"Evicted export snapshot {path}")
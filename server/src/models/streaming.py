@@ -0,0 +1,212 @@
+from typing import List, Tuple, Optional, AsyncGenerator, Union, Literal
+from contextlib import AsyncExitStack
+import json
+import time
+from openai import AsyncClient
+from fastapi.exceptions import HTTPException
+from src.models.constraints import DEFAULT_MODEL_TEMPERATURE
+from src.models.limits import RateLimiter, estimate_tokens
+from src.models.core import persist_inference
+from src.models.cache import CompletionCache
+from src.models.page_cache import PageCache
+from src.models.routing import ModelRouter, is_endpoint_failure
+from src.schemas import (
+    InferenceContext,
+    LLModelResponse,
+    ReasoningLLModelResponse,
+    get_completion_usage,
+)
+from src.database.pool import LazyCursor
+from src.logger import LoggerFactory
+
+
+logger = LoggerFactory.getLogger(__name__)
+
+
+THINK_OPEN_TAG = "<think>"
+THINK_CLOSE_TAG = "</think>"
+
+StreamPart = Literal["reasoning", "response"]
+
+
+class ThinkTagSplitter:
+    """
+    Incremental counterpart of ReasoningLLModelResponse.from_completion():
+    splits streamed content into reasoning (inside <think> tags) and response,
+    tags may be cut between chunks.
+    """
+
+    def __init__(self):
+        self._buffer = ""  # Tail that may be the beginning of a tag
+        self._inside_think = False
+        self._think_closed = False
+        self._raw: List[str] = []
+        self._reasoning: List[str] = []
+        self._response: List[str] = []
+
+    @staticmethod
+    def _partial_tag_length(text: str, tag: str) -> int:
+        """Length of the longest suffix of text that is a proper prefix of tag"""
+        for length in range(min(len(tag) - 1, len(text)), 0, -1):
+            if text.endswith(tag[:length]):
+                return length
+        return 0
+
+    def feed(self, text: str) -> List[Tuple[StreamPart, str]]:
+        """Consume a content delta, return the parts that can already be classified"""
+        self._raw.append(text)
+        self._buffer += text
+        parts = []
+        while self._buffer:
+            tag = THINK_CLOSE_TAG if self._inside_think else THINK_OPEN_TAG
+            position = self._buffer.find(tag)
+            if position == -1:
+                keep = self._partial_tag_length(self._buffer, tag)
+                emit, self._buffer = (
+                    self._buffer[: len(self._buffer) - keep],
+                    self._buffer[len(self._buffer) - keep :],
+                )
+                self._emit(emit, parts)
+                break
+            self._emit(self._buffer[:position], parts)
+            self._buffer = self._buffer[position + len(tag) :]
+            if self._inside_think:
+                self._think_closed = True
+            self._inside_think = not self._inside_think
+        return parts
+
+    def feed_reasoning(self, text: str) -> List[Tuple[StreamPart, str]]:
+        """Reasoning delivered in a separate field (e.g. delta.reasoning_content)"""
+        self._reasoning.append(text)
+        self._think_closed = True
+        return [("reasoning", text)] if text else []
+
+    def _emit(self, text: str, parts: List[Tuple[StreamPart, str]]) -> None:
+        if not text:
+            return
+        part: StreamPart = "reasoning" if self._inside_think else "response"
+        (self._reasoning if self._inside_think else self._response).append(text)
+        parts.append((part, text))
+
+    def finish(self, temperature: float) -> Union[ReasoningLLModelResponse, LLModelResponse]:
+        """Flush pending text and build the final response object"""
+        self._emit(self._buffer, [])
+        self._buffer = ""
+        reasoning = "".join(self._reasoning).strip()
+        if not self._think_closed:  # No complete <think> block: keep content as is
+            return LLModelResponse(
+                response="".join(self._raw).strip(), temperature=temperature
+            )
+        return ReasoningLLModelResponse(
+            response="".join(self._response).strip(),
+            reasoning=reasoning,
+            temperature=temperature,
+        )
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_inference(
+    client: AsyncClient,
+    context: InferenceContext,
+    temperature: float = DEFAULT_MODEL_TEMPERATURE,
+    statement_timeout: Optional[int] = None,
+) -> AsyncGenerator[str, None]:
+    """
+    Generate an inference with stream=True and relay it as Server-Sent Events:
+    "reasoning"/"response" deltas, periodic "progress", final "done" with the saved inference ID.
+    The database is only touched once, after the last chunk. Models with replicas are
+    streamed from the best healthy one, there is no failover once streaming started.
+    """
+    splitter = ThinkTagSplitter()
+    started_at = time.monotonic()
+    chunks = 0
+    chars = {"reasoning": 0, "response": 0}
+    usage = {}
+    ttft_ms = None
+    router = ModelRouter.get(model_name=context.model.model_name)
+    endpoint = None
+    try:
+        async with AsyncExitStack() as stack:
+            if router is not None:
+                endpoint = router.choose()
+                client = await stack.enter_async_context(endpoint.use(api_key=client.api_key))
+            limiter = RateLimiter.get(
+                base_url=str(client.base_url), model_name=context.model.model_name
+            )
+            # Not retried: deltas may already have been relayed to the caller
+            async with limiter.limit(tokens=estimate_tokens(context.messages)):
+                request_started_at = time.monotonic()
+                stream = await client.chat.completions.create(
+                    model=context.model.model_name,
+                    messages=context.messages,
+                    temperature=temperature,
+                    stream=True,
+                    stream_options={"include_usage": True},  # Sent in a last chunk without choices
+                )
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        usage = get_completion_usage(chunk)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    parts = []
+                    reasoning_content = getattr(delta, "reasoning_content", None)
+                    if reasoning_content:
+                        parts += splitter.feed_reasoning(reasoning_content)
+                    if delta.content:
+                        parts += splitter.feed(delta.content)
+                    if parts and ttft_ms is None:
+                        ttft_ms = round((time.monotonic() - request_started_at) * 1000)
+                    for part, text in parts:
+                        chars[part] += len(text)
+                        yield format_sse(part, {"text": text})
+                    chunks += 1
+                    if chunks % 50 == 0:
+                        yield format_sse(
+                            "progress",
+                            {
+                                "chunks": chunks,
+                                "reasoning_chars": chars["reasoning"],
+                                "response_chars": chars["response"],
+                                "elapsed_secs": round(time.monotonic() - started_at, 2),
+                            },
+                        )
+
+        latency_ms = round((time.monotonic() - request_started_at) * 1000)
+        limiter.on_success(extra_tokens=usage.get("completion_tokens") or 0)
+        if endpoint is not None:
+            router.on_success(
+                endpoint=endpoint,
+                latency_ms=latency_ms,
+                completion_tokens=usage.get("completion_tokens"),
+            )
+        model_response = splitter.finish(temperature=temperature)
+        model_response = model_response.model_copy(
+            update=dict(usage, ttft_ms=ttft_ms, latency_ms=latency_ms)
+        )
+        with LazyCursor(statement_timeout=statement_timeout) as cursor:
+            with cursor.transaction():
+                inference_id = await persist_inference(
+                    context=context, model_response=model_response, cursor=cursor
+                )
+                if CompletionCache.enabled():
+                    await CompletionCache.put(
+                        context=context, model_response=model_response, cursor=cursor
+                    )
+        await PageCache.invalidate()
+        yield format_sse(
+            "done",
+            {
+                "inference_id": inference_id,
+                "elapsed_secs": round(time.monotonic() - started_at, 2),
+            },
+        )
+    except Exception as e:
+        if endpoint is not None and is_endpoint_failure(e):
+            router.on_failure(endpoint=endpoint, error=e)
+        logger.error(f"Streaming inference for question ID {context.question.id} failed: {e}")
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        yield format_sse("error", {"detail": detail})
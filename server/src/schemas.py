@@ -6,8 +6,10 @@ from pydantic import (
     field_validator,
     ValidationError,
 )
-from typing import Optional, List, Union, get_args, Any, Dict
+from typing import Optional, List, Union, get_args, Any, Dict, Tuple
 import re
+import datetime
+from openai.types import CompletionUsage
 from openai.types.chat import ChatCompletion
 from src.exceptions import (
     UnrecognizedQuestionTypeException,
@@ -19,6 +21,7 @@ from src.constraints import (
     QUESTION_MULTICHOICE_TYPES,
     QUESTION_CODERUNNER_TYPES,
     QUESTION_CLOZE_TYPES,
+    MAX_INFERENCE_SWEEP_SAMPLES,
 )
 from src.utils import clean_html_tags, code_md_to_html, wrap_code_in_html
 from src.models.constraints import DEFAULT_MODEL_TEMPERATURE
@@ -233,9 +236,27 @@ class QuestionsRandomIdResponse(BaseModel):
     id: int
 
 
+def get_completion_usage(completion: ChatCompletion) -> Dict[str, Optional[int]]:
+    usage = getattr(completion, "usage", None)
+    if not isinstance(usage, CompletionUsage):  # Not reported by some servers
+        return {"prompt_tokens": None, "completion_tokens": None, "reasoning_tokens": None}
+    details = usage.completion_tokens_details
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "reasoning_tokens": details.reasoning_tokens if details is not None else None,
+    }
+
+
 class LLModelResponse(BaseModel):
     response: str
     temperature: ModelTemperature
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    reasoning_tokens: Optional[int] = None
+    ttft_ms: Optional[int] = None
+    latency_ms: Optional[int] = None
+    cached: bool = False  # Served from completion cache
 
     @classmethod
     def from_completion(
@@ -243,7 +264,21 @@ class LLModelResponse(BaseModel):
     ) -> "LLModelResponse":
         choice = completion.choices[0]
         response_content = choice.message.content
-        return LLModelResponse(response=response_content, temperature=temperature)
+        return LLModelResponse(
+            response=response_content,
+            temperature=temperature,
+            **get_completion_usage(completion),
+        )
+
+
+def split_reasoning(content: str) -> Tuple[Optional[str], str]:
+    """Separate the <think>...</think> block of a model answer: (reasoning, response)"""
+    reasoning_match = re.search(r"<think>(.*?)</think>", content, re.DOTALL)
+    if reasoning_match is None:
+        return None, content.strip()
+    # Remove the <think> block to get the final response
+    response = re.sub(r"<think>.*?</think>", "", content, flags=re.DOTALL).strip()
+    return reasoning_match.group(1).strip(), response
 
 
 class ReasoningLLModelResponse(LLModelResponse):
@@ -253,25 +288,18 @@ class ReasoningLLModelResponse(LLModelResponse):
     def from_completion(
         cls, completion: ChatCompletion, temperature: float
     ) -> Union["ReasoningLLModelResponse", LLModelResponse]:
-        choice = completion.choices[0]
-        response_content = choice.message.content
-
-        # Extract the reasoning content between <think> tags
-        reasoning_match = re.search(
-            r"<think>(.*?)</think>", response_content, re.DOTALL
-        )
-        reasoning = reasoning_match.group(1).strip() if reasoning_match else None
+        message = completion.choices[0].message
+        reasoning, response = split_reasoning(message.content or "")
+        # Servers with a reasoning parser (vLLM) return it apart from the content
+        reasoning_content = getattr(message, "reasoning_content", None)
+        if reasoning is None and isinstance(reasoning_content, str) and reasoning_content:
+            reasoning = reasoning_content.strip()
+        usage = get_completion_usage(completion)
         if reasoning is None:
-            return LLModelResponse(
-                response=response_content.strip(), temperature=temperature
-            )
-
-        # Remove the <think> block to get the final response
-        response = re.sub(
-            r"<think>.*?</think>", "", response_content, flags=re.DOTALL
-        ).strip()
-
-        return cls(response=response, reasoning=reasoning, temperature=temperature)
+            return LLModelResponse(response=response, temperature=temperature, **usage)
+        return cls(
+            response=response, reasoning=reasoning, temperature=temperature, **usage
+        )
 
 
 class GetInferenceResponse(BaseModel):
@@ -280,11 +308,54 @@ class GetInferenceResponse(BaseModel):
     model_id: int
     thinking: Optional[str] = None
     text: str
+    prompt_id: Optional[int] = None
+    prompt_template_version: Optional[int] = None
+
+
+class PromptTemplate(BaseModel):
+    """Texts formatted with question fields, see PromptBuilder for placeholders"""
+
+    system_prompt: str
+    multichoice: str
+    coderunner: str
+    other: str
+
+    @model_validator(mode="after")
+    def validate_placeholders(self):
+        placeholders = {
+            "multichoice": dict(task_type="", task_text="", all_answers=[], correct_answers=[]),
+            "coderunner": dict(task_type="", task_text="", correct_answers=[], test_cases=[]),
+            "other": dict(task_type="", task_text=""),
+        }
+        for name, fields in placeholders.items():
+            try:
+                getattr(self, name).format(**fields)
+            except (KeyError, IndexError, ValueError) as e:
+                raise ValueError(f"Invalid {name} template: {e!r}")
+        return self
+
+
+class GetPromptTemplateResponse(PromptTemplate):
+    version: int
+    created_at: datetime.datetime
+
+
+class Prompt(BaseModel):
+    """Messages rendered from a question with a template version"""
+
+    id: int
+    question_hash: str
+    template_version: int
+    messages: List[Dict[str, str]]
 
 
 class PostModelRequest(BaseModel):
     base_model_name: str
     model_name: str
+    prompt_price: Optional[float] = Field(None, ge=0, description="Per 1M prompt tokens")
+    completion_price: Optional[float] = Field(
+        None, ge=0, description="Per 1M completion tokens (reasoning included)"
+    )
 
 
 class GetModelResponse(BaseModel):
@@ -294,10 +365,137 @@ class GetModelResponse(BaseModel):
     version: int
 
 
+class GetModelUsageResponse(BaseModel):
+    """Usage of generated (not cached) inferences of a model"""
+
+    model_id: int
+    model_name: str
+    inferences: int
+    cached_inferences: int
+    prompt_tokens: int
+    completion_tokens: int
+    reasoning_tokens: int
+    cost: Optional[float] = Field(None, description="None if model prices are not set")
+    avg_latency_ms: Optional[float] = None
+    p50_latency_ms: Optional[float] = None
+    p95_latency_ms: Optional[float] = None
+    p50_ttft_ms: Optional[float] = None
+    p95_ttft_ms: Optional[float] = None
+    completion_tokens_per_sec: Optional[float] = None
+
+
+class InferenceContext(BaseModel):
+    """Everything loaded from database that is needed to generate an inference"""
+
+    model: GetModelResponse
+    question: GetQuestionResponse
+    messages: List[Dict[str, str]]
+    prompt_id: Optional[int] = None
+    prompt_template_version: Optional[int] = None
+
+
 class PostInferenceRequest(BaseModel):
     question_id: int
     model_id: int
     temperature: ModelTemperature = DEFAULT_MODEL_TEMPERATURE
+    bypass_cache: bool = Field(
+        False,
+        description="Skip completion cache lookup, the fresh completion still refreshes the cache",
+    )
+
+
+class InferenceResult(BaseModel):
+    """Outcome of a single request in a batch of inferences"""
+
+    question_id: int
+    model_id: int
+    temperature: ModelTemperature
+    inference_id: Optional[int] = None
+    cached: bool = False
+    error: Optional[str] = None
+
+
+class PostInferencesResponse(BaseModel):
+    message: str
+    succeeded: int
+    failed: int
+    cached: int = 0
+    results: List[InferenceResult]
+
+
+class GetCompletionCacheStatsResponse(BaseModel):
+    entries: int = 0
+    hits: int = Field(0, description="Hits served by all entries currently stored")
+    saved_prompt_tokens: int = 0
+    saved_completion_tokens: int = 0
+    worker_lookups: int = Field(0, description="Lookups made by this worker process")
+    worker_hits: int = 0
+    worker_hit_rate: Optional[float] = None
+
+
+class GetPageCacheStatsResponse(BaseModel):
+    """Rendered page cache of this worker process"""
+
+    enabled: bool
+    redis: bool = Field(description="Pages are shared with other workers through Redis")
+    version: Optional[int] = Field(None, description="Data version, None if Redis is unavailable")
+    entries: int = 0
+    max_entries: int = 0
+    hits: int = Field(0, description="Views served from memory, waits for a running render included")
+    redis_hits: int = 0
+    renders: int = 0
+    bypassed: int = Field(0, description="Views rendered without the cache, Redis was unavailable")
+    invalidations: int = 0
+    hit_rate: Optional[float] = None
+    render_rate: Optional[float] = None
+
+
+class InferenceJob(BaseModel):
+    id: int
+    question_id: int
+    model_id: int
+    temperature: ModelTemperature
+    openai_url: Optional[str] = None
+    bypass_cache: bool = False
+    attempts: int
+    max_attempts: int
+
+
+class PostInferenceJobsResponse(BaseModel):
+    message: str
+    job_ids: List[int]
+
+
+class PostInferenceSweepRequest(BaseModel):
+    """Grid of questions x models x temperatures, each cell should hold `samples` inferences"""
+
+    question_ids: Optional[List[int]] = Field(None, description="Default: all questions")
+    question_types: Optional[List[str]] = None
+    level_cds: Optional[List[LevelCD]] = None
+    model_ids: List[int] = Field(..., min_length=1)
+    temperatures: List[ModelTemperature] = Field(..., min_length=1)
+    samples: int = Field(1, ge=1, le=MAX_INFERENCE_SWEEP_SAMPLES)
+    dry_run: bool = Field(False, description="Only count missing inferences")
+
+
+class PostInferenceSweepResponse(BaseModel):
+    message: str
+    cells: int
+    existing: int = Field(..., description="Inferences already stored (up to samples per cell)")
+    queued: int = Field(..., description="Pending or running jobs already covering cells")
+    missing: int
+    job_ids: List[int]
+
+
+class GetInferenceJobsStatsResponse(BaseModel):
+    pending: int = 0
+    running: int = 0
+    done: int = 0
+    failed: int = 0
+    ready: int = Field(0, description="Pending jobs that can be claimed right now")
+    oldest_ready_age_secs: Optional[float] = None
+    done_last_minute: int = 0
+    done_last_hour: int = 0
 
 
 class InferenceScore(BaseModel):
@@ -364,7 +562,55 @@ class LanguagePageResponse(BaseModel):
 class GetPromptResponse(BaseModel):
     messages: List[Dict[str, str]]
     prompt: str
+    prompt_id: Optional[int] = None
+    template_version: Optional[int] = None
 
 class PostQuizXMLResponse(BaseModel):
     question_ids: List[int]
     message: str
+
+
+class PoolStats(BaseModel):
+    """Connection usage of a single worker process"""
+
+    host: str = Field(description="Host name: PIDs repeat across containers")
+    pid: int
+    minconn: int
+    maxconn: int
+    in_use: int
+    peak_in_use: int
+    exhausted_count: int
+    updated_at: datetime.datetime
+
+
+class GetPoolHealthResponse(BaseModel):
+    global_maxconn: Optional[int] = None
+    workers_configured: int
+    total_in_use: int
+    workers: List[PoolStats]
+
+
+class EndpointStats(BaseModel):
+    """Routing state of one model replica in this worker"""
+
+    base_url: str
+    healthy: bool
+    in_flight: int
+    latency_ms_per_token: Optional[float] = Field(
+        None, description="Moving average of completion latency per completion token"
+    )
+    consecutive_failures: int
+    ejected_for_secs: Optional[float] = None
+
+
+class GetModelEndpointsResponse(BaseModel):
+    model_name: str
+    endpoints: List[EndpointStats]
+
+
+class PostInferenceBatchImportResponse(BaseModel):
+    imported: int
+    failed: int = Field(description="Lines that could not be parsed or failed at the provider")
+    skipped: int = Field(0, description="Results of unknown or deleted questions/models")
+    duplicates: int = Field(0, description="Results already imported by an earlier upload")
+    errors: List[str] = Field(default_factory=list, description="First errors by line")
@@ -0,0 +1,74 @@
+from typing import List, Tuple
+from psycopg2.extensions import cursor
+from src.types import UserGroupCD
+from src.schemas import (
+    GetQuestionResponse,
+    GetInferenceResponse,
+    GetInferenceScoreResponse,
+    UserGroup,
+)
+from src.exceptions import (
+    QuestionNotFoundException,
+    InferenceNotFoundException,
+    UserGroupNotFoundException,
+)
+from src.database import crud
+from src.api.utils import existing_user_group_cd
+
+
+# Reads shared by the JSON API (routes/read.py) and the HTML pages (routes/pages.py).
+# Missing objects raise the HTTP exceptions both of them answer with.
+
+
+async def verify_user_group(user_group_cd: UserGroupCD, cursor: cursor) -> UserGroupCD:
+    if not (await existing_user_group_cd(user_group_cd=user_group_cd, cursor=cursor)):
+        raise UserGroupNotFoundException()
+    return user_group_cd
+
+
+async def get_user_groups(cursor: cursor) -> List[UserGroup]:
+    return await crud.get_user_groups_all(cursor=cursor)
+
+
+async def get_questions(user_group_cd: UserGroupCD, cursor: cursor) -> List[GetQuestionResponse]:
+    return await crud.get_questions_all(user_group_cd=user_group_cd, cursor=cursor)
+
+
+async def get_question(user_group_cd: UserGroupCD, id: int, cursor: cursor) -> GetQuestionResponse:
+    question = await crud.get_question(user_group_cd=user_group_cd, id=id, cursor=cursor)
+    if question is None:
+        raise QuestionNotFoundException()
+    return question
+
+
+async def get_random_question_id(user_group_cd: UserGroupCD, cursor: cursor) -> int:
+    id = await crud.get_random_question_id(user_group_cd=user_group_cd, cursor=cursor)
+    if id is None:
+        raise QuestionNotFoundException(
+            "Empty Question ID was received: database error or empty"
+        )
+    return id
+
+
+async def get_inference(id: int, cursor: cursor) -> GetInferenceResponse:
+    inference = await crud.get_inference(id=id, cursor=cursor)
+    if inference is None:
+        raise InferenceNotFoundException()
+    return inference
+
+
+async def get_question_inference(
+    user_group_cd: UserGroupCD, id: int, cursor: cursor
+) -> Tuple[GetInferenceResponse, GetQuestionResponse]:
+    """Inference and the question it answers, if the User Group may access it"""
+    inference = await get_inference(id=id, cursor=cursor)
+    question = await get_question(
+        user_group_cd=user_group_cd, id=inference.question_id, cursor=cursor
+    )
+    return inference, question
+
+
+async def get_inference_scores(
+    user_group_cd: UserGroupCD, cursor: cursor
+) -> List[GetInferenceScoreResponse]:
+    return await crud.get_inference_scores_all(user_group_cd=user_group_cd, cursor=cursor)
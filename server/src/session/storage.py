@@ -1,9 +1,15 @@
-from typing import Optional, Any, AsyncGenerator
+from typing import Optional, Any, AsyncGenerator, List
 from contextlib import asynccontextmanager
 from redis.asyncio import ConnectionPool, RedisError, Redis
 from pydantic import ValidationError
 from src.config import settings
 from src.session.schemas import UserSessionData
+from src.schemas import PoolStats
+from src.constraints import (
+    REDIS_POOL_STATS_KEY_PREFIX,
+    REDIS_PAGE_CACHE_VERSION_KEY,
+    REDIS_PAGE_CACHE_KEY_PREFIX,
+)
 from src.exceptions import RedisUnavailableException
 from src.logger import LoggerFactory
 import json
@@ -58,6 +64,48 @@ class RedisConnection:
         """Delete session data"""
         return await self._connection.delete(ip) > 0
 
+    async def set_pool_stats(self, stats: PoolStats) -> None:
+        """Publish connection pool usage of a worker (expires if worker stops reporting)"""
+        await self._connection.set(
+            f"{REDIS_POOL_STATS_KEY_PREFIX}{stats.host}:{stats.pid}",
+            stats.model_dump_json(),
+            ex=settings.postgres.pool_stats_ex,
+        )
+
+    async def delete_pool_stats(self, stats: PoolStats) -> None:
+        """Drop pool usage of a stopping worker, its PID may be reused by the next one"""
+        await self._connection.delete(f"{REDIS_POOL_STATS_KEY_PREFIX}{stats.host}:{stats.pid}")
+
+    async def get_pool_stats_all(self) -> List[PoolStats]:
+        """Collect last published connection pool usage of all live workers"""
+        stats = []
+        async for key in self._connection.scan_iter(
+            match=f"{REDIS_POOL_STATS_KEY_PREFIX}*"
+        ):
+            data = await self._connection.get(key)
+            if data is not None:
+                stats.append(PoolStats.model_validate_json(data))
+        return sorted(stats, key=lambda worker_stats: (worker_stats.host, worker_stats.pid))
+
+    async def get_page_cache_version(self) -> int:
+        """Data version of rendered pages, shared by all workers"""
+        version = await self._connection.get(REDIS_PAGE_CACHE_VERSION_KEY)
+        return int(version) if version is not None else 0
+
+    async def incr_page_cache_version(self) -> int:
+        return await self._connection.incr(REDIS_PAGE_CACHE_VERSION_KEY)
+
+    async def get_page(self, key: str) -> Optional[str]:
+        html = await self._connection.get(f"{REDIS_PAGE_CACHE_KEY_PREFIX}{key}")
+        return html.decode("utf-8") if html is not None else None
+
+    async def set_page(self, key: str, html: str) -> None:
+        await self._connection.set(
+            f"{REDIS_PAGE_CACHE_KEY_PREFIX}{key}",
+            html.encode("utf-8"),
+            ex=settings.frontend.page_cache_ttl,
+        )
+
 
 class SessionStorage:
     _redis_pool: Optional[ConnectionPool] = None
@@ -10,5 +10,8 @@ BinaryInferenceScoreVal = Literal[1, 5]
 ModelTemperature = Annotated[float, Field(..., gt=0.0, le=1.0)]
 
 Language = Literal["ru", "en"]
+StatementClass = Literal["pages", "admin", "exports"]
+ExportFormat = Literal["csv", "parquet", "arrow"]
+ExportCompression = Literal["zstd", "gzip"]
 BaseName = Annotated[str, Field(..., min_length=1)]
 BaseDesc = Annotated[str, Field(..., min_length=1)]
@@ -1,13 +1,15 @@
 from fastapi import Depends, Request
 from typing import List, Callable, Optional
 from lxml import etree
+import os
 import re
 from bs4 import Tag, BeautifulSoup
 from typing import Any
 from psycopg2.extensions import cursor, connection
 from src.config import settings
+from src.constraints import EXPORT_FORMATS, EXPORT_COMPRESSIONS, EXPORT_ENCODED_FORMATS
 from src.logger import LoggerFactory
-from src.exceptions import InvalidXMLException
+from src.exceptions import InvalidXMLException, InvalidQueryListException
 
 
 logger = LoggerFactory.getLogger(__name__)
@@ -89,6 +91,68 @@ def form_to_key(text):
     return text.replace("\\n", "\n")
 
 
+def parse_query_list(value: Optional[str], item_type: Callable = int) -> Optional[list]:
+    """Comma separated query parameter ("1, 2,3") -> [1, 2, 3], None stays None"""
+    if value is None:
+        return None
+    try:
+        return [item_type(item) for item in value.replace(" ", "").split(",") if item]
+    except ValueError:
+        raise InvalidQueryListException(
+            f"Invalid input: all items must be of type {item_type.__name__}"
+        )
+
+
+def get_export_headers(
+    filename: str,
+    format: Optional[str] = None,
+    compression: Optional[str] = None,
+    content_encoding: Optional[str] = None,
+) -> dict:
+    """
+    Attachment headers of an export, filename extension replaced to match format.
+    compression makes it a compressed file (report.csv.gz), content_encoding a negotiated
+    encoding the client decodes on the fly.
+    """
+    headers = {"Vary": "Accept-Encoding"}
+    if format is not None:
+        filename = os.path.splitext(filename)[0] + EXPORT_FORMATS[format][1]
+    if compression is not None:
+        headers["Content-Type"] = EXPORT_COMPRESSIONS[compression][0]
+        filename += EXPORT_COMPRESSIONS[compression][1]
+    if content_encoding is not None:
+        headers["Content-Encoding"] = content_encoding
+    headers["Content-Disposition"] = f"attachment; filename={filename}"
+    return headers
+
+
+def negotiate_encoding(accept_encoding: Optional[str], format: Optional[str] = None) -> Optional[str]:
+    """
+    Codec of EXPORT_COMPRESSIONS with the highest q in Accept-Encoding, None to send as is.
+    Exports in a format outside EXPORT_ENCODED_FORMATS are not encoded.
+    """
+    if not accept_encoding or (format is not None and format not in EXPORT_ENCODED_FORMATS):
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.lower()] = weight
+    codec, best_weight = None, 0.0
+    for candidate in EXPORT_COMPRESSIONS:  # Ties go to the first, preferred one
+        weight = weights.get(candidate, weights.get("*", 0.0))
+        if weight > best_weight:
+            codec, best_weight = candidate, weight
+    return codec
+
+
 def get_request_ip(request: Request) -> str:
     client_ip = request.headers.get("X-Envoy-External-Address")
     if client_ip is None:
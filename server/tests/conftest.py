@@ -37,14 +37,15 @@ def mock_db_pool():
     ConnectionPoolManager._pool = test_pool
 
     # Initialize database schema
-    init_sql_path = current_dir.parent / "postgres" / "init" / "init.sql"
-    with test_pool.getconn() as conn:
-        conn.autocommit = True  # Needed for schema creation
-        with conn.cursor() as cursor:
-            with open(init_sql_path, "r") as f:
-                sql = f.read()
-                cursor.execute(sql)
-        test_pool.putconn(conn)
+    init_sql_path = current_dir.parent.parent / "postgres" / "init" / "init.sql"
+    conn = test_pool.getconn()
+    conn.autocommit = True  # Needed for schema creation
+    with conn.cursor() as cursor:
+        with open(init_sql_path, "r") as f:
+            sql = f.read()
+            cursor.execute(sql)
+    conn.autocommit = False
+    test_pool.putconn(conn)
 
     yield test_pool
 
@@ -71,19 +72,18 @@ def db_cursor(db_connection):
 @pytest.fixture
 def mock_openai():
     mock_client = MagicMock()
-    mock_client.chat.completions.create = AsyncMock(
-        return_value=MagicMock(
-            choices=[
-                MagicMock(
-                    message=MagicMock(
-                        content="Test response<think>Test reasoning</think>"
-                    )
-                )
-            ]
-        )
+    completion = MagicMock(
+        choices=[
+            MagicMock(
+                message=MagicMock(content="Test response<think>Test reasoning</think>")
+            )
+        ]
+    )
+    mock_client.chat.completions.with_raw_response.create = AsyncMock(
+        return_value=MagicMock(headers={}, parse=MagicMock(return_value=completion))
     )
 
-    with patch("src.api.deps.openai.AsyncClient") as mock:
+    with patch("src.models.clients.OpenAIClientRegistry.build_client") as mock:
         mock.return_value = mock_client
         yield mock_client
 
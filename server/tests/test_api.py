@@ -69,18 +69,18 @@ def test_inference_workflow(test_client, mock_openai_client):
 @pytest.fixture
 def mock_openai_client(monkeypatch):
     mock_client = MagicMock()
-    mock_client.chat.completions.create = AsyncMock(
-        return_value=MagicMock(
-            choices=[
-                MagicMock(
-                    message=MagicMock(
-                        content="Test response<think>Test reasoning</think>"
-                    )
-                )
-            ]
-        )
+    completion = MagicMock(
+        choices=[
+            MagicMock(
+                message=MagicMock(content="Test response<think>Test reasoning</think>")
+            )
+        ]
+    )
+    mock_client.chat.completions.with_raw_response.create = AsyncMock(
+        return_value=MagicMock(headers={}, parse=MagicMock(return_value=completion))
     )
     monkeypatch.setattr(
-        "src.api.routes.upload.openai.AsyncClient", MagicMock(return_value=mock_client)
+        "src.models.clients.OpenAIClientRegistry.build_client",
+        MagicMock(return_value=mock_client),
     )
     return mock_client
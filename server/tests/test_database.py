@@ -1,4 +1,6 @@
 # tests/test_database.py
+import asyncio
+import threading
 import pytest
 from src.database.pool import ConnectionPoolManager
 from src.database.crud import *
@@ -8,7 +10,10 @@ from src.schemas import (
     AnswerCoderunner,
     TestCase,
     PostModelRequest,
+    PostInferenceRequest,
+    PostInferenceSweepRequest,
 )
+from src.models.prompts import PromptRegistry, PromptBuilder
 from psycopg2 import IntegrityError
 
 
@@ -84,3 +89,297 @@ async def test_unique_constraints(db_cursor):
     # Second insert should violate unique constraint
     with pytest.raises(IntegrityError):
         await create_question(question, db_cursor)
+
+
+async def create_sweep_grid(name, cursor):
+    question_id = await create_question(Question(name=name, type="cloze", text="Text"), cursor)
+    model_id = await create_model(
+        PostModelRequest(base_model_name=name, model_name=name), cursor
+    )
+    return question_id, model_id
+
+
+def create_inferences(question_id, model_id, temperature, count, cursor, cached=False):
+    cursor.executemany(
+        """
+        INSERT INTO prod_storage.questions_transformed
+            (question_id, model_id, text, temperature, cached)
+        VALUES (%s, %s, 'Inference', %s, %s);
+        """,
+        [(question_id, model_id, temperature, cached)] * count,
+    )
+
+
+async def sweep(question_id, model_id, cursor, temperatures=(0.5,), samples=3, dry_run=False):
+    return await create_inference_sweep_jobs(
+        sweep=PostInferenceSweepRequest(
+            question_ids=[question_id],
+            model_ids=[model_id],
+            temperatures=list(temperatures),
+            samples=samples,
+            dry_run=dry_run,
+        ),
+        openai_url=None,
+        max_attempts=3,
+        cursor=cursor,
+    )
+
+
+@pytest.mark.asyncio
+async def test_sweep_skips_complete_cells(db_cursor):
+    question_id, model_id = await create_sweep_grid("Complete sweep", db_cursor)
+    create_inferences(question_id, model_id, 0.5, 3, db_cursor)
+    create_inferences(question_id, model_id, 0.7, 5, db_cursor)  # More than samples
+
+    result = await sweep(question_id, model_id, db_cursor, temperatures=(0.5, 0.7))
+
+    assert (result.cells, result.existing, result.queued, result.missing) == (2, 6, 0, 0)
+    assert result.job_ids == []
+
+
+@pytest.mark.asyncio
+async def test_sweep_queues_missing_samples_of_partial_cells(db_cursor):
+    question_id, model_id = await create_sweep_grid("Partial sweep", db_cursor)
+    create_inferences(question_id, model_id, 0.5, 1, db_cursor)
+    create_inferences(question_id, model_id, 0.5, 2, db_cursor, cached=True)  # Not samples
+    await create_inference_jobs(
+        inference_requests=[
+            PostInferenceRequest(question_id=question_id, model_id=model_id, temperature=0.5)
+        ],
+        openai_url=None,
+        max_attempts=3,
+        cursor=db_cursor,
+    )
+
+    planned = await sweep(question_id, model_id, db_cursor, temperatures=(0.5, 0.7), dry_run=True)
+    assert (planned.cells, planned.existing, planned.queued, planned.missing) == (2, 1, 1, 4)
+    assert planned.job_ids == []
+
+    result = await sweep(question_id, model_id, db_cursor, temperatures=(0.5, 0.7))
+    assert result.missing == 4
+    db_cursor.execute(
+        """
+        SELECT temperature, COUNT(*), BOOL_AND(bypass_cache)
+        FROM prod_storage.inference_jobs
+        WHERE id = ANY(%s)
+        GROUP BY temperature
+        ORDER BY temperature;
+        """,
+        (result.job_ids,),
+    )
+    assert db_cursor.fetchall() == [(0.5, 1, True), (0.7, 3, True)]
+
+
+@pytest.mark.asyncio
+async def test_sweep_is_not_planned_twice(db_cursor):
+    question_id, model_id = await create_sweep_grid("Repeated sweep", db_cursor)
+
+    first = await sweep(question_id, model_id, db_cursor)
+    second = await sweep(question_id, model_id, db_cursor)
+
+    assert len(first.job_ids) == 3
+    assert (second.queued, second.missing, second.job_ids) == (3, 0, [])
+
+
+@pytest.mark.asyncio
+async def test_concurrent_sweeps_are_planned_once(mock_db_pool):
+    first_conn, second_conn = mock_db_pool.getconn(), mock_db_pool.getconn()
+    try:
+        with first_conn.cursor() as cursor:
+            question_id, model_id = await create_sweep_grid("Concurrent sweep", cursor)
+        first_conn.commit()
+
+        with first_conn.cursor() as cursor:
+            first = await sweep(question_id, model_id, cursor)
+
+        second = {}
+
+        def run_second():
+            with second_conn.cursor() as cursor:
+                second["result"] = asyncio.run(sweep(question_id, model_id, cursor))
+            second_conn.commit()
+
+        thread = threading.Thread(target=run_second)
+        thread.start()
+        thread.join(timeout=0.5)
+        assert thread.is_alive()  # Waits for the advisory lock of the first sweep
+
+        first_conn.commit()
+        thread.join(timeout=5)
+        assert len(first.job_ids) == 3
+        assert second["result"].job_ids == []
+    finally:
+        for conn in (first_conn, second_conn):
+            conn.rollback()
+        with first_conn.cursor() as cursor:
+            cursor.execute("DELETE FROM prod_storage.questions WHERE name = 'Concurrent sweep';")
+            cursor.execute(
+                "DELETE FROM prod_storage.models WHERE base_model_name = 'Concurrent sweep';"
+            )
+        first_conn.commit()
+        mock_db_pool.putconn(first_conn)
+        mock_db_pool.putconn(second_conn)
+
+
+@pytest.mark.asyncio
+async def test_batch_import_skips_already_imported_requests(db_cursor):
+    question_id, model_id = await create_sweep_grid("Batch import", db_cursor)
+    rows = [
+        (question_id, model_id, None, f"Answer {i}", 0.5, 10, 5, None, None, f"batch_req_{i}")
+        for i in range(3)
+    ]
+    unknown_question_id = question_id + 1000
+    rows.append(
+        (unknown_question_id, model_id, None, "Unknown", 0.5, 1, 1, None, None, "batch_req_x")
+    )
+
+    assert await copy_batch_inferences(rows=rows, cursor=db_cursor) == (3, 0)
+    assert await copy_batch_inferences(rows=rows, cursor=db_cursor) == (0, 3)
+
+    db_cursor.execute(
+        "SELECT COUNT(*) FROM prod_storage.questions_transformed WHERE question_id = %s;",
+        (question_id,),
+    )
+    assert db_cursor.fetchone()[0] == 3
+
+
+@pytest.mark.asyncio
+async def test_prompts_are_stored_at_ingest_and_backfilled(db_cursor):
+    first_id, model_id = await create_sweep_grid("Prompt ingest", db_cursor)
+    second_id = await create_question(
+        Question(name="Prompt backfill", type="cloze", text="Legacy"), db_cursor
+    )
+    builtin = await PromptRegistry.get_active_template(cursor=db_cursor)
+    create_inferences(second_id, model_id, 0.5, 2, db_cursor)  # Stored before prompts
+    await copy_batch_inferences(
+        rows=[(second_id, model_id, None, "Batch", 0.5, 1, 1, None, 999999, "batch_req_prompt")],
+        cursor=db_cursor,
+    )
+    template = PromptBuilder.default_template.model_copy(update={"system_prompt": "New"})
+    version = await PromptRegistry.create_template(template=template, cursor=db_cursor)
+    prompt = await PromptRegistry.store_question_prompt(question_id=first_id, cursor=db_cursor)
+
+    assert await PromptRegistry.refresh_prompts(cursor=db_cursor) >= 1
+    assert await PromptRegistry.refresh_prompts(cursor=db_cursor) == 0
+    assert await PromptRegistry.backfill_inference_prompts(cursor=db_cursor) >= 2
+    assert await PromptRegistry.backfill_inference_prompts(cursor=db_cursor) == 0
+
+    db_cursor.execute(
+        """
+        SELECT qt.batch_request_id IS NOT NULL, qt.prompt_template_version, p.template_version
+        FROM
+            prod_storage.questions_transformed AS qt
+            LEFT JOIN prod_storage.prompts AS p ON p.id = qt.prompt_id
+        WHERE qt.question_id = %s
+        ORDER BY 1;
+        """,
+        (second_id,),
+    )
+    legacy = (False, builtin.version, builtin.version)
+    assert db_cursor.fetchall() == [legacy, legacy, (True, None, None)]
+    db_cursor.execute(get_dataset_query(question_ids=[second_id, first_id], cursor=db_cursor))
+    rows = db_cursor.fetchall()
+    assert [(row[1], row[3]) for row in rows] == [(second_id, version), (first_id, version)]
+    assert rows[1][0] == prompt.messages
+    PromptRegistry.invalidate()
+
+
+@pytest.mark.asyncio
+async def test_report_window_version_changes_when_scores_cross_watermark(db_cursor):
+    question_id, model_id = await create_sweep_grid("Report window", db_cursor)
+    create_inferences(question_id, model_id, 0.5, 1, db_cursor)
+    db_cursor.execute(
+        """
+        INSERT INTO prod_storage.dict_user_groups (user_group_cd) VALUES ('report_window')
+        ON CONFLICT DO NOTHING;
+        INSERT INTO prod_storage.inference_scores
+            (inference_id, user_group_cd, helpful, does_not_reveal_answer,
+             does_not_contain_errors, only_relevant_info)
+        SELECT id, 'report_window', 3, 3, 5, 3
+        FROM prod_storage.questions_transformed
+        WHERE question_id = %s;
+        """,
+        (question_id,),
+    )
+    watermark = await get_export_watermark(lag=60, cursor=db_cursor)
+    now = await get_export_watermark(lag=-1, cursor=db_cursor)  # Includes the new score
+
+    before = await get_report_window_version(until=watermark, cursor=db_cursor)
+    assert before == await get_report_window_version(until=watermark, cursor=db_cursor)
+    assert before != await get_report_window_version(until=now, cursor=db_cursor)
+
+
+@pytest.mark.asyncio
+async def test_inference_job_is_fenced_by_its_claim(db_cursor):
+    question_id, model_id = await create_sweep_grid("Job fencing", db_cursor)
+    (job_id,) = await create_inference_jobs(
+        inference_requests=[PostInferenceRequest(question_id=question_id, model_id=model_id)],
+        openai_url=None,
+        max_attempts=2,
+        cursor=db_cursor,
+    )
+    expire = "UPDATE prod_storage.inference_jobs SET locked_until = '2000-01-01' WHERE id = %s;"
+    db_cursor.execute(
+        "UPDATE prod_storage.inference_jobs SET run_after = '2000-01-01' WHERE id = %s;",
+        (job_id,),
+    )
+
+    first = await claim_inference_job(lease=60, cursor=db_cursor)
+    assert await renew_inference_job(job_id=job_id, attempts=1, lease=60, cursor=db_cursor)
+    db_cursor.execute(expire, (job_id,))
+    second = await claim_inference_job(lease=60, cursor=db_cursor)
+    assert (first.id, first.attempts, second.id, second.attempts) == (job_id, 1, job_id, 2)
+
+    # The first worker's lease expired: its results are refused
+    assert not await renew_inference_job(job_id=job_id, attempts=1, lease=60, cursor=db_cursor)
+    assert not await fail_inference_job(
+        job_id=job_id, attempts=1, error="late", retry_delay=1, cursor=db_cursor
+    )
+    db_cursor.execute(expire, (job_id,))
+    assert await claim_inference_job(lease=60, cursor=db_cursor) is None  # Out of attempts
+    assert await fail_expired_inference_jobs(cursor=db_cursor) >= 1
+    assert not await complete_inference_job(
+        job_id=job_id, attempts=2, inference_id=1, cursor=db_cursor
+    )
+
+    db_cursor.execute(
+        "SELECT status, last_error FROM prod_storage.inference_jobs WHERE id = %s;", (job_id,)
+    )
+    assert db_cursor.fetchone() == ("failed", "Lease expired on the last attempt")
+
+
+@pytest.mark.asyncio
+async def test_export_data_version_changes_when_a_change_commits(mock_db_pool):
+    writer_conn, reader_conn = mock_db_pool.getconn(), mock_db_pool.getconn()
+    reader_conn.autocommit = True
+    try:
+        with writer_conn.cursor() as cursor:
+            question_id, _ = await create_sweep_grid("Data versions", cursor)
+        writer_conn.commit()
+        with reader_conn.cursor() as cursor:
+            before = await get_export_data_versions(cursor=cursor)
+
+        with writer_conn.cursor() as cursor:
+            cursor.execute(
+                "UPDATE prod_storage.questions SET text = text WHERE id = %s;", (-1,)
+            )
+            cursor.execute(
+                "UPDATE prod_storage.questions SET text = 'Edited' WHERE id = %s;", (question_id,)
+            )
+        with reader_conn.cursor() as cursor:
+            assert await get_export_data_versions(cursor=cursor) == before  # Not committed
+
+        writer_conn.commit()
+        with reader_conn.cursor() as cursor:
+            after = await get_export_data_versions(cursor=cursor)
+        assert after["questions"] == before["questions"] + 1  # The empty update did not count
+        assert after["models"] == before["models"]
+    finally:
+        writer_conn.rollback()
+        with writer_conn.cursor() as cursor:
+            cursor.execute("DELETE FROM prod_storage.questions WHERE name = 'Data versions';")
+            cursor.execute("DELETE FROM prod_storage.models WHERE base_model_name = 'Data versions';")
+        writer_conn.commit()
+        reader_conn.autocommit = False
+        mock_db_pool.putconn(writer_conn)
+        mock_db_pool.putconn(reader_conn)
@@ -0,0 +1,147 @@
+# tests/test_jobs.py
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from src.database.pool import ConnectionPoolManager
+from src.exceptions import QuestionNotFoundException
+from src.jobs import worker
+from src.jobs.worker import InferenceWorker, get_retry_delay
+from src.models.clients import OpenAIClientRegistry
+from src.models.cache import CompletionCache
+from src.schemas import InferenceJob
+from src.config import settings
+
+
+JOB = InferenceJob(
+    id=7, question_id=2, model_id=1, temperature=0.5, attempts=1, max_attempts=3
+)
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    pool = MagicMock()
+    pool.getconn.side_effect = lambda: MagicMock()
+    monkeypatch.setattr(ConnectionPoolManager, "_pool", pool)
+    return pool
+
+
+@pytest.fixture
+def fake_queue(monkeypatch):
+    queue = MagicMock(
+        claim=AsyncMock(return_value=JOB),
+        renew=AsyncMock(return_value=True),
+        fail_expired=AsyncMock(return_value=0),
+        complete=AsyncMock(return_value=True),
+        fail=AsyncMock(return_value=True),
+    )
+    monkeypatch.setattr(worker, "claim_inference_job", queue.claim)
+    monkeypatch.setattr(worker, "renew_inference_job", queue.renew)
+    monkeypatch.setattr(worker, "fail_expired_inference_jobs", queue.fail_expired)
+    monkeypatch.setattr(worker, "complete_inference_job", queue.complete)
+    monkeypatch.setattr(worker, "fail_inference_job", queue.fail)
+    return queue
+
+
+def test_retry_delay_grows_and_is_capped():
+    assert get_retry_delay(attempts=1) <= settings.jobs.backoff_base
+    assert get_retry_delay(attempts=100) <= settings.jobs.backoff_max
+    assert get_retry_delay(attempts=100) >= settings.jobs.backoff_max / 2
+
+
+@pytest.mark.asyncio
+async def test_failed_generation_is_retried(fake_pool, fake_queue, monkeypatch):
+    monkeypatch.setattr(worker, "load_inference_context", AsyncMock())
+    monkeypatch.setattr(
+        worker, "generate_inference", AsyncMock(side_effect=TimeoutError("timed out"))
+    )
+    monkeypatch.setattr(OpenAIClientRegistry, "build_client", MagicMock())
+
+    assert await InferenceWorker(name="test").process_next()
+
+    fake_queue.complete.assert_not_called()
+    kwargs = fake_queue.fail.call_args.kwargs
+    assert kwargs["job_id"] == JOB.id
+    assert kwargs["retry_delay"] is not None
+    assert kwargs["error"] == "timed out"
+
+
+@pytest.mark.asyncio
+async def test_missing_question_fails_without_retry(fake_pool, fake_queue, monkeypatch):
+    monkeypatch.setattr(
+        worker,
+        "load_inference_context",
+        AsyncMock(side_effect=QuestionNotFoundException()),
+    )
+
+    assert await InferenceWorker(name="test").process_next()
+
+    assert fake_queue.fail.call_args.kwargs["retry_delay"] is None
+
+
+@pytest.mark.asyncio
+async def test_empty_queue(fake_pool, fake_queue):
+    fake_queue.claim.return_value = None
+    assert not await InferenceWorker(name="test").process_next()
+
+
+@pytest.mark.asyncio
+async def test_sampling_job_bypasses_completion_cache(fake_pool, fake_queue, monkeypatch):
+    fake_queue.claim.return_value = JOB.model_copy(update={"bypass_cache": True})
+    monkeypatch.setattr(settings.openai, "completion_cache", True)
+    monkeypatch.setattr(CompletionCache, "get", AsyncMock())
+    monkeypatch.setattr(CompletionCache, "put", AsyncMock())
+    monkeypatch.setattr(worker, "load_inference_context", AsyncMock())
+    monkeypatch.setattr(worker, "persist_inference", AsyncMock(return_value=11))
+    monkeypatch.setattr(
+        worker, "generate_inference", AsyncMock(return_value=MagicMock(cached=False))
+    )
+    monkeypatch.setattr(OpenAIClientRegistry, "build_client", MagicMock())
+
+    assert await InferenceWorker(name="test").process_next()
+
+    CompletionCache.get.assert_not_called()
+    worker.generate_inference.assert_awaited_once()
+    assert fake_queue.complete.call_args.kwargs["inference_id"] == 11
+
+
+@pytest.mark.asyncio
+async def test_lease_is_renewed_while_generating(fake_pool, fake_queue, monkeypatch):
+    monkeypatch.setattr(settings.jobs, "lease", 0.03)
+
+    async def generate(**kwargs):
+        await asyncio.sleep(0.05)
+        return MagicMock(cached=False)
+
+    monkeypatch.setattr(worker, "load_inference_context", AsyncMock())
+    monkeypatch.setattr(worker, "persist_inference", AsyncMock(return_value=11))
+    monkeypatch.setattr(worker, "generate_inference", generate)
+    monkeypatch.setattr(OpenAIClientRegistry, "build_client", MagicMock())
+
+    assert await InferenceWorker(name="test").process_next()
+
+    assert fake_queue.renew.await_count >= 2
+    assert fake_queue.renew.call_args.kwargs["attempts"] == JOB.attempts
+    assert fake_queue.complete.call_args.kwargs["attempts"] == JOB.attempts
+
+
+@pytest.mark.asyncio
+async def test_result_of_lost_lease_is_rolled_back(fake_pool, fake_queue, monkeypatch):
+    fake_queue.complete.return_value = False  # Claimed again by another worker
+
+    async def persist_inference(context, model_response, cursor):
+        cursor.execute("INSERT ...")
+        return 11
+
+    monkeypatch.setattr(worker, "load_inference_context", AsyncMock())
+    monkeypatch.setattr(worker, "persist_inference", persist_inference)
+    monkeypatch.setattr(
+        worker, "generate_inference", AsyncMock(return_value=MagicMock(cached=False))
+    )
+    monkeypatch.setattr(OpenAIClientRegistry, "build_client", MagicMock())
+
+    assert await InferenceWorker(name="test").process_next()
+
+    fake_queue.fail.assert_not_called()
+    conn = fake_pool.putconn.call_args.args[0]
+    conn.rollback.assert_called_once()
+    conn.commit.assert_not_called()
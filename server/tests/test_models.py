@@ -0,0 +1,578 @@
+# tests/test_models.py
+import io
+import json
+import asyncio
+from contextlib import asynccontextmanager
+import zipfile
+import datetime
+import pytest
+import httpx
+import openai
+from openai.types import CompletionUsage
+from unittest.mock import AsyncMock, MagicMock
+from src.database.pool import ConnectionPoolManager, LazyCursor
+from src.models import core
+from src.models.streaming import ThinkTagSplitter
+from src.models.cache import CompletionCache
+from src.models.clients import OpenAIClientRegistry
+from src.models.prompts import PromptBuilder, PromptRegistry, construct_messages
+from src.models.routing import ModelRouter
+from src.models.batch import make_custom_id, parse_custom_id, parse_batch_result
+from src.models.snapshots import ExportSnapshots
+from src.models.preferences import PreferenceShards, assign_split, make_preference_record
+from src.models.page_cache import PageCache
+from src.session.storage import SessionStorage
+from src.database.export import BufferSink
+from src.models.limits import (
+    AdaptiveConcurrency,
+    RateLimiter,
+    get_retry_after,
+    parse_duration,
+)
+from src.schemas import (
+    GetModelResponse,
+    GetQuestionResponse,
+    PostInferenceRequest,
+    InferenceContext,
+    LLModelResponse,
+    ReasoningLLModelResponse,
+    Prompt,
+    PromptTemplate,
+)
+from src.config import settings
+from src.exceptions import InvalidExportCursorException
+
+
+def raw_response(content, headers=None):
+    completion = MagicMock(choices=[MagicMock(message=MagicMock(content=content))])
+    return MagicMock(headers=headers or {}, parse=MagicMock(return_value=completion))
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    pool = MagicMock()
+    pool.getconn.side_effect = lambda: MagicMock()
+    monkeypatch.setattr(ConnectionPoolManager, "_pool", pool)
+    return pool
+
+
+@pytest.fixture
+def fake_crud(monkeypatch):
+    model = GetModelResponse(id=1, base_model_name="test", model_name="test-model", version=0)
+    question = GetQuestionResponse(id=2, name="Q", type="cloze", text="What is 2+2?")
+
+    def querying(return_value):
+        async def crud(cursor, **kwargs):
+            cursor.execute("SELECT 1;")
+            return return_value
+
+        return AsyncMock(side_effect=crud)
+
+    monkeypatch.setattr(core, "get_model", querying(model))
+    monkeypatch.setattr(core, "get_question_admin", querying(question))
+    prompt = Prompt(
+        id=3,
+        question_hash=PromptRegistry.get_question_hash(question),
+        template_version=1,
+        messages=construct_messages(question=question),
+    )
+    monkeypatch.setattr(PromptRegistry, "get_prompt", querying(prompt))
+    create_inference = querying(10)
+    monkeypatch.setattr(core, "create_inference", create_inference)
+    return create_inference
+
+
+@pytest.mark.asyncio
+async def test_make_inference_releases_connection_during_generation(fake_pool, fake_crud):
+    cursor = LazyCursor()
+    held_during_call = []
+
+    async def create(**kwargs):
+        held_during_call.append(cursor.acquired)
+        return raw_response("<think>Reasoning</think>Answer")
+
+    client = MagicMock()
+    client.chat.completions.with_raw_response.create = create
+
+    inference_id, model_response = await core.make_inference(
+        client=client, model_id=1, question_id=2, cursor=cursor, temperature=0.5
+    )
+
+    assert inference_id == 10
+    assert held_during_call == [False]
+    assert not cursor.acquired
+    assert fake_pool.putconn.call_count == 2  # load and persist transactions
+    inference = fake_crud.call_args.kwargs["inference"]
+    assert inference.response == "Answer"
+    assert inference.reasoning == "Reasoning"
+
+
+@pytest.mark.asyncio
+async def test_make_inferences_reports_each_item(fake_pool, fake_crud, monkeypatch):
+    question = GetQuestionResponse(id=2, name="Q", type="cloze", text="What is 2+2?")
+
+    async def get_question_admin(id, cursor):
+        cursor.execute("SELECT 1;")
+        return question if id == 2 else None
+
+    monkeypatch.setattr(core, "get_question_admin", get_question_admin)
+    client = MagicMock()
+    client.chat.completions.with_raw_response.create = AsyncMock(
+        return_value=raw_response("Answer")
+    )
+
+    results = await core.make_inferences(
+        client=client,
+        inference_requests=[
+            PostInferenceRequest(question_id=2, model_id=1),
+            PostInferenceRequest(question_id=99, model_id=1),
+        ],
+    )
+
+    assert results[0].inference_id == 10 and results[0].error is None
+    assert results[1].inference_id is None and "99" in results[1].error
+    assert ConnectionPoolManager.get_stats().in_use == 0
+
+
+@pytest.mark.asyncio
+async def test_make_inference_cache_hit_skips_generation(fake_pool, fake_crud, monkeypatch):
+    monkeypatch.setattr(settings.openai, "completion_cache", True)
+    cached = LLModelResponse(response="Cached", temperature=0.5, cached=True)
+    monkeypatch.setattr(CompletionCache, "get", AsyncMock(return_value=cached))
+    put = AsyncMock()
+    monkeypatch.setattr(CompletionCache, "put", put)
+    client = MagicMock()
+    client.chat.completions.with_raw_response.create = AsyncMock(
+        return_value=raw_response("Fresh")
+    )
+
+    inference_id, model_response = await core.make_inference(
+        client=client, model_id=1, question_id=2, cursor=LazyCursor(), temperature=0.5
+    )
+
+    assert inference_id == 10
+    assert model_response.cached
+    client.chat.completions.with_raw_response.create.assert_not_called()
+    put.assert_not_called()
+
+    await core.make_inference(
+        client=client, model_id=1, question_id=2, cursor=LazyCursor(), bypass_cache=True
+    )
+    client.chat.completions.with_raw_response.create.assert_called_once()
+    put.assert_called_once()
+
+
+def test_completion_cache_key_depends_on_temperature():
+    context = InferenceContext(
+        model=GetModelResponse(id=1, base_model_name="test", model_name="test-model", version=0),
+        question=GetQuestionResponse(id=2, name="Q", type="cloze", text="What is 2+2?"),
+        messages=[{"role": "user", "content": "What is 2+2?"}],
+    )
+    key = CompletionCache.get_key(context=context, temperature=0.5)
+    assert key == CompletionCache.get_key(context=context, temperature=0.5)
+    assert key != CompletionCache.get_key(context=context, temperature=0.7)
+
+
+def test_think_tag_splitter_handles_tags_split_between_chunks():
+    splitter = ThinkTagSplitter()
+    parts = []
+    for chunk in ["<thi", "nk>Reas", "oning</th", "ink>Ans", "wer <", "b>"]:
+        parts += splitter.feed(chunk)
+    result = splitter.finish(temperature=0.5)
+
+    assert "".join(text for part, text in parts if part == "reasoning") == "Reasoning"
+    assert result.reasoning == "Reasoning"
+    assert result.response == "Answer <b>"
+
+
+def test_think_tag_splitter_without_think_block_matches_plain_response():
+    splitter = ThinkTagSplitter()
+    splitter.feed(" Plain <think")
+    splitter.feed(" answer ")
+    result = splitter.finish(temperature=0.5)
+
+    assert not hasattr(result, "reasoning")
+    assert result.response == "Plain <think answer"
+
+
+@pytest.mark.asyncio
+async def test_client_registry_reuses_and_evicts_idle_clients(monkeypatch):
+    monkeypatch.setattr(OpenAIClientRegistry, "_clients", {})
+    monkeypatch.setattr(
+        OpenAIClientRegistry, "build_client", MagicMock(side_effect=lambda **_: AsyncMock())
+    )
+
+    async with OpenAIClientRegistry.use(base_url="http://a/", api_key="k1") as first:
+        async with OpenAIClientRegistry.use(base_url="http://a/", api_key="k1") as second:
+            assert first is second
+        monkeypatch.setattr(settings.openai, "client_idle_ttl", -1)
+        assert await OpenAIClientRegistry.evict_idle() == 0  # Still borrowed
+    async with OpenAIClientRegistry.use(base_url="http://a/", api_key="k2") as other:
+        assert other is not first
+
+    assert await OpenAIClientRegistry.evict_idle() == 2
+    first.close.assert_awaited_once()
+
+
+def test_parse_rate_limit_headers():
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("20ms") == 0.02
+    assert parse_duration("1.5") == 1.5
+    assert get_retry_after({"retry-after": "3"}) == 3
+    assert get_retry_after({"retry-after-ms": "250"}) == 0.25
+
+
+@pytest.mark.asyncio
+async def test_get_completion_retries_rate_limited_calls(monkeypatch):
+    monkeypatch.setattr(settings.openai, "retry_backoff_base", 0.01)
+    monkeypatch.setattr(RateLimiter, "_limiters", {})
+    request = httpx.Request("POST", "http://test/chat/completions")
+    rate_limited = openai.RateLimitError(
+        "Too many requests",
+        response=httpx.Response(429, headers={"retry-after": "0"}, request=request),
+        body=None,
+    )
+    client = MagicMock(base_url="http://test/")
+    client.chat.completions.with_raw_response.create = AsyncMock(
+        side_effect=[rate_limited, raw_response("Answer")]
+    )
+
+    completion, latency_ms = await core.get_completion(
+        client=client, model="test-model", messages=[]
+    )
+
+    assert completion.choices[0].message.content == "Answer"
+    assert latency_ms >= 0
+    assert client.chat.completions.with_raw_response.create.await_count == 2
+    limiter = RateLimiter.get(base_url="http://test/", model_name="test-model")
+    assert limiter.concurrency.limit < limiter.concurrency.max_limit
+
+
+def test_adaptive_concurrency_backs_off_and_recovers():
+    concurrency = AdaptiveConcurrency(max_limit=8)
+    concurrency.on_throttle()
+    concurrency.on_throttle()  # Same burst: counted once
+    assert concurrency.limit == 4
+    for _ in range(100):
+        concurrency.on_success()
+    assert concurrency.limit == 8
+
+
+def test_completion_usage_includes_reasoning_tokens():
+    completion = MagicMock(
+        choices=[MagicMock(message=MagicMock(content="<think>Reasoning</think>Answer"))],
+        usage=CompletionUsage(
+            prompt_tokens=10,
+            completion_tokens=30,
+            total_tokens=40,
+            completion_tokens_details={"reasoning_tokens": 20},
+        ),
+    )
+    model_response = ReasoningLLModelResponse.from_completion(
+        completion=completion, temperature=0.5
+    )
+    assert model_response.prompt_tokens == 10
+    assert model_response.completion_tokens == 30
+    assert model_response.reasoning_tokens == 20
+
+
+def test_question_hash_ignores_fields_not_in_prompt():
+    question = GetQuestionResponse(id=2, name="Q", type="cloze", text="What is 2+2?")
+    renamed = question.model_copy(update={"id": 5, "name": "Other", "inference_ids": [1]})
+    edited = question.model_copy(update={"text": "What is 3+3?"})
+
+    assert PromptRegistry.get_question_hash(renamed) == PromptRegistry.get_question_hash(question)
+    assert PromptRegistry.get_question_hash(edited) != PromptRegistry.get_question_hash(question)
+
+
+def test_prompt_builder_uses_given_template():
+    question = GetQuestionResponse(id=2, name="Q", type="cloze", text="What is 2+2?")
+    template = PromptBuilder.default_template.model_copy(
+        update={"system_prompt": "System", "other": "Task: {task_text}"}
+    )
+
+    messages = construct_messages(question=question, template=template)
+
+    assert messages == [
+        {"role": "system", "content": "System"},
+        {"role": "user", "content": "Task: What is 2+2?"},
+    ]
+    assert construct_messages(question=question)[0]["content"] != "System"
+
+
+def test_prompt_template_rejects_unknown_placeholders():
+    with pytest.raises(ValueError):
+        PromptTemplate(system_prompt="", multichoice="{answers}", coderunner="", other="")
+
+
+def test_router_prefers_idle_and_fast_endpoints():
+    router = ModelRouter(model_name="m", base_urls=["http://a/", "http://b/"])
+    first, second = router.endpoints
+    first.latency, second.latency = 10, 30
+    assert router.choose() is first
+
+    first.in_flight = 3  # 4 x 10 > 1 x 30
+    assert router.choose() is second
+    assert router.choose(exclude=second) is first
+
+
+def test_router_ejects_failing_endpoint_until_probe():
+    router = ModelRouter(model_name="m", base_urls=["http://a/", "http://b/"])
+    first, second = router.endpoints
+    for _ in range(settings.openai.endpoint_max_failures):
+        router.on_failure(endpoint=first, error=Exception("down"))
+
+    assert not first.healthy
+    assert all(router.choose() is second for _ in range(10))
+
+    router.reinstate(endpoint=first)
+    assert first.healthy and first.consecutive_failures == 0
+
+
+@pytest.mark.asyncio
+async def test_get_completion_fails_over_to_another_endpoint(monkeypatch):
+    monkeypatch.setattr(settings.openai, "retry_backoff_base", 0.01)
+    monkeypatch.setattr(settings.openai, "model_endpoints", {"test-model": ["http://a/", "http://b/"]})
+    monkeypatch.setattr(ModelRouter, "_routers", {})
+    monkeypatch.setattr(OpenAIClientRegistry, "_clients", {})
+    clients = {}
+
+    def build_client(base_url, api_key):
+        clients[base_url] = MagicMock(base_url=base_url)
+        if base_url == "http://a/":
+            error = openai.APIConnectionError(request=httpx.Request("POST", base_url))
+            clients[base_url].chat.completions.with_raw_response.create = AsyncMock(
+                side_effect=error
+            )
+        else:
+            clients[base_url].chat.completions.with_raw_response.create = AsyncMock(
+                return_value=raw_response("Answer")
+            )
+        return clients[base_url]
+
+    monkeypatch.setattr(OpenAIClientRegistry, "build_client", MagicMock(side_effect=build_client))
+    router = ModelRouter.get(model_name="test-model")
+    router.endpoints[1].in_flight = 1  # First attempt goes to the failing endpoint
+
+    completion, _ = await core.get_completion(
+        client=MagicMock(api_key="key"), model="test-model", messages=[]
+    )
+
+    assert completion.choices[0].message.content == "Answer"
+    assert router.endpoints[0].consecutive_failures == 1
+    OpenAIClientRegistry.build_client.assert_any_call(base_url="http://b/", api_key="key")
+
+
+def test_batch_custom_id_round_trip():
+    custom_id = make_custom_id(question_id=2, model_id=1, temperature=0.6, prompt_id=3)
+    assert parse_custom_id(custom_id) == (2, 1, 0.6, 3)
+    with pytest.raises(ValueError):
+        parse_custom_id("q2-m1-t1.5-p3")
+
+
+def test_batch_result_splits_reasoning():
+    body = {
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "test-model",
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": "<think>Hmm</think> Answer"},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+    }
+    line = json.dumps(
+        {"custom_id": "q2-m1-t0.6-p3", "response": {"status_code": 200, "body": body}}
+    )
+
+    assert parse_batch_result(line) == (2, 1, "Hmm", "Answer", 0.6, 10, 5, None, 3, "chatcmpl-1")
+
+    failed = json.dumps({"custom_id": "q2-m1-t0.6-p3", "error": {"message": "Expired"}})
+    with pytest.raises(ValueError, match="Expired"):
+        parse_batch_result(failed)
+
+
+
+def test_export_cursor_round_trip():
+    until = datetime.datetime(2025, 5, 1, 12, 30, 15, 123456)
+    assert core.parse_export_cursor(core.make_export_cursor(until=until)) == until
+    with pytest.raises(InvalidExportCursorException):
+        core.parse_export_cursor("not-a-cursor")
+
+
+def test_export_snapshot_is_saved_once_complete(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings.exports, "export_snapshot_dir", str(tmp_path))
+    monkeypatch.setattr(settings.exports, "export_accel_redirect", None)
+    etag = '"abc"'
+    headers = {"Content-Disposition": "attachment; filename=report.csv"}
+
+    def chunks():
+        yield b"a,b\n"
+        yield b"1,2\n"
+
+    partial = ExportSnapshots.save(
+        chunks=chunks(), kind="report", format="csv", etag=etag, headers={"X-Export-Cursor": "c"}
+    )
+    next(partial)
+    partial.close()  # Client disconnected
+    assert ExportSnapshots.get_response(
+        kind="report", format="csv", etag=etag, if_none_match=None, headers=headers
+    ) is None
+    assert list(tmp_path.iterdir()) == []
+
+    saved = ExportSnapshots.save(
+        chunks=chunks(), kind="report", format="csv", etag=etag, headers={"X-Export-Cursor": "c"}
+    )
+    assert b"".join(saved) == b"a,b\n1,2\n"
+    response = ExportSnapshots.get_response(
+        kind="report", format="csv", etag=etag, if_none_match=None, headers=headers
+    )
+    assert response.path == ExportSnapshots.get_path(kind="report", format="csv", etag=etag)
+    assert response.headers["ETag"] == etag
+    assert response.headers["X-Export-Cursor"] == "c"
+
+    not_modified = ExportSnapshots.get_response(
+        kind="report", format="csv", etag=etag, if_none_match='W/"old", "abc"', headers=headers
+    )
+    assert not_modified.status_code == 304
+
+
+def test_preference_split_is_stable_and_grows_monotonically():
+    small = {id: assign_split(question_id=id, validation_ratio=0.1) for id in range(1000)}
+    large = {id: assign_split(question_id=id, validation_ratio=0.3) for id in range(1000)}
+    assert small == {id: assign_split(question_id=id, validation_ratio=0.1) for id in range(1000)}
+    assert 50 < list(small.values()).count("validation") < 150
+    assert all(large[id] == "validation" for id, split in small.items() if split == "validation")
+
+
+def test_preference_record_pairs_best_and_worst():
+    responses = [
+        {"content": "Good", "score": 4.5},
+        {"content": "Fine", "score": 3.0},
+        {"content": "Bad", "score": 2.0},
+    ]
+    record = make_preference_record(
+        question_id=1, prompt_id=2, messages=[], responses=responses, split="train", min_margin=1
+    )
+    assert record["chosen"] == [{"role": "assistant", "content": "Good"}]
+    assert record["rejected"] == [{"role": "assistant", "content": "Bad"}]
+    assert (record["score_chosen"], record["score_rejected"]) == (4.5, 2.0)
+
+    record = make_preference_record(
+        question_id=1, prompt_id=2, messages=[], responses=responses, split="train", min_margin=3
+    )
+    assert record["chosen"] is None and record["rejected"] is None
+
+
+def test_preference_shards_are_size_capped():
+    sink = BufferSink()
+    shards = PreferenceShards(sink=sink, max_bytes=10, manifest={})
+    for split, line in [("train", b"1234567\n"), ("train", b"12\n"), ("train", b"1\n")]:
+        shards.write(split=split, line=line)
+    shards.write(split="validation", line=b"12345678901234\n")  # Larger than a shard
+    shards.close()
+
+    archive = zipfile.ZipFile(io.BytesIO(sink.take()))
+    assert archive.read("train-00000.jsonl") == b"1234567\n"
+    assert archive.read("train-00001.jsonl") == b"12\n1\n"
+    assert archive.read("validation-00000.jsonl") == b"12345678901234\n"
+    manifest = json.loads(archive.read("manifest.json"))
+    assert [shard["records"] for shard in manifest["splits"]["train"]] == [1, 2]
+
+
+class FakePageRedis:
+    def __init__(self):
+        self.version = 0
+        self.pages = {}
+
+    async def get_page_cache_version(self):
+        return self.version
+
+    async def incr_page_cache_version(self):
+        self.version += 1
+        return self.version
+
+    async def get_page(self, key):
+        return self.pages.get(key)
+
+    async def set_page(self, key, html):
+        self.pages[key] = html
+
+
+@pytest.fixture
+def page_cache(monkeypatch):
+    redis = FakePageRedis()
+
+    @asynccontextmanager
+    async def get_connection():
+        yield redis
+
+    monkeypatch.setattr(SessionStorage, "get_connection", get_connection)
+    monkeypatch.setattr(PageCache, "_entries", type(PageCache._entries)())
+    monkeypatch.setattr(PageCache, "_rendering", {})
+    for counter in ("_hits", "_redis_hits", "_renders", "_bypassed", "_invalidations"):
+        monkeypatch.setattr(PageCache, counter, 0)
+    return redis
+
+
+@pytest.mark.asyncio
+async def test_page_cache_renders_once_for_concurrent_views(page_cache):
+    renders = []
+
+    async def render():
+        renders.append(1)
+        await asyncio.sleep(0.01)
+        return f"<html>{len(renders)}</html>"
+
+    async def view():
+        return await PageCache.get_or_render(
+            render=render,
+            base_url="http://test/",
+            template="question_detail.html",
+            user_group_cd="group",
+            lang="ru",
+            ids=(1,),
+        )
+
+    pages = await asyncio.gather(*(view() for _ in range(200)))
+    assert len(renders) == 1
+    assert set(pages) == {"<html>1</html>"}
+
+    await PageCache.invalidate()
+    assert await view() == "<html>2</html>"
+
+    stats = await PageCache.get_stats()
+    assert (stats.renders, stats.hits, stats.invalidations) == (2, 199, 1)
+    assert stats.version == 1 and stats.entries == 1
+
+
+@pytest.mark.asyncio
+async def test_page_cache_shares_pages_through_redis(page_cache, monkeypatch):
+    monkeypatch.setattr(settings.frontend, "page_cache_redis", True)
+    render = AsyncMock(return_value="<html></html>")
+    key = dict(base_url="http://test/", template="question_list.html", user_group_cd="group")
+
+    await PageCache.get_or_render(render=render, lang="ru", **key)
+    PageCache._entries.clear()  # Another worker
+    await PageCache.get_or_render(render=render, lang="ru", **key)
+    await PageCache.get_or_render(render=render, lang="en", **key)
+
+    assert render.await_count == 2
+    assert (await PageCache.get_stats()).redis_hits == 1
+
+
+@pytest.mark.asyncio
+async def test_page_cache_does_not_keep_failed_renders(page_cache):
+    render = AsyncMock(side_effect=[RuntimeError("database is down"), "<html></html>"])
+    key = dict(
+        base_url="http://test/", template="question_list.html", user_group_cd="group", lang="ru"
+    )
+
+    with pytest.raises(RuntimeError):
+        await PageCache.get_or_render(render=render, **key)
+    assert await PageCache.get_or_render(render=render, **key) == "<html></html>"
+    assert not PageCache._rendering
@@ -0,0 +1,269 @@
+# tests/test_pool.py
+import asyncio
+import gzip
+import io
+import pytest
+from starlette.requests import Request
+import pyarrow as pa
+import pyarrow.parquet as pq
+from unittest.mock import AsyncMock, MagicMock
+from src.database.pool import ConnectionPoolManager, LazyCursor
+from src.database.export import stream_copy, stream_arrow, compress_stream
+from src.constraints import EXPORT_COPY_CHUNK_BYTES
+from src.exceptions import ClientDisconnectedException
+from src.config import PostgresSettings, settings
+from src.api.utils import cancel_on_disconnect
+from src.api.deps import get_upload_db_cursor
+from src.session.storage import RedisConnection
+from src.utils import negotiate_encoding
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    pool = MagicMock()
+    pool.getconn.side_effect = lambda: MagicMock()
+    monkeypatch.setattr(ConnectionPoolManager, "_pool", pool)
+    return pool
+
+
+def test_lazy_cursor_acquires_on_first_execute(fake_pool):
+    with LazyCursor() as cursor:
+        assert not cursor.acquired
+        fake_pool.getconn.assert_not_called()
+
+        cursor.execute("SELECT 1;")
+        assert cursor.acquired
+        fake_pool.getconn.assert_called_once()
+
+    fake_pool.putconn.assert_called_once()
+    conn = fake_pool.putconn.call_args.args[0]
+    conn.commit.assert_called_once()
+
+
+def test_lazy_cursor_without_queries_never_acquires(fake_pool):
+    with LazyCursor():
+        pass
+    fake_pool.getconn.assert_not_called()
+    fake_pool.putconn.assert_not_called()
+
+
+def test_lazy_cursor_transaction_releases_early(fake_pool):
+    cursor = LazyCursor()
+    with cursor.transaction():
+        cursor.execute("SELECT 1;")
+    assert not cursor.acquired
+    fake_pool.putconn.assert_called_once()
+
+    with cursor.transaction():
+        cursor.execute("SELECT 2;")
+    assert fake_pool.getconn.call_count == 2
+    assert fake_pool.putconn.call_count == 2
+
+
+def test_lazy_cursor_transaction_rolls_back_on_error(fake_pool):
+    cursor = LazyCursor()
+    with pytest.raises(ValueError):
+        with cursor.transaction():
+            cursor.execute("SELECT 1;")
+            raise ValueError("boom")
+
+    conn = fake_pool.putconn.call_args.args[0]
+    conn.rollback.assert_called_once()
+    conn.commit.assert_not_called()
+    assert not cursor.acquired
+
+
+def test_lazy_cursor_applies_statement_timeout(fake_pool):
+    with LazyCursor(statement_timeout=1500) as cursor:
+        cursor.execute("SELECT 1;")
+        conn = cursor._connection
+        set_config = conn.cursor.return_value.__enter__.return_value
+        set_config.execute.assert_called_once_with(
+            "SELECT set_config('statement_timeout', %s, true);", ("1500",)
+        )
+
+
+def test_lazy_cursor_cancel_refuses_further_queries(fake_pool):
+    cursor = LazyCursor()
+    cursor.execute("SELECT 1;")
+    conn = cursor._connection
+    cursor.cancel()
+    conn.cancel.assert_called_once()
+
+    with pytest.raises(ClientDisconnectedException):
+        cursor.execute("SELECT 2;")
+    cursor.release(commit=False)
+
+
+def test_worker_share_of_global_budget():
+    postgres = PostgresSettings(maxconn=20, minconn=10, pool_global_maxconn=30, web_concurrency=4)
+    assert postgres.worker_maxconn == 7
+    assert postgres.worker_minconn == 7
+
+    postgres = PostgresSettings(maxconn=20, pool_global_maxconn=None, web_concurrency=4)
+    assert postgres.worker_maxconn == 20
+
+
+def test_pool_stats_track_usage(fake_pool):
+    before = ConnectionPoolManager.get_stats().in_use
+    cursor = LazyCursor()
+    cursor.execute("SELECT 1;")
+    assert ConnectionPoolManager.get_stats().in_use == before + 1
+    cursor.release()
+    assert ConnectionPoolManager.get_stats().in_use == before
+
+
+def test_stream_copy_joins_rows_into_chunks(fake_pool):
+    row = b"x" * 1000 + b"\n"
+
+    def copy(cursor, file):
+        cursor.execute("SELECT 1;")
+        for _ in range(100):
+            file.write(row)
+
+    chunks = list(stream_copy(copy=copy))
+
+    assert b"".join(chunks) == row * 100
+    assert len(chunks[0]) >= EXPORT_COPY_CHUNK_BYTES
+    conn = fake_pool.putconn.call_args.args[0]
+    conn.rollback.assert_called_once()
+
+
+def test_stream_copy_cancels_query_when_closed_early(fake_pool):
+    def copy(cursor, file):
+        cursor.execute("SELECT 1;")
+        while not cursor.cancelled:  # Endless COPY, stopped by cancel()
+            file.write(b"x" * EXPORT_COPY_CHUNK_BYTES)
+
+    stream = stream_copy(copy=copy)
+    next(stream)
+    stream.close()
+
+    conn = fake_pool.putconn.call_args.args[0]
+    conn.cancel.assert_called_once()
+
+
+def test_stream_arrow_writes_typed_row_groups(fake_pool):
+    schema = pa.schema(
+        [("model", pa.dictionary(pa.int32(), pa.string())), ("ok", pa.bool_())]
+    )
+    conn = MagicMock()
+    named_cursor = conn.cursor.return_value.__enter__.return_value
+    named_cursor.fetchmany.side_effect = [[("a", True), ("b", False)], [("a", None)], []]
+    fake_pool.getconn.side_effect = lambda: conn
+
+    data = b"".join(
+        stream_arrow(get_query=lambda cursor: "SELECT 1", schema=schema, format="parquet")
+    )
+
+    table = pq.read_table(io.BytesIO(data))
+    assert table.schema == schema
+    assert table.to_pydict() == {"model": ["a", "b", "a"], "ok": [True, False, None]}
+    assert pq.ParquetFile(io.BytesIO(data)).num_row_groups == 2
+    conn.rollback.assert_called_once()
+
+
+def test_compress_stream_round_trip_and_close():
+    rows = [f"{i},text\n".encode() * 100 for i in range(50)]
+
+    def export():
+        yield from rows
+
+    chunks = export()
+    assert compress_stream(chunks=chunks, codec=None) is chunks
+
+    encoded = b"".join(compress_stream(chunks=export(), codec="gzip"))
+    assert gzip.decompress(encoded) == b"".join(rows)
+    encoded = b"".join(compress_stream(chunks=export(), codec="zstd"))
+    decoded = pa.input_stream(pa.BufferReader(encoded), compression="zstd").read()
+    assert decoded == b"".join(rows)
+
+    compressed = compress_stream(chunks=chunks, codec="zstd")
+    next(compressed)
+    compressed.close()  # Client disconnected
+    assert chunks.gi_frame is None
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding("gzip, deflate, br, zstd") == "zstd"
+    assert negotiate_encoding("zstd;q=0.5, gzip") == "gzip"
+    assert negotiate_encoding("gzip;q=0, *;q=0.1") == "zstd"
+    assert negotiate_encoding("br") is None
+    assert negotiate_encoding(None) is None
+    assert negotiate_encoding("gzip", format="parquet") is None
+
+
+def make_request(messages):
+    queue = asyncio.Queue()
+
+    async def feed():
+        for message in messages:
+            await asyncio.sleep(0.001)
+            await queue.put(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/", "headers": []}
+    return Request(scope, receive=queue.get), feed()
+
+
+@pytest.mark.asyncio
+async def test_disconnect_watch_keeps_streamed_body(monkeypatch):
+    monkeypatch.setattr(settings.postgres, "disconnect_poll_interval", 0)
+    request, feed = make_request(
+        [{"type": "http.request", "body": b"x" * 1000, "more_body": i < 9} for i in range(10)]
+    )
+    feeder = asyncio.create_task(feed)
+    cursor = LazyCursor()
+    async def read_body():
+        return b"".join([chunk async for chunk in request.stream()])
+
+    async with cancel_on_disconnect(request=request, cursor=cursor):
+        await asyncio.sleep(0.005)  # Watcher polls before the route reads
+        body = await asyncio.wait_for(read_body(), timeout=1)
+    await feeder
+
+    assert len(body) == 10000
+    assert not cursor.cancelled
+
+
+@pytest.mark.asyncio
+async def test_disconnect_watch_cancels_cursor(monkeypatch):
+    monkeypatch.setattr(settings.postgres, "disconnect_poll_interval", 0)
+    request, feed = make_request(
+        [{"type": "http.request", "body": b"", "more_body": False}, {"type": "http.disconnect"}]
+    )
+    cursor = LazyCursor()
+    async with cancel_on_disconnect(request=request, cursor=cursor):
+        await feed
+        await asyncio.sleep(0.01)
+        assert cursor.cancelled
+
+
+@pytest.mark.asyncio
+async def test_upload_cursor_leaves_body_to_route(monkeypatch):
+    monkeypatch.setattr(settings.postgres, "disconnect_poll_interval", 0)
+    request, feed = make_request(
+        [{"type": "http.request", "body": b"x" * 1000, "more_body": i < 9} for i in range(10)]
+    )
+    feeder = asyncio.create_task(feed)
+    dependency = get_upload_db_cursor(request=request)
+    cursor = await dependency.__anext__()
+    await asyncio.sleep(0.005)
+    body = b"".join([chunk async for chunk in request.stream()])
+    await dependency.aclose()
+    await feeder
+
+    assert len(body) == 10000
+    assert not cursor.cancelled
+
+
+@pytest.mark.asyncio
+async def test_pool_stats_are_keyed_by_host_and_pid():
+    redis = MagicMock(set=AsyncMock(), delete=AsyncMock())
+    stats = ConnectionPoolManager.get_stats()
+    await RedisConnection(connection=redis).set_pool_stats(stats=stats)
+    await RedisConnection(connection=redis).delete_pool_stats(stats=stats)
+
+    key = f"pool:worker:{stats.host}:{stats.pid}"
+    assert redis.set.await_args.args[0] == key
+    assert redis.set.await_args.kwargs["ex"] == settings.postgres.pool_stats_ex
+    redis.delete.assert_awaited_once_with(key)
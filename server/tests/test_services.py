@@ -0,0 +1,33 @@
+# tests/test_services.py
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from src import services
+from src.database import crud
+from src.exceptions import InferenceNotFoundException, QuestionNotFoundException
+from src.schemas import GetInferenceResponse, GetQuestionResponse
+
+
+@pytest.mark.asyncio
+async def test_question_inference_reads_inference_then_its_question(monkeypatch):
+    inference = GetInferenceResponse(id=10, question_id=2, model_id=1, text="Answer")
+    question = GetQuestionResponse(id=2, name="Q", type="cloze", text="What is 2+2?")
+    get_question = AsyncMock(return_value=question)
+    monkeypatch.setattr(crud, "get_inference", AsyncMock(return_value=inference))
+    monkeypatch.setattr(crud, "get_question", get_question)
+    cursor = MagicMock()
+
+    assert await services.get_question_inference(
+        user_group_cd="group", id=10, cursor=cursor
+    ) == (inference, question)
+    get_question.assert_awaited_once_with(user_group_cd="group", id=2, cursor=cursor)
+
+
+@pytest.mark.asyncio
+async def test_missing_objects_raise_not_found(monkeypatch):
+    monkeypatch.setattr(crud, "get_inference", AsyncMock(return_value=None))
+    monkeypatch.setattr(crud, "get_question", AsyncMock(return_value=None))
+
+    with pytest.raises(InferenceNotFoundException):
+        await services.get_question_inference(user_group_cd="group", id=10, cursor=MagicMock())
+    with pytest.raises(QuestionNotFoundException):
+        await services.get_question(user_group_cd="group", id=2, cursor=MagicMock())